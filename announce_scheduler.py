@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+#
+# announce_scheduler.py
+#
+# A priority queue of announcements in front of the speak functions of
+# espeak.py, espeak_google.py and tts_stream.py.
+#
+# The speak loops of those programs are first in, first out, and block
+# until each message has been spoken. Here each announcement has a class:
+#
+#   alarm     Spoken first. Never expires.
+#   update    Spoken after alarms. Expires after 60 secs in the queue.
+#   chatter   Spoken when nothing else is queued. Expires after 20 secs.
+#
+# One thread speaks the queue, a sentence at a time, through the chosen
+# speak function. Before each sentence it checks for a more urgent
+# announcement. If there is one, the current announcement is preempted:
+# it is put back in the queue to resume at the next sentence, or dropped,
+# according to its policy. The speak functions block, so an alarm waits at
+# most for the end of the sentence being spoken.
+#
+# An announcement with the same text as one still queued is coalesced into
+# it. The queued one takes the more urgent class and the later expiry.
+#
+# stats() gives the queue depth of each class, the number spoken, coalesced,
+# expired, preempted and dropped, and the percentiles of the time from
+# submit() to the start of speaking.
+#
+# Type "<class> <text>" lines, e.g. "alarm Smoke detected in the kitchen":
+# $ python3 announce_scheduler.py --speaker espeak
+# $ python3 announce_scheduler.py --demo --report 5
+#
+import sys, os
+import time
+import json
+import heapq
+import argparse
+import itertools
+import threading
+import collections
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+from tts_stream import segment_text
+
+# Class name -> (rank, seconds before expiry or None, policy if preempted).
+CLASSES = collections.OrderedDict([
+        ("alarm", (0, None, "resume")),
+        ("update", (1, 60, "resume")),
+        ("chatter", (2, 20, "drop")),
+        ])
+WAITS_KEPT = 1000  # Wait times kept for the percentiles, for each class.
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def speakers():
+    'Dictionary of name to speak function, which takes the text.'
+    import espeak
+    import espeak_google
+    import tts_stream
+
+    def switch(text):
+        # As espeak_google.py, Google if the internet is up, else espeak.
+        if espeak_google.internet():
+            espeak_google.speak_google(text)
+        else:
+            espeak_google.speak_espeak(text)
+
+    return {"espeak": espeak.speak,
+            "google": espeak_google.speak_google,
+            "switch": switch,
+            "stream": tts_stream.speak_long}
+
+
+class Announcement(object):
+    'One queued announcement, spoken a segment at a time.'
+
+    def __init__(self, text, kind, expires, policy):
+        self.text = text
+        self.kind = kind
+        self.rank = CLASSES[kind][0]
+        self.expires = expires
+        self.policy = policy
+        self.segments = segment_text(text)
+        self.next = 0  # Index of the next segment to speak.
+        self.submitted = time.time()
+        self.started = None
+        self.queued = True
+
+    def key(self):
+        return " ".join(self.text.lower().split())
+
+
+class Scheduler(object):
+    'Speak announcements in order of class, then of submission.'
+
+    def __init__(self, speak):
+        self.speak = speak
+        self.condition = threading.Condition()
+        self.heap = []  # (rank, sequence, announcement)
+        self.sequence = itertools.count()
+        self.queued = {}  # key -> queued announcement, for coalescing.
+        self.current = None
+        self.waits = {kind: collections.deque(maxlen=WAITS_KEPT)
+                      for kind in CLASSES}
+        self.counts = collections.Counter()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, text, kind="update", ttl=None, policy=None):
+        """
+        Queue the text. ttl and policy default to those of the class.
+        Return the announcement, which is an existing one if coalesced.
+        """
+        rank, default_ttl, default_policy = CLASSES[kind]
+        if ttl is None:
+            ttl = default_ttl
+        expires = time.time() + ttl if ttl is not None else None
+        with self.condition:
+            announcement = Announcement(text, kind, expires,
+                                        policy or default_policy)
+            queued = self.queued.get(announcement.key())
+            if queued is not None:
+                self.counts["coalesced"] += 1
+                if queued.expires is not None:
+                    queued.expires = None if expires is None \
+                            else max(queued.expires, expires)
+                if rank < queued.rank:
+                    # Re-queue at the more urgent rank. The old entry in the
+                    # heap is skipped as its rank no longer matches.
+                    queued.kind = kind
+                    queued.rank = rank
+                    queued.policy = policy or default_policy
+                    self._push(queued)
+                return queued
+            self.queued[announcement.key()] = announcement
+            self._push(announcement)
+            return announcement
+
+    def _push(self, announcement, sequence=None):
+        if sequence is None:
+            sequence = next(self.sequence)
+        announcement.sequence = sequence
+        announcement.queued = True
+        heapq.heappush(self.heap, (announcement.rank, sequence, announcement))
+        self.condition.notify()
+
+    def _peek(self):
+        'The next announcement to speak, or None. Removes stale and expired.'
+        now = time.time()
+        while self.heap:
+            rank, sequence, announcement = self.heap[0]
+            if not announcement.queued or rank != announcement.rank or \
+                    sequence != announcement.sequence:
+                heapq.heappop(self.heap)
+            elif announcement.expires is not None and \
+                    now > announcement.expires:
+                heapq.heappop(self.heap)
+                self._unqueue(announcement)
+                self.counts["expired"] += 1
+            else:
+                return announcement
+        return None
+
+    def _unqueue(self, announcement):
+        announcement.queued = False
+        if self.queued.get(announcement.key()) is announcement:
+            del self.queued[announcement.key()]
+
+    def run(self):
+        while True:
+            with self.condition:
+                announcement = self._peek()
+                while announcement is None:
+                    self.condition.wait()
+                    announcement = self._peek()
+                heapq.heappop(self.heap)
+                self._unqueue(announcement)
+                if announcement.started is None:
+                    announcement.started = time.time()
+                    self.waits[announcement.kind].append(
+                            announcement.started - announcement.submitted)
+                self.current = announcement
+            self.speak_announcement(announcement)
+            with self.condition:
+                self.current = None
+
+    def speak_announcement(self, announcement):
+        'Speak the remaining segments, unless preempted.'
+        while announcement.next < len(announcement.segments):
+            with self.condition:
+                urgent = self._peek()
+                if urgent is not None and urgent.rank < announcement.rank:
+                    self.counts["preempted"] += 1
+                    if announcement.policy == "resume":
+                        # Keep its place ahead of later ones of its class,
+                        # unless the text was submitted again meanwhile.
+                        queued = self.queued.setdefault(announcement.key(),
+                                                        announcement)
+                        if queued is announcement:
+                            self._push(announcement, announcement.sequence)
+                        else:
+                            self.counts["coalesced"] += 1
+                    else:
+                        self.counts["dropped"] += 1
+                    return
+            try:
+                self.speak(announcement.segments[announcement.next])
+            except Exception as error:
+                print("Speak failed: {}".format(error))
+            announcement.next += 1
+        self.counts["spoken"] += 1
+
+    def stats(self):
+        'Queue depths, counts and wait time percentiles, in milli-secs.'
+        with self.condition:
+            depth = collections.Counter(
+                    announcement.kind
+                    for announcement in self.queued.values())
+            result = {"depth": {kind: depth[kind] for kind in CLASSES},
+                      "speaking": self.current.kind if self.current else None,
+                      "counts": dict(self.counts),
+                      "wait_ms": {}}
+            for kind, waits in self.waits.items():
+                if waits:
+                    ordered = sorted(waits)
+                    result["wait_ms"][kind] = {
+                            "p50": round(1000 * percentile(ordered, 0.5)),
+                            "p95": round(1000 * percentile(ordered, 0.95)),
+                            "max": round(1000 * ordered[-1]),
+                            "count": len(ordered)}
+        return result
+
+
+def demo(scheduler):
+    'Chatter and updates, with an alarm arriving part way through.'
+    scheduler.submit("Here is some chatter to fill the time. It goes on for "
+                     "a while. And then a while longer.", "chatter")
+    scheduler.submit("The bus is due in five minutes.", "update")
+    scheduler.submit("The bus is due in five minutes.", "update")
+    scheduler.submit("Rain is expected this afternoon. Take an umbrella.",
+                     "update")
+    time.sleep(3)
+    scheduler.submit("Alarm. Smoke detected in the kitchen.", "alarm")
+
+
+def read_announcements(scheduler):
+    'Submit each line typed, as "<class> <text>" or just "<text>".'
+    for line in sys.stdin:
+        words = line.split(None, 1)
+        if not words:
+            continue
+        if words[0] in CLASSES and len(words) > 1:
+            scheduler.submit(words[1].strip(), words[0])
+        else:
+            scheduler.submit(line.strip())
+
+
+if __name__ == "__main__":
+
+    names = sorted(speakers())
+    parser = argparse.ArgumentParser(
+            description="Speak announcements in order of priority.")
+    parser.add_argument("--speaker", default="espeak", choices=names)
+    parser.add_argument("--demo", action="store_true",
+                        help="Queue some announcements, and an alarm.")
+    parser.add_argument("--report", type=int, default=0,
+                        help="Print the stats every N seconds.")
+    args = parser.parse_args()
+
+    Gst.init(None)
+
+    scheduler = Scheduler(speakers()[args.speaker])
+    if args.demo:
+        threading.Thread(target=demo, args=(scheduler,), daemon=True).start()
+    threading.Thread(target=read_announcements, args=(scheduler,),
+                     daemon=True).start()
+    print("Type <class> <text>, where class is one of {}. Ctrl-C to stop."
+          .format(", ".join(CLASSES)))
+    try:
+        while True:
+            time.sleep(args.report or 1)
+            if args.report:
+                print(json.dumps(scheduler.stats()))
+    except KeyboardInterrupt:
+        print('\n Stopped via Ctrl-C')
+        print(json.dumps(scheduler.stats(), indent=2))
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+#
+# announcer.py
+#
+# Play a radio station and speak announcements over it, ducking the radio,
+# in one pipeline with one audio output.
+#
+# Running espeak.py while radio.py plays opens a second autoaudiosink. The
+# two are not coordinated, and each announcement waits for its own sink to
+# start. Here the station, the announcements and a live silence source are
+# the inputs of one audiomixer:
+#
+#   uridecodebin (station) ! ... ! queue ! mix.sink_0
+#   audiotestsrc is-live=true wave=silence ! mix.sink_1
+#   appsrc (announcements) ! ... ! mix.sink_2
+#   audiomixer name=mix ! audioconvert ! autoaudiosink
+#
+# The silence keeps the mixer running at the audio clock whatever the
+# station does. Each announcement is synthesized into raw PCM, as in
+# tts_stream.py, and pushed into the appsrc with the running time at which
+# it is to start, LEAD_SECS ahead, so it starts on that sample. The volume
+# of the station's mixer pad has a control source. It ramps down to DUCK
+# over RAMP_SECS before the announcement and back up after it, and the mixer
+# applies it sample by sample.
+#
+# Type an announcement and press Enter, or give some on the command line:
+# $ python3 announcer.py --station 3
+# $ python3 announcer.py --uri http://radionz-ice.streamguys.com/concert \
+#     "The time is ten o'clock." "Now back to the music."
+#
+import sys, os
+import threading
+import queue
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstController', '1.0')
+from gi.repository import Gst, GstController, GLib
+
+import tts_stream
+from station_catalogue import StationCatalogue
+
+MIX_CAPS = "audio/x-raw,format=S16LE,rate=48000,channels=2"
+DUCK = 0.2       # Volume of the station during an announcement.
+RAMP_SECS = 0.5  # Time to duck, and to come back up.
+LEAD_SECS = 0.3  # Time from pushing an announcement to it starting.
+GAP_SECS = 0.5   # Time between consecutive announcements.
+
+
+def announcer_description(uri):
+    'The gst-launch text of the mixer, with the station and announcements.'
+    return """
+        audiomixer name=mix
+        ! audioconvert
+        ! autoaudiosink
+        uridecodebin uri="{uri}"
+        ! audioconvert
+        ! audioresample
+        ! {caps}
+        ! queue max-size-time=3000000000
+        ! mix.sink_0
+        audiotestsrc is-live=true wave=silence
+        ! {caps}
+        ! mix.sink_1
+        appsrc name=announcements format=time is-live=true caps="{pcm}"
+        ! audioconvert
+        ! audioresample
+        ! {caps}
+        ! mix.sink_2
+        """.format(uri=uri, caps=MIX_CAPS,
+                   pcm=tts_stream.PCM_CAPS)
+
+
+class Announcer(object):
+    'Synthesize announcements in turn, and duck the station under each one.'
+
+    def __init__(self, pipeline, engine="espeak", voice=tts_stream.VOICE,
+                 language=tts_stream.LANGUAGE):
+        self.pipeline = pipeline
+        self.engine = engine
+        self.voice = voice
+        self.language = language
+        self.appsrc = pipeline.get_by_name("announcements")
+        self.end = 0  # Running time at the end of the last announcement.
+        self.texts = queue.Queue()
+
+        self.volume = GstController.InterpolationControlSource()
+        self.volume.set_property("mode",
+                                 GstController.InterpolationMode.LINEAR)
+        self.volume.set(0, 1.0)
+        station_pad = pipeline.get_by_name("mix").get_static_pad("sink_0")
+        station_pad.add_control_binding(
+                GstController.DirectControlBinding.new_absolute(
+                        station_pad, "volume", self.volume))
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def announce(self, text):
+        'Queue the text. It is spoken after any announcements before it.'
+        self.texts.put(text)
+
+    def running_time(self):
+        clock = self.pipeline.get_clock()
+        if clock is None:
+            return 0
+        return clock.get_time() - self.pipeline.get_base_time()
+
+    def run(self):
+        while True:
+            text = self.texts.get()
+            try:
+                pcm = tts_stream.synthesize(text, self.engine, self.voice,
+                                            self.language)
+            except Exception as error:
+                # Keep the thread, so later announcements are still spoken.
+                print("Announcement failed: {}".format(error))
+                continue
+            self.schedule(pcm)
+
+    def schedule(self, pcm):
+        'Push the PCM to start LEAD_SECS from now, and duck around it.'
+        now = self.running_time()
+        ramp = int(RAMP_SECS * Gst.SECOND)
+        # 16 bit mono samples.
+        duration = Gst.util_uint64_scale(len(pcm) // 2, Gst.SECOND,
+                                         tts_stream.RATE)
+        start = max(now + int(LEAD_SECS * Gst.SECOND),
+                    self.end + int(GAP_SECS * Gst.SECOND))
+
+        if self.end and start - ramp <= self.end + ramp:
+            # Still ducked from the last announcement. Stay down.
+            self.volume.unset(self.end + ramp)
+        else:
+            self.volume.set(start - ramp, 1.0)
+        self.volume.set(start, DUCK)
+        self.volume.set(start + duration, DUCK)
+        self.volume.set(start + duration + ramp, 1.0)
+        self.end = start + duration
+
+        buffer = Gst.Buffer.new_wrapped(pcm)
+        buffer.pts = start
+        buffer.duration = duration
+        self.appsrc.emit("push-buffer", buffer)
+        print("Announcing at {:.3f} secs, for {:.2f} secs".format(
+                start / Gst.SECOND, duration / Gst.SECOND))
+
+
+def read_announcements(announcer):
+    'Announce each line typed.'
+    for line in sys.stdin:
+        if line.strip():
+            announcer.announce(line.strip())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Play a station and speak announcements over it.")
+    parser.add_argument("texts", nargs="*",
+                        help="Announcements, spoken in turn at the start.")
+    parser.add_argument("-s", "--station", type=int, default=1,
+                        help="Number of the station in stations.json.")
+    parser.add_argument("--uri", help="Play this uri instead of a station.")
+    parser.add_argument("--engine", default="espeak",
+                        choices=("espeak", "google"))
+    parser.add_argument("--voice", default=tts_stream.VOICE)
+    parser.add_argument("--language", default=tts_stream.LANGUAGE)
+    args = parser.parse_args()
+
+    uri = args.uri
+    if uri is None:
+        station = StationCatalogue().get(args.station)
+        if station is None:
+            sys.exit("No station {}".format(args.station))
+        print("Station: {}".format(station.name))
+        uri = station.url
+
+    Gst.init(None)
+    pipeline = Gst.parse_launch(announcer_description(uri))
+    announcer = Announcer(pipeline, args.engine, args.voice, args.language)
+    loop = GLib.MainLoop()
+
+    def on_error(bus, message):
+        err, debug = message.parse_error()
+        print("Error: {}:\n{}".format(err, debug))
+        loop.quit()
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message::error", on_error)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    for text in args.texts:
+        announcer.announce(text)
+    threading.Thread(target=read_announcements, args=(announcer,),
+                     daemon=True).start()
+    print("Type an announcement and press Enter. Ctrl-C to stop.")
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print('\n Stopped via Ctrl-C')
+    finally:
+        pipeline.set_state(Gst.State.NULL)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+#
+# camera_benchmark.py
+#
+# Benchmark the camera pipelines without a camera or a display.
+#
+# Each variant is the pipeline text of camera_local.py or camera_browser.py,
+# built with videotestsrc in place of /dev/video0, and fakesink in place of
+# the window or the viewers. It is run for a fixed number of frames and the
+# following are measured with pad probes:
+#
+#   fps         Frames through the pipeline per second. With --live the
+#               source runs at 30 frames/sec, otherwise as fast as it can.
+#   elements    Mean time each element spends on a buffer, from its sink pad
+#               to its src pad. Encoders that hold frames, or run their own
+#               threads, include their wait.
+#   latency     Time from the source to the sink, for each frame whose
+#               timestamp is unchanged by the muxer.
+#
+# The probes add a few microseconds to every buffer, on every pad, so
+# compare results with each other rather than with an unprobed pipeline.
+#
+# $ python3 camera_benchmark.py
+# $ python3 camera_benchmark.py --variants local,browser-mjpeg --frames 600
+# $ python3 camera_benchmark.py --json --output benchmarks.jsonl
+#
+# --output appends one JSON line per variant, so results can be tracked
+# over time.
+#
+import sys, os
+import time
+import json
+import argparse
+import datetime
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+import camera_local
+import camera_browser
+from camera_profiles import PROFILES
+from camera_overlay import attach_overlay
+
+FRAMES = 300
+TIMEOUT = 120
+# Latency is measured to the sink of the window or the viewers, not to a
+# side branch such as the snapshot.
+LATENCY_SINKS = ("sink", "viewers")
+
+
+def variants(source="test"):
+    'Dictionary of variant name to pipeline text.'
+    result = {"local": camera_local.camera_description(
+            source, sink="fakesink name=sink sync=false"),
+              "local-cached": camera_local.camera_description(
+            source, sink="fakesink name=sink sync=false", overlay="cached")}
+    for profile in sorted(PROFILES):
+        result["browser-" + profile] = camera_browser.camera_description(
+                source, profile, transport="null")
+    return result
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class ElementTimer(object):
+    'Pad probes timing each buffer through each single in, single out element.'
+
+    def __init__(self, pipeline):
+        self.times = {}  # element name -> list of seconds
+        self.factories = {}
+        self.entered = {}  # element name -> {pts: time}
+        self.first = None
+        self.frames = 0
+        self.source_times = {}  # pts -> time leaving the source
+        self.latencies = []
+
+        iterator = pipeline.iterate_recurse()
+        while True:
+            result, element = iterator.next()
+            if result != Gst.IteratorResult.OK:
+                break
+            if isinstance(element, Gst.Bin):
+                continue
+            name = element.get_name()
+            if not element.sinkpads and len(element.srcpads) == 1:
+                element.srcpads[0].add_probe(Gst.PadProbeType.BUFFER,
+                                             self.on_source)
+            elif (element.sinkpads and not element.srcpads
+                    and name in LATENCY_SINKS):
+                element.sinkpads[0].add_probe(Gst.PadProbeType.BUFFER,
+                                              self.on_sink)
+            elif len(element.sinkpads) == 1 and len(element.srcpads) == 1:
+                self.times[name] = []
+                self.entered[name] = {}
+                self.factories[name] = element.get_factory().get_name()
+                element.sinkpads[0].add_probe(Gst.PadProbeType.BUFFER,
+                                              self.on_enter, name)
+                element.srcpads[0].add_probe(Gst.PadProbeType.BUFFER,
+                                             self.on_leave, name)
+
+    def on_source(self, pad, info):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        self.frames += 1
+        self.source_times[info.get_buffer().pts] = now
+        return Gst.PadProbeReturn.OK
+
+    def on_sink(self, pad, info):
+        start = self.source_times.pop(info.get_buffer().pts, None)
+        if start is not None:
+            self.latencies.append(time.perf_counter() - start)
+        return Gst.PadProbeReturn.OK
+
+    def on_enter(self, pad, info, name):
+        self.entered[name][info.get_buffer().pts] = time.perf_counter()
+        return Gst.PadProbeReturn.OK
+
+    def on_leave(self, pad, info, name):
+        start = self.entered[name].pop(info.get_buffer().pts, None)
+        if start is not None:
+            self.times[name].append(time.perf_counter() - start)
+        return Gst.PadProbeReturn.OK
+
+    def summary(self, elapsed):
+        result = {"frames": self.frames,
+                  "seconds": round(elapsed, 3),
+                  "fps": round(self.frames / elapsed, 1) if elapsed else 0,
+                  "elements": {}}
+        for name, times in self.times.items():
+            if times:
+                result["elements"][name] = {
+                        "factory": self.factories[name],
+                        "buffers": len(times),
+                        "mean_us": round(1e6 * sum(times) / len(times), 1),
+                        "total_ms": round(1e3 * sum(times), 1)}
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            result["latency_ms"] = {
+                    "mean": round(1e3 * sum(ordered) / len(ordered), 2),
+                    "p95": round(1e3 * percentile(ordered, 0.95), 2),
+                    "max": round(1e3 * ordered[-1], 2),
+                    "frames": len(ordered)}
+        return result
+
+
+def run_variant(name, description, frames=FRAMES, live=False):
+    'Run the pipeline for frames from its source. Return the summary.'
+    pipeline = Gst.parse_launch(description)
+    iterator = pipeline.iterate_sources()
+    while True:
+        result, source = iterator.next()
+        if result != Gst.IteratorResult.OK:
+            break
+        if source.find_property("num-buffers") is None:
+            raise RuntimeError("{}: the source must be a basesrc, e.g. test"
+                               .format(name))
+        source.set_property("num-buffers", frames)
+        if source.find_property("is-live") is not None:
+            source.set_property("is-live", live)
+
+    # Draw the clock of the cached overlay variants.
+    attach_overlay(pipeline)
+    timer = ElementTimer(pipeline)
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(
+            TIMEOUT * Gst.SECOND, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    end = time.perf_counter()
+    pipeline.set_state(Gst.State.NULL)
+
+    if message is None:
+        raise RuntimeError("{} timed out".format(name))
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        raise RuntimeError("{}: {}".format(name, err))
+
+    result = {"variant": name,
+              "live": live,
+              "date": datetime.datetime.now().isoformat(timespec="seconds"),
+              "gstreamer": Gst.version_string()}
+    result.update(timer.summary(end - timer.first if timer.first else 0))
+    return result
+
+
+def print_result(result):
+    'Console summary of one variant, slowest elements first.'
+    latency = result.get("latency_ms", {})
+    print("{variant}: {frames} frames {fps} frames/sec  latency mean {mean} "
+          "ms p95 {p95} ms".format(mean=latency.get("mean", "-"),
+                                   p95=latency.get("p95", "-"), **result))
+    elements = sorted(result["elements"].items(),
+                      key=lambda item: -item[1]["total_ms"])
+    for name, element in elements:
+        print("    {:20} {:16} {:10.1f} us/buffer".format(
+                name, element["factory"], element["mean_us"]))
+
+
+if __name__ == "__main__":
+
+    names = sorted(variants())
+    parser = argparse.ArgumentParser(
+            description="Benchmark the camera pipelines headless.")
+    parser.add_argument("--variants", default=",".join(names),
+                        help="Comma separated, from: {}".format(
+                                ", ".join(names)))
+    parser.add_argument("--source", default="test",
+                        help="Default test, i.e. videotestsrc.")
+    parser.add_argument("--frames", type=int, default=FRAMES)
+    parser.add_argument("--live", action="store_true",
+                        help="Run the source at its frame rate.")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as JSON.")
+    parser.add_argument("--output",
+                        help="Append the results to this JSON lines file.")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    descriptions = variants(args.source)
+    results = []
+    for name in args.variants.split(","):
+        try:
+            result = run_variant(name, descriptions[name], args.frames,
+                                 args.live)
+        except RuntimeError as error:
+            print("Error: {}".format(error))
+            continue
+        results.append(result)
+        if not args.json:
+            print_result(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
@@ -9,51 +9,129 @@
 #
 # Ian Stewart 2020-04-03
 #
+# The camera is encoded once and served to any number of browsers, or other
+# viewers, over HTTP by fanout.py. Each viewer has its own bounded queue in
+# multisocketsink. A slow viewer skips ahead to the next keyframe, rather
+# than holding up the encoder, and new viewers start at the latest keyframe.
+#
+# --headless runs the server without the Gtk window and web-browser tab.
+# --source test uses videotestsrc instead of /dev/video0. E.g.
+# $ python3 camera_browser.py --headless --source test --report 5
+#
+# --profile selects the encoder and container, see camera_profiles.py. The
+# mjpeg and vp8 profiles have much lower latency than theora. --transport rtp
+# sends RTP to --host:--port over UDP instead of serving HTTP. E.g.
+# $ python3 camera_browser.py --profile mjpeg --bitrate 2000
+# $ python3 camera_browser.py --headless --profile h264 --transport rtp \
+#       --host 192.168.1.20 --port 5000
+#
+# http://127.0.0.1:8080/snapshot.jpg, or .png, is a still of the newest frame
+# from the running pipeline, see camera_snapshot.py.
+#
+# --overlay cached draws the clock once a second, instead of every frame,
+# see camera_overlay.py.
+#
+import time
+# Taken first, for the time from the start of the program to the first frame.
+PROGRAM_START = time.perf_counter()
 import sys, os
+import argparse
 import webbrowser
 import gi
 gi.require_version('Gst', '1.0')
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gst, GObject, Gtk
+from gi.repository import Gst, GLib
 
-# Needed for window.get_xid(), xvimagesink.set_window_handle(), respectively:
-gi.require_version('GstVideo', '1.0')
-from gi.repository import GdkX11, GstVideo
+from camera_source import source_description, DEFAULT_SOURCE
+from camera_overlay import (overlay_description, attach_overlay,
+                            OVERLAY_MODES, DEFAULT_OVERLAY)
+from camera_profiles import (PROFILES, DEFAULT_PROFILE, sender_description,
+                             add_profile_arguments, encoder_options)
+from camera_snapshot import snapshot_branch, Snapshot
+from fanout import FanoutServer
+
+HOST = "127.0.0.1"
+PORT = 8080
+# Per-viewer queue, in bytes. About 4 and 16 secs of video at 1 Mbit/sec.
+VIEWER_SOFT_MAX = 512 * 1024
+VIEWER_HARD_MAX = 2 * 1024 * 1024
 
 text_message= """
 <b>Camera Browser</b>
 
-This program will launch a web-browser window and open: 
+This program will launch a web-browser window and open:
 
-http://127:0.0.1:8080. 
+http://{host}:{port}
 
-The program will turn on the camera on your laptop and broadcast the camera's images using a tcp server broadcasting on the 127.0.0.1 port 8080 address.
+The program will turn on the camera on your laptop and broadcast the camera's images using a http server on the {host} port {port} address. Any number of web-browsers may view the camera. The camera is only encoded once.
 
 The GStreamer pipeline code is:
 
 pipeline_template = '''
-    v4l2src device=/dev/video0
-    ! videoconvert 
-    ! videoscale 
-    ! video/x-raw,width=400,height=400
-    ! clockoverlay shaded-background=true font-desc="Sans 16" 
-    ! theoraenc 
-    ! oggmux 
-    ! tcpserversink host=127.0.0.1 port=8080
+    {pipeline}
     '''
 
-self.pipeline = Gst.parse_launch(pipeline_template) 
+self.pipeline = Gst.parse_launch(pipeline_template)
 
 clockoverlay adds the wall clock time to the video being displayed.
 
+Each web-browser is handed to multisocketsink, which keeps a separate queue for it. See http://{host}:{port}/metrics for the throughput and dropped buffers of each viewer.
+
+http://{host}:{port}/snapshot.jpg is a still of the newest frame. It is only encoded when asked for.
 """
 
+
+def camera_description(source=DEFAULT_SOURCE, profile=DEFAULT_PROFILE,
+                       transport="http", host=HOST, port=PORT,
+                       overlay=DEFAULT_OVERLAY, texts=(), **options):
+    'The gst-launch text of the pipeline that encodes once for all viewers.'
+    return """
+        {source}
+        ! videoconvert
+        ! videoscale
+        ! video/x-raw,width=400,height=400
+        ! {overlay}tee name=split
+        split.
+        ! queue
+        ! videoconvert
+        ! {sender}
+        {snapshot}
+        """.format(source=source_description(source),
+                   overlay=overlay_description(overlay, texts),
+                   sender=sender_description(profile, transport, host, port,
+                                             **options),
+                   snapshot=snapshot_branch("split"))
+
+
+def camera_pipeline(source=DEFAULT_SOURCE, profile=DEFAULT_PROFILE,
+                    transport="http", host=HOST, port=PORT, **options):
+    'Build the pipeline that encodes once for all the viewers.'
+    return Gst.parse_launch(camera_description(source, profile, transport,
+                                               host, port, **options))
+
+
+def camera_server(pipeline, host=HOST, port=PORT, profile=DEFAULT_PROFILE):
+    """
+    Serve the encoded camera at http://host:port/ to every viewer, and a
+    still of the newest frame at /snapshot.jpg and /snapshot.png.
+    """
+    server = FanoutServer(host, port)
+    Snapshot(pipeline).serve(server)
+    stream = server.add_stream("/", pipeline.get_by_name("viewers"),
+                               PROFILES[profile]["content_type"],
+                               soft_max=VIEWER_SOFT_MAX,
+                               hard_max=VIEWER_HARD_MAX,
+                               recover_policy="keyframe",
+                               sync_method="burst-keyframe")
+    server.start()
+    return server, stream
+
+
 class Camera_Window(object):
-    def __init__(self):
+    def __init__(self, pipeline, host=HOST, port=PORT, description=""):
         window = Gtk.Window(Gtk.WindowType.TOPLEVEL)
         window.set_title("Camera Browser")
         window.set_default_size(450, 550)
-        window.connect("destroy", Gtk.main_quit, "WM destroy")
+        window.connect("destroy", self.exit)
 
         vbox = Gtk.VBox()
         window.add(vbox)
@@ -67,7 +145,9 @@ class Camera_Window(object):
         self.textview.set_wrap_mode(Gtk.WrapMode.WORD)
         self.textbuffer = self.textview.get_buffer()
         self.textbuffer.insert_markup(self.textbuffer.get_end_iter(),
-                text_message, -1)
+                text_message.format(host=host, port=port,
+                                    pipeline=" ".join(description.split())),
+                -1)
         scrolledwindow.add(self.textview)
         vbox.add(scrolledwindow)
 
@@ -78,62 +158,124 @@ class Camera_Window(object):
 
         vbox.pack_start(hbox, False, False, 0)
 
-
-        pipeline_template = """
-            v4l2src device=/dev/video0
-            ! videoconvert 
-            ! videoscale 
-            ! video/x-raw,width=400,height=400
-            ! clockoverlay shaded-background=true font-desc="Sans 16" 
-            ! theoraenc 
-            ! oggmux 
-            ! tcpserversink host=127.0.0.1 port=8080
-            """
-
-        self.pipeline = Gst.parse_launch(pipeline_template) 
+        self.pipeline = pipeline
 
         bus = self.pipeline.get_bus()
         bus.add_signal_watch()
-        bus.enable_sync_message_emission()
         bus.connect("message", self.on_message)
-        bus.connect("sync-message::element", self.on_sync_message)
 
         window.show_all()
 
-        webbrowser.open_new_tab('http://127.0.0.1:8080')
-
         self.pipeline.set_state(Gst.State.PLAYING)
 
-    
+        webbrowser.open_new_tab('http://{}:{}'.format(host, port))
+
+
     def exit(self, w):
         self.pipeline.set_state(Gst.State.NULL)
-        sys.exit()
+        Gtk.main_quit()
 
 
     def on_message(self, bus, message):
         t = message.type
         if t == Gst.MessageType.EOS:
-            self.player.set_state(Gst.State.NULL)
-            self.button.set_label("Start")
+            self.pipeline.set_state(Gst.State.NULL)
         elif t == Gst.MessageType.ERROR:
-            self.player.set_state(Gst.State.NULL)
+            self.pipeline.set_state(Gst.State.NULL)
             err, debug = message.parse_error()
             print("Error: %s" % err, debug)
-            self.button.set_label("Start")
-
-    def on_sync_message(self, bus, message):
-        #print("on_sync_message")
-        if message.get_structure().get_name() == 'prepare-window-handle':
-            #print("Detected: 'prepare-window-handle'")
-            imagesink = message.src
-            #imagesink.set_property("force-aspect-ratio", True)
-            imagesink.set_window_handle(self.movie_window.get_property('window').get_xid())
-        else:
-            #print("Message structure name:", message.get_structure().get_name())
-            pass
-
-GObject.threads_init()
-Gst.init(None)  
-Camera_Window()
-Gtk.main()
 
+
+def run_headless(pipeline):
+    'Serve the camera with a GLib loop, without any Gtk window.'
+    loop = GLib.MainLoop()
+
+    def on_error(bus, message):
+        err, debug = message.parse_error()
+        print("Error: {}:\n{}".format(err, debug))
+        loop.quit()
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message::error", on_error)
+    bus.connect("message::eos", lambda bus, message: loop.quit())
+
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print('\n Stopped via Ctrl-C')
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+
+def report_first_frame(pipeline, name="viewers"):
+    'Print the time from the start of the program to the first frame encoded.'
+    def on_first_frame(pad, info):
+        print("First frame encoded after {:.0f} ms".format(
+                1000 * (time.perf_counter() - PROGRAM_START)))
+        return Gst.PadProbeReturn.REMOVE
+    pipeline.get_by_name(name).get_static_pad("sink").add_probe(
+            Gst.PadProbeType.BUFFER, on_first_frame)
+
+
+def print_report(stream):
+    'Periodic console report of the viewers.'
+    print(stream.report())
+    return True
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Stream the camera to web-browsers.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE,
+                        help="/dev/videoN, test, test:<pattern>, a file "
+                             "or a uri. Default {}".format(DEFAULT_SOURCE))
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--headless", action="store_true",
+                        help="No Gtk window or web-browser tab.")
+    parser.add_argument("--report", type=int, default=0,
+                        help="Print viewer throughput and drops every N "
+                             "seconds.")
+    parser.add_argument("--transport", default="http", choices=("http", "rtp"),
+                        help="Serve HTTP, or send RTP to --host:--port.")
+    parser.add_argument("--overlay", default=DEFAULT_OVERLAY,
+                        choices=OVERLAY_MODES,
+                        help="cached renders the clock once a second.")
+    parser.add_argument("--text", action="append", default=[],
+                        help="Another line of overlay text. May be repeated.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    Gst.init(None)
+    description = camera_description(args.source, args.profile,
+                                     args.transport, args.host, args.port,
+                                     args.overlay, args.text,
+                                     **encoder_options(args))
+    pipeline = Gst.parse_launch(description)
+    overlay = attach_overlay(pipeline, args.text)
+    report_first_frame(pipeline)
+    server = None
+    if args.transport == "http":
+        server, stream = camera_server(pipeline, args.host, args.port,
+                                       args.profile)
+        if args.report > 0:
+            GLib.timeout_add_seconds(args.report, print_report, stream)
+
+    if args.transport == "rtp" and not args.headless:
+        print("RTP has no web-browser viewer, running headless.")
+        args.headless = True
+
+    if args.headless:
+        run_headless(pipeline)
+    else:
+        gi.require_version('Gtk', '3.0')
+        from gi.repository import Gtk
+
+        Camera_Window(pipeline, args.host, args.port, description)
+        Gtk.main()
+
+    if server:
+        server.stop()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+#
+# camera_latency.py
+#
+# Measure the latency of each encode profile and transport of the camera
+# programs, so the fastest one can be chosen for a deployment.
+#
+# The sender stamps the wall clock time, in milliseconds, into each frame as
+# a strip of 32 black or white blocks, with the GStreamer "cairooverlay"
+# plugin. This is done after the camera, just before the encoder. The
+# receiver decodes the stream, reads the strip back from the GRAY8 frame
+# and subtracts the stamp from its own clock. The latency therefore covers
+# encode, mux, transport, jitter buffering, demux and decode. Camera
+# exposure and the display add to this, for a true glass-to-glass figure.
+#
+# By default both sender and receiver run in this process and every profile
+# is measured in turn:
+# $ python3 camera_latency.py --source test --seconds 10
+# $ python3 camera_latency.py --profiles mjpeg,vp8 --transport rtp --json
+#
+# To measure across the network, run the sender on the camera computer and
+# the receiver on the viewer. The clocks of the two computers must be
+# synchronised, e.g. by NTP, and their offset is included in the result.
+# $ python3 camera_latency.py --mode send --profiles vp8 --host 0.0.0.0
+# $ python3 camera_latency.py --mode receive --profiles vp8 --host camera
+# For --transport rtp the sender's --host is the address of the receiver.
+#
+# Requires pycairo for cairooverlay's "draw" signal.
+#
+import sys, os
+import time
+import json
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from camera_source import source_description
+from camera_profiles import (PROFILES, sender_description,
+                             receiver_description, add_encoder_arguments,
+                             encoder_options)
+from fanout import FanoutServer
+
+HOST = "127.0.0.1"
+PORT = 8090
+WIDTH = 640
+HEIGHT = 480
+FRAMERATE = 30
+
+# The stamp is 32 bits of milliseconds, as 2 rows of 16 blocks.
+STAMP_BITS = 32
+STAMP_COLUMNS = 16
+STAMP_BLOCK = 16
+# A stamp that decodes to more than this is taken to be unreadable.
+MAX_LATENCY_MS = 60 * 1000
+
+
+def now_ms():
+    'The wall clock time in milliseconds, modulo 2**32.'
+    return int(time.time() * 1000) & 0xFFFFFFFF
+
+
+def stamp_blocks():
+    'Yield the bit number and top left corner of each block of the stamp.'
+    for bit in range(STAMP_BITS):
+        yield (bit, (bit % STAMP_COLUMNS) * STAMP_BLOCK,
+               (bit // STAMP_COLUMNS) * STAMP_BLOCK)
+
+
+def draw_stamp(overlay, context, timestamp, duration):
+    'cairooverlay "draw" callback. Paint the time as black and white blocks.'
+    value = now_ms()
+    for bit, x, y in stamp_blocks():
+        level = float((value >> (STAMP_BITS - 1 - bit)) & 1)
+        context.set_source_rgb(level, level, level)
+        context.rectangle(x, y, STAMP_BLOCK, STAMP_BLOCK)
+        context.fill()
+
+
+def read_stamp(data, stride):
+    'Read the time back from a GRAY8 frame, at the centre of each block.'
+    value = 0
+    centre = STAMP_BLOCK // 2
+    for bit, x, y in stamp_blocks():
+        if data[(y + centre) * stride + x + centre] >= 128:
+            value |= 1 << (STAMP_BITS - 1 - bit)
+    return value
+
+
+class Sender(object):
+    'Stamp and encode the source, and serve it over HTTP or send RTP.'
+    def __init__(self, source, profile, transport, host, port, **options):
+        self.pipeline = Gst.parse_launch("""
+            {source}
+            ! videoconvert
+            ! videoscale
+            ! videorate
+            ! video/x-raw,width={width},height={height},framerate={rate}/1
+            ! videoconvert
+            ! cairooverlay name=stamp
+            ! videoconvert
+            ! {sender}
+            """.format(source=source_description(source),
+                       width=WIDTH, height=HEIGHT, rate=FRAMERATE,
+                       sender=sender_description(profile, transport, host,
+                                                 port, **options)))
+        self.pipeline.get_by_name("stamp").connect("draw", draw_stamp)
+
+        self.server = None
+        if transport == "http":
+            self.server = FanoutServer(host, port)
+            self.server.add_stream("/", self.pipeline.get_by_name("viewers"),
+                                   PROFILES[profile]["content_type"],
+                                   recover_policy="keyframe",
+                                   sync_method="burst-keyframe")
+            self.server.start()
+
+    def start(self):
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def stop(self):
+        self.pipeline.set_state(Gst.State.NULL)
+        if self.server:
+            self.server.stop()
+
+
+class Receiver(object):
+    'Receive and decode the stream, and collect the latency of each frame.'
+    def __init__(self, profile, transport, host, port):
+        self.latencies = []
+        self.unreadable = 0
+        self.pipeline = Gst.parse_launch("""
+            {receiver}
+            ! videoconvert
+            ! video/x-raw,format=GRAY8
+            ! appsink name=frames emit-signals=true sync=false
+            """.format(receiver=receiver_description(profile, transport,
+                                                     host, port)))
+        self.pipeline.get_by_name("frames").connect("new-sample",
+                                                    self.on_sample)
+
+    def on_sample(self, appsink):
+        received = now_ms()
+        sample = appsink.emit("pull-sample")
+        structure = sample.get_caps().get_structure(0)
+        # GRAY8 rows are padded to a multiple of 4 bytes.
+        stride = (structure.get_value("width") + 3) & ~3
+        buffer = sample.get_buffer()
+        ok, info = buffer.map(Gst.MapFlags.READ)
+        if not ok:
+            return Gst.FlowReturn.OK
+        try:
+            latency = (received - read_stamp(info.data, stride)) & 0xFFFFFFFF
+        finally:
+            buffer.unmap(info)
+        if latency < MAX_LATENCY_MS:
+            self.latencies.append(latency)
+        else:
+            self.unreadable += 1
+        return Gst.FlowReturn.OK
+
+    def start(self):
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def stop(self):
+        self.pipeline.set_state(Gst.State.NULL)
+
+    def summary(self):
+        'Frames received and the latency statistics in milliseconds.'
+        result = {"frames": len(self.latencies),
+                  "unreadable": self.unreadable}
+        if self.latencies:
+            ordered = sorted(self.latencies)
+            result.update({
+                    "mean_ms": round(sum(ordered) / len(ordered), 1),
+                    "median_ms": ordered[len(ordered) // 2],
+                    "p95_ms": ordered[int(len(ordered) * 0.95)],
+                    "min_ms": ordered[0],
+                    "max_ms": ordered[-1]})
+        return result
+
+
+def measure(profile, transport, mode, source, host, port, seconds,
+            **options):
+    'Run the sender and/or receiver for seconds. Return the summary.'
+    loop = GLib.MainLoop()
+    parts = []
+    sender = receiver = None
+    if mode in ("both", "send"):
+        sender = Sender(source, profile, transport, host, port, **options)
+        parts.append(sender)
+    if mode in ("both", "receive"):
+        receiver = Receiver(profile, transport, host, port)
+        parts.append(receiver)
+
+    def on_error(bus, message):
+        err, debug = message.parse_error()
+        print("Error: {}: {}:\n{}".format(profile, err, debug))
+        loop.quit()
+
+    for part in parts:
+        bus = part.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::error", on_error)
+        part.start()
+
+    GLib.timeout_add_seconds(seconds, loop.quit)
+    try:
+        loop.run()
+    finally:
+        for part in reversed(parts):
+            part.stop()
+            part.pipeline.get_bus().remove_signal_watch()
+
+    result = {"profile": profile, "transport": transport,
+              "seconds": seconds}
+    if receiver:
+        result.update(receiver.summary())
+    return result
+
+
+def print_table(results):
+    'Console table of the results, lowest median latency first.'
+    print("{:8} {:9} {:>7} {:>8} {:>8} {:>8} {:>8}".format(
+            "profile", "transport", "frames", "median", "p95", "max",
+            "unread"))
+    for result in sorted(results, key=lambda r: r.get("median_ms", 1e9)):
+        print("{:8} {:9} {:7} {:>8} {:>8} {:>8} {:8}".format(
+                result["profile"], result["transport"], result["frames"],
+                result.get("median_ms", "-"), result.get("p95_ms", "-"),
+                result.get("max_ms", "-"), result["unreadable"]))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Measure the latency of the camera encode profiles.")
+    parser.add_argument("--source", default="test",
+                        help="/dev/videoN, test, a file or a uri. "
+                             "Default test")
+    parser.add_argument("--profiles", default=",".join(sorted(PROFILES)),
+                        help="Comma separated profiles to measure.")
+    parser.add_argument("--transport", default="http",
+                        choices=("http", "rtp"))
+    parser.add_argument("--mode", default="both",
+                        choices=("both", "send", "receive"))
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--seconds", type=int, default=10,
+                        help="Duration of each measurement.")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the results as JSON.")
+    add_encoder_arguments(parser)
+    args = parser.parse_args()
+
+    Gst.init(None)
+    results = []
+    for profile in args.profiles.split(","):
+        if args.transport == "rtp" and PROFILES[profile]["pay"] is None:
+            print("Skipping {}, it can not be sent over RTP".format(profile))
+            continue
+        try:
+            results.append(measure(profile, args.transport, args.mode,
+                                   args.source, args.host, args.port,
+                                   args.seconds, **encoder_options(args)))
+        except KeyboardInterrupt:
+            print('\n Stopped via Ctrl-C')
+            break
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    elif args.mode != "send":
+        print_table(results)
@@ -4,113 +4,130 @@
 #
 # Open a Gtk Window and display view from your laptop webcam. 
 #
-# Warning: Unstable. May fail on starting. Timing issues?
-#
 # Ian Stewart 2020-04-02
 #
+# camera_description() returns the pipeline text, so the pipeline can be
+# run without a window or a camera, e.g. by camera_benchmark.py.
+#
+# The video is drawn by gtksink, or by gtkglsink in a glsinkbin, into its
+# own Gtk widget, from the Gtk main thread. The pipeline is started as the
+# window opens. There is no Start button: the old autovideosink drew into an
+# X window from the streaming thread, which aborted with an XInitThreads
+# assertion if the pipeline was started before the window was up. The time
+# from the start of the program to the first frame reaching the video sink
+# is printed.
+#
+# $ python3 camera_local.py --source test --sink glsinkbin
+#
 import time
+# Taken first, for the time from the start of the program to the first frame.
+PROGRAM_START = time.perf_counter()
 import sys, os
+import argparse
 import gi
 gi.require_version('Gst', '1.0')
-gi.require_version('Gtk', '3.0')
-from gi.repository import Gst, GObject, Gtk
+from gi.repository import Gst
+
+from camera_source import source_description, DEFAULT_SOURCE
+from camera_overlay import (overlay_description, attach_overlay,
+                            OVERLAY_MODES, DEFAULT_OVERLAY)
 
-# Needed for window.get_xid(), xvimagesink.set_window_handle(), respectively:
-gi.require_version('GstVideo', '1.0')
-from gi.repository import GdkX11, GstVideo
+# Video sinks that provide a Gtk widget, and their pipeline text.
+SINKS = {
+        "gtksink": "gtksink name=sink",
+        "glsinkbin": "glsinkbin name=sink sink=gtkglsink",
+        }
+
+
+def camera_description(source=DEFAULT_SOURCE, sink="autovideosink",
+                       overlay=DEFAULT_OVERLAY):
+    'The gst-launch text of the webcam with a clock overlay.'
+    return """
+        {source}
+        ! videoconvert 
+        ! videoscale 
+        ! video/x-raw,width=320,height=240
+        ! {overlay}{sink}
+        """.format(source=source_description(source), sink=sink,
+                   overlay=overlay_description(overlay))
 
 
 class Camera_Window(object):
-    def __init__(self):
+    def __init__(self, source=DEFAULT_SOURCE, sink="gtksink",
+                 overlay=DEFAULT_OVERLAY):
         window = Gtk.Window(Gtk.WindowType.TOPLEVEL)
         window.set_title("Camera")
         window.set_default_size(400, 330)
-        window.connect("destroy", Gtk.main_quit, "WM destroy")
+        window.connect("destroy", self.exit)
         window.set_position(Gtk.WindowPosition.CENTER_ALWAYS)
         vbox = Gtk.VBox()
         window.add(vbox)
 
-        # Add a movie window and a start button
-        self.movie_window = Gtk.DrawingArea()
-        vbox.add(self.movie_window)
+        # Pipline for webcam with a clock overlay
+        self.pipeline = Gst.parse_launch(camera_description(
+                source, SINKS[sink], overlay))
+        self.overlay = attach_overlay(self.pipeline)
+
+        # The sink's own widget takes the place of the movie window.
+        video_sink = self.pipeline.get_by_name("sink")
+        if sink == "glsinkbin":
+            video_sink = video_sink.get_property("sink")
+        vbox.add(video_sink.get_property("widget"))
+        video_sink.get_static_pad("sink").add_probe(
+                Gst.PadProbeType.BUFFER, self.on_first_frame)
 
         hbox = Gtk.HBox()
         vbox.pack_start(hbox, False, False, 0)
-        self.button = Gtk.Button("Start")
-        self.button.connect("clicked", self.start_stop)
+        self.button = Gtk.Button("Exit")
+        self.button.connect("clicked", self.exit)
         hbox.pack_end(self.button, False, False, 0)
 
-        # Pipline for webcam with a clock overlay
-        pipeline_template = """
-            v4l2src device=/dev/video0
-            ! videoconvert 
-            ! videoscale 
-            ! video/x-raw,width=320,height=240
-            ! clockoverlay shaded-background=true font-desc="Sans 16" 
-            ! autovideosink
-            """
-        self.pipeline = Gst.parse_launch(pipeline_template) 
-
         bus = self.pipeline.get_bus()
         bus.add_signal_watch()
-        bus.enable_sync_message_emission()
         bus.connect("message", self.on_message)
-        bus.connect("sync-message::element", self.on_sync_message)
 
         window.show_all()
+        self.pipeline.set_state(Gst.State.PLAYING)
 
-        # Cant start here. Needs GUI all up and running first.
-        #self.pipeline.set_state(Gst.State.PLAYING)
 
+    def on_first_frame(self, pad, info):
+        print("First frame after {:.0f} ms".format(
+                1000 * (time.perf_counter() - PROGRAM_START)))
+        return Gst.PadProbeReturn.REMOVE
 
-    def start_stop(self, w):
-        if self.button.get_label() == "Start":
-            self.button.set_label("Exit")
-            self.pipeline.set_state(Gst.State.PLAYING)
-        else:
-            self.pipeline.set_state(Gst.State.NULL)
-            sys.exit()
+
+    def exit(self, w):
+        self.pipeline.set_state(Gst.State.NULL)
+        Gtk.main_quit()
 
 
     def on_message(self, bus, message):
         t = message.type
         if t == Gst.MessageType.EOS:
-            self.player.set_state(Gst.State.NULL)
-            self.button.set_label("Start")
+            self.pipeline.set_state(Gst.State.NULL)
         elif t == Gst.MessageType.ERROR:
-            self.player.set_state(Gst.State.NULL)
+            self.pipeline.set_state(Gst.State.NULL)
             err, debug = message.parse_error()
             print("Error: %s" % err, debug)
-            self.button.set_label("Start")
-
-    def on_sync_message(self, bus, message):
-        #print("on_sync_message")
-        if message.get_structure().get_name() == 'prepare-window-handle':
-            #print("Detected: 'prepare-window-handle'")
-            imagesink = message.src
-            #imagesink.set_property("force-aspect-ratio", True)
-            imagesink.set_window_handle(self.movie_window.get_property('window').get_xid())
-        else:
-            #print("Message structure name:", message.get_structure().get_name())
-            pass
-
-GObject.threads_init()
-Gst.init(None)     
-# Call the class, then run the loop ~ Gtk.main()   
-Camera_Window()
-Gtk.main()
-
-"""
-Note: 
-If try to start on launching the Camera_Window() then...
-
-$ python3 camera_local.py 
-[xcb] Unknown request in queue while dequeuing
-[xcb] Most likely this is a multi-threaded client and XInitThreads has not been called
-[xcb] Aborting, sorry about that.
-python3: ../../src/xcb_io.c:165: dequeue_pending_request: Assertion `!xcb_xlib_unknown_req_in_deq' failed.
-Aborted (core dumped)
-
-Seems to need to get GUI window displayed and then use the "Start" button.
-"""
 
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Display the webcam in a Gtk window.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE,
+                        help="/dev/videoN, test, test:<pattern>, a file "
+                             "or a uri. Default {}".format(DEFAULT_SOURCE))
+    parser.add_argument("--sink", default="gtksink", choices=sorted(SINKS),
+                        help="glsinkbin draws with OpenGL.")
+    parser.add_argument("--overlay", default=DEFAULT_OVERLAY,
+                        choices=OVERLAY_MODES)
+    args = parser.parse_args()
+
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import Gtk
+
+    Gst.init(None)     
+    # Call the class, then run the loop ~ Gtk.main()   
+    Camera_Window(args.source, args.sink, args.overlay)
+    Gtk.main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+#
+# camera_mosaic.py
+#
+# Tile several cameras into one grid, encoded once and served to web-browsers
+# in the same way as camera_browser.py.
+#
+# Each source is scaled to its tile and goes through a leaky queue to an
+# input-selector. The other input of the selector is a placeholder: a black
+# tile, at 1 frame/sec, with the name of the source. If a source stops
+# sending frames for STALL_SECS, or posts an error, its selector switches to
+# the placeholder so the rest of the grid keeps moving. It switches back when
+# frames arrive again. A source that posted an error is restarted every
+# RETRY_SECS. Its EOS has reached the scaler, the queue and the selector, so
+# the whole branch is set to NULL, the selector pad is flushed, and the
+# branch is started again. This works for v4l2src and videotestsrc. The
+# pads of a uridecodebin are linked once, by Gst.parse_launch(), so a
+# uridecodebin source that fails stays on its placeholder.
+#
+# The sources may be any mix of /dev/videoN, test:<pattern>, files or RTSP
+# uris, see camera_source.py:
+# $ python3 camera_mosaic.py --sources test:ball,test:smpte,test:snow,/dev/video0
+#
+# --scale reports the CPU used by 1, 2, 4, 8 and 16 videotestsrc sources:
+# $ python3 camera_mosaic.py --scale --seconds 10
+#
+import sys, os
+import math
+import time
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from camera_source import source_description
+from camera_profiles import (sender_description, add_profile_arguments,
+                             encoder_options, DEFAULT_PROFILE)
+from camera_overlay import overlay_description
+from camera_snapshot import snapshot_branch
+import camera_browser
+
+WIDTH = 1280
+HEIGHT = 720
+STALL_SECS = 2
+RETRY_SECS = 10
+DEFAULT_SOURCES = "test:ball,test:smpte,test:snow,test:pinwheel"
+
+
+def grid(count, width=WIDTH, height=HEIGHT):
+    'Return the tile width, tile height and (x, y) of each tile.'
+    columns = int(math.ceil(math.sqrt(count)))
+    rows = int(math.ceil(count / columns))
+    tile_width = width // columns
+    tile_height = height // rows
+    return tile_width, tile_height, [
+            ((index % columns) * tile_width, (index // columns) * tile_height)
+            for index in range(count)]
+
+
+def mosaic_description(sources, profile=DEFAULT_PROFILE, transport="http",
+                       host=camera_browser.HOST, port=camera_browser.PORT,
+                       width=WIDTH, height=HEIGHT, **options):
+    'The gst-launch text of the sources, tiled and encoded once.'
+    tile_width, tile_height, positions = grid(len(sources), width, height)
+    tile_caps = "video/x-raw,format=I420,width={},height={}".format(
+            tile_width, tile_height)
+
+    description = "compositor name=mosaic background=black"
+    for index, (x, y) in enumerate(positions):
+        description += " sink_{0}::xpos={1} sink_{0}::ypos={2}".format(
+                index, x, y)
+    description += """
+        ! video/x-raw,width={width},height={height}
+        ! {overlay}tee name=split
+        split.
+        ! queue
+        ! videoconvert
+        ! {sender}
+        {snapshot}
+        """.format(width=width, height=height,
+                   overlay=overlay_description(),
+                   sender=sender_description(profile, transport, host, port,
+                                             **options),
+                   snapshot=snapshot_branch("split"))
+
+    for index, source in enumerate(sources):
+        description += """
+            {source}
+            ! videoconvert
+            ! videoscale
+            ! {tile_caps}
+            ! queue name=tile{index} leaky=downstream max-size-buffers=2
+            ! selector{index}.sink_0
+            videotestsrc is-live=true pattern=black
+            ! video/x-raw,framerate=1/1
+            ! {tile_caps}
+            ! textoverlay text="No signal: {name}" font-desc="Sans 12"
+            ! videoconvert
+            ! {tile_caps}
+            ! selector{index}.sink_1
+            input-selector name=selector{index} sync-streams=false
+            ! mosaic.sink_{index}
+            """.format(source=source_description(source,
+                                                 name="source{}".format(index)),
+                       tile_caps=tile_caps, index=index,
+                       name=source.replace('"', ""))
+    return description
+
+
+class Mosaic(object):
+    'Switch each tile between its source and its placeholder.'
+
+    def __init__(self, pipeline, sources):
+        self.pipeline = pipeline
+        self.tiles = []
+        for index, source in enumerate(sources):
+            tile = {"name": source,
+                    "source": pipeline.get_by_name("source{}".format(index)),
+                    "selector": pipeline.get_by_name(
+                            "selector{}".format(index)),
+                    "queue": pipeline.get_by_name("tile{}".format(index)),
+                    "last": time.time(),
+                    "failed": 0,
+                    "live": True}
+            tile["queue"].get_static_pad("src").add_probe(
+                    Gst.PadProbeType.BUFFER, self.on_frame, tile)
+            self.tiles.append(tile)
+        self.timeout = GLib.timeout_add(500, self.check)
+
+    def stop(self):
+        GLib.source_remove(self.timeout)
+
+    def on_frame(self, pad, info, tile):
+        tile["last"] = time.time()
+        return Gst.PadProbeReturn.OK
+
+    def select(self, tile, live):
+        if tile["live"] == live:
+            return
+        tile["live"] = live
+        selector = tile["selector"]
+        selector.set_property("active-pad", selector.get_static_pad(
+                "sink_0" if live else "sink_1"))
+        print("{}: {}".format(tile["name"], "live" if live else "placeholder"))
+
+    def check(self):
+        'Switch stalled tiles to the placeholder, and back when they resume.'
+        now = time.time()
+        for tile in self.tiles:
+            stalled = now - tile["last"] > STALL_SECS
+            self.select(tile, not stalled and not tile["failed"])
+            if tile["failed"] and now - tile["failed"] > RETRY_SECS:
+                tile["failed"] = 0
+                tile["last"] = now
+                self.restart(tile)
+        return True
+
+    def branch(self, tile):
+        'The elements from the source to the tile queue, downstream first.'
+        elements = []
+        element = tile["queue"]
+        while element is not None and element is not tile["source"]:
+            elements.append(element)
+            peer = element.get_static_pad("sink").get_peer()
+            element = peer.get_parent_element() if peer is not None else None
+        return elements + [tile["source"]]
+
+    def restart(self, tile):
+        'Clear the EOS or error of the source from its branch and restart it.'
+        elements = self.branch(tile)
+        for element in reversed(elements):
+            element.set_state(Gst.State.NULL)
+        pad = tile["selector"].get_static_pad("sink_0")
+        pad.send_event(Gst.Event.new_flush_start())
+        pad.send_event(Gst.Event.new_flush_stop(True))
+        for element in elements:
+            element.sync_state_with_parent()
+
+    def on_error(self, message):
+        """
+        If the error came from a source, show its placeholder and return
+        True. Otherwise return False.
+        """
+        for tile in self.tiles:
+            if message.src is tile["source"] or \
+                    message.src.has_as_ancestor(tile["source"]):
+                err, debug = message.parse_error()
+                print("{}: {}".format(tile["name"], err))
+                tile["failed"] = time.time()
+                self.select(tile, False)
+                return True
+        return False
+
+
+def run(pipeline, mosaic, seconds=0):
+    'Run until Ctrl-C, or for seconds. Errors from a source are survived.'
+    loop = GLib.MainLoop()
+
+    def on_error(bus, message):
+        if not mosaic.on_error(message):
+            err, debug = message.parse_error()
+            print("Error: {}:\n{}".format(err, debug))
+            loop.quit()
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message::error", on_error)
+    if seconds > 0:
+        GLib.timeout_add_seconds(seconds, loop.quit)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print('\n Stopped via Ctrl-C')
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+        bus.remove_signal_watch()
+        mosaic.stop()
+
+
+def scale(seconds, profile, counts=(1, 2, 4, 8, 16), **options):
+    'Print the CPU used by the mosaic of each count of videotestsrc sources.'
+    patterns = ["ball", "smpte", "snow", "pinwheel", "spokes", "gradient",
+                "circular", "zone-plate"]
+    print("{:>7} {:>10} {:>14} {:>10}".format("sources", "cpu %",
+                                              "cpu % each", "frames/s"))
+    for count in counts:
+        sources = ["test:{}".format(patterns[index % len(patterns)])
+                   for index in range(count)]
+        pipeline = Gst.parse_launch(mosaic_description(
+                sources, profile, "null", **options))
+        mosaic = Mosaic(pipeline, sources)
+        frames = [0]
+
+        def on_output(pad, info):
+            frames[0] += 1
+            return Gst.PadProbeReturn.OK
+        pipeline.get_by_name("split").get_static_pad("sink").add_probe(
+                Gst.PadProbeType.BUFFER, on_output)
+
+        start = time.time()
+        start_cpu = time.process_time()
+        run(pipeline, mosaic, seconds)
+        elapsed = time.time() - start
+        cpu = 100 * (time.process_time() - start_cpu) / elapsed
+        print("{:7} {:10.1f} {:14.1f} {:10.1f}".format(
+                count, cpu, cpu / count, frames[0] / elapsed))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Tile several cameras into one stream.")
+    parser.add_argument("--sources", default=DEFAULT_SOURCES,
+                        help="Comma separated /dev/videoN, test:<pattern>, "
+                             "files or uris.")
+    parser.add_argument("--host", default=camera_browser.HOST)
+    parser.add_argument("--port", type=int, default=camera_browser.PORT)
+    parser.add_argument("--report", type=int, default=0,
+                        help="Print viewer throughput and drops every N "
+                             "seconds.")
+    parser.add_argument("--scale", action="store_true",
+                        help="Report the CPU of 1 to 16 test sources.")
+    parser.add_argument("--seconds", type=int, default=10,
+                        help="Duration of each --scale run.")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    Gst.init(None)
+    if args.scale:
+        scale(args.seconds, args.profile, **encoder_options(args))
+        sys.exit()
+
+    sources = args.sources.split(",")
+    pipeline = Gst.parse_launch(mosaic_description(
+            sources, args.profile, "http", args.host, args.port,
+            **encoder_options(args)))
+    mosaic = Mosaic(pipeline, sources)
+    server, stream = camera_browser.camera_server(pipeline, args.host,
+                                                  args.port, args.profile)
+    if args.report > 0:
+        GLib.timeout_add_seconds(args.report, camera_browser.print_report,
+                                 stream)
+    run(pipeline, mosaic)
+    server.stop()
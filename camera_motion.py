@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+#
+# camera_motion.py
+#
+# Record the camera only when something moves, including the seconds
+# before the movement started.
+#
+# The capture is teed into two branches:
+#
+#   Encoder:  The video is encoded all the time, see camera_profiles.py, and
+#             the last --preroll seconds are kept in memory by PreRoll. It
+#             always starts at a keyframe, so a recording can begin with it.
+#   Motion:   A leaky queue, 5 frames/sec, scaled down to 64x48 GRAY8.
+#             MotionDetector counts the pixels that changed since the last
+#             frame. This costs very little CPU, whatever the camera size.
+#
+# On motion a Recording pipeline is started: appsrc ! splitmuxsink, which
+# writes motion-000-00000.mp4, motion-000-00001.mp4 ... of at most --segment
+# seconds each. It is sent the pre-roll then the live encoded video, until
+# there has been no motion for --still seconds. The timestamps are moved so
+# that each recording starts at zero.
+#
+# $ python3 camera_motion.py --preroll 10 --still 5
+# $ python3 camera_motion.py --test --seconds 40
+#
+# --test uses videotestsrc, switching between a black frame and a moving
+# ball every 10 secs. It prints the delay from the start of each movement
+# to its detection, and the CPU used by each branch.
+#
+import sys, os
+import time
+import argparse
+import threading
+import collections
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from camera_source import source_description, DEFAULT_SOURCE
+from camera_profiles import encoder_description
+from pipeline_stats import BranchCpu
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+WIDTH = 640
+HEIGHT = 480
+PREROLL_SECS = 10
+STILL_SECS = 5
+SEGMENT_SECS = 300
+# Motion branch frame size and rate.
+MOTION_WIDTH = 64
+MOTION_HEIGHT = 48
+MOTION_RATE = 5
+# A pixel has changed if its grey level moves more than PIXEL_THRESHOLD.
+# There is motion if more than MOTION_FRACTION of the pixels changed.
+PIXEL_THRESHOLD = 25
+MOTION_FRACTION = 0.01
+
+# Container and file extension for the encoded video of each profile. The
+# h264 encoder of camera_profiles.py already ends in h264parse.
+MUXERS = {
+        "h264": ("mp4mux", "mp4"),
+        "vp8": ("webmmux", "webm"),
+        "mjpeg": ("matroskamux", "mkv"),
+        "theora": ("oggmux", "ogg"),
+        }
+
+
+def motion_description(source=DEFAULT_SOURCE, profile="h264", bitrate=1000,
+                       gop=30):
+    'The gst-launch text of the capture, encoder and motion branches.'
+    return """
+        {source}
+        ! videoconvert
+        ! videoscale
+        ! video/x-raw,width={width},height={height}
+        ! clockoverlay shaded-background=true font-desc="Sans 16"
+        ! tee name=split
+        split.
+        ! queue name=encoder_queue
+        ! videoconvert
+        ! {encoder}
+        ! appsink name=encoded emit-signals=true sync=false
+        split.
+        ! queue name=motion_queue leaky=downstream max-size-buffers=1
+        ! videorate drop-only=true
+        ! video/x-raw,framerate={rate}/1
+        ! videoscale
+        ! videoconvert
+        ! video/x-raw,format=GRAY8,width={motion_width},height={motion_height}
+        ! appsink name=motion emit-signals=true sync=false max-buffers=1 drop=true
+        """.format(source=source_description(source, name="source"),
+                   width=WIDTH, height=HEIGHT,
+                   encoder=encoder_description(profile, bitrate, gop),
+                   rate=MOTION_RATE, motion_width=MOTION_WIDTH,
+                   motion_height=MOTION_HEIGHT)
+
+
+class PreRoll(object):
+    """
+    The last seconds of encoded buffers. Trimmed only at keyframes, so the
+    oldest buffer is always a keyframe and may hold a little more than
+    seconds of video.
+    """
+
+    def __init__(self, seconds):
+        self.duration = int(seconds * Gst.SECOND)
+        self.buffers = collections.deque()  # (buffer, is keyframe)
+
+    def add(self, buffer):
+        keyframe = not buffer.has_flags(Gst.BufferFlags.DELTA_UNIT)
+        if not self.buffers and not keyframe:
+            return  # Wait for the first keyframe.
+        self.buffers.append((buffer, keyframe))
+
+        # Drop up to the newest keyframe that is older than the duration.
+        limit = buffer.pts - self.duration
+        cut = 0
+        for index, (old, old_keyframe) in enumerate(self.buffers):
+            if old.pts > limit:
+                break
+            if old_keyframe:
+                cut = index
+        for count in range(cut):
+            self.buffers.popleft()
+
+    def take(self):
+        'Return and empty the buffers.'
+        buffers = [buffer for buffer, keyframe in self.buffers]
+        self.buffers.clear()
+        return buffers
+
+
+class MotionDetector(object):
+    'Compare each small GRAY8 frame with the one before.'
+
+    def __init__(self, pixel_threshold=PIXEL_THRESHOLD,
+                 fraction=MOTION_FRACTION):
+        self.pixel_threshold = pixel_threshold
+        self.fraction = fraction
+        self.previous = None
+
+    def changed(self, data):
+        'Fraction of the pixels that changed since the last frame.'
+        if numpy is not None:
+            frame = numpy.frombuffer(data, dtype=numpy.uint8).astype(
+                    numpy.int16)
+            if self.previous is None or len(self.previous) != len(frame):
+                self.previous = frame
+                return 0.0
+            changed = numpy.count_nonzero(
+                    numpy.abs(frame - self.previous) > self.pixel_threshold)
+        else:
+            frame = bytes(data)
+            if self.previous is None or len(self.previous) != len(frame):
+                self.previous = frame
+                return 0.0
+            threshold = self.pixel_threshold
+            changed = sum(1 for new, old in zip(frame, self.previous)
+                          if abs(new - old) > threshold)
+        self.previous = frame
+        return changed / len(frame)
+
+    def motion(self, data):
+        return self.changed(data) > self.fraction
+
+
+class Recording(object):
+    'appsrc ! splitmuxsink writing the pushed encoded buffers to files.'
+
+    def __init__(self, caps, location, profile="h264",
+                 segment_secs=SEGMENT_SECS):
+        muxer, extension = MUXERS[profile]
+        self.pipeline = Gst.parse_launch("""
+            appsrc name=src format=time is-live=true
+            ! queue
+            ! splitmuxsink location={location} muxer-factory={muxer}
+                max-size-time={max_time}
+            """.format(location=location, muxer=muxer,
+                       max_time=segment_secs * Gst.SECOND))
+        self.appsrc = self.pipeline.get_by_name("src")
+        self.appsrc.set_property("caps", caps)
+        self.offset = None  # Running time of the first buffer.
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::eos", self.on_eos)
+        bus.connect("message::error", self.on_error)
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def push(self, buffer):
+        'Push the buffer, its times moved so that the first starts at zero.'
+        if self.offset is None:
+            times = [stamp for stamp in (buffer.pts, buffer.dts)
+                     if stamp != Gst.CLOCK_TIME_NONE]
+            self.offset = min(times) if times else 0
+        buffer = buffer.copy()
+        if buffer.pts != Gst.CLOCK_TIME_NONE:
+            buffer.pts = max(0, buffer.pts - self.offset)
+        if buffer.dts != Gst.CLOCK_TIME_NONE:
+            buffer.dts = max(0, buffer.dts - self.offset)
+        self.appsrc.emit("push-buffer", buffer)
+
+    def finish(self):
+        'End the stream. The files are closed when the EOS reaches the sink.'
+        self.appsrc.emit("end-of-stream")
+
+    def wait(self, timeout=5):
+        'Wait for the files to be closed, when there is no main loop.'
+        self.pipeline.get_bus().timed_pop_filtered(
+                timeout * Gst.SECOND,
+                Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        self.pipeline.set_state(Gst.State.NULL)
+
+    def on_eos(self, bus, message):
+        self.pipeline.set_state(Gst.State.NULL)
+        bus.remove_signal_watch()
+
+    def on_error(self, bus, message):
+        err, debug = message.parse_error()
+        print("Recording error: {}:\n{}".format(err, debug))
+        self.on_eos(bus, message)
+
+
+class MotionRecorder(object):
+    'Keep the pre-roll, watch for motion and record while it lasts.'
+
+    def __init__(self, pipeline, profile="h264", preroll=PREROLL_SECS,
+                 still=STILL_SECS, segment=SEGMENT_SECS, directory="."):
+        self.pipeline = pipeline
+        self.profile = profile
+        self.still = still
+        self.segment = segment
+        self.directory = directory
+        self.extension = MUXERS[profile][1]
+        self.files = 0
+        self.preroll = PreRoll(preroll)
+        self.detector = MotionDetector()
+        self.lock = threading.Lock()
+        self.caps = None
+        self.recording = None
+        self.last_motion = 0
+        self.on_motion = None  # Optional callback, for --test.
+
+        pipeline.get_by_name("encoded").connect("new-sample", self.on_encoded)
+        pipeline.get_by_name("motion").connect("new-sample", self.on_motion_frame)
+        GLib.timeout_add(500, self.check_still)
+
+    def on_encoded(self, appsink):
+        'Streaming thread. Add to the pre-roll, or to the recording.'
+        sample = appsink.emit("pull-sample")
+        buffer = sample.get_buffer()
+        with self.lock:
+            self.caps = sample.get_caps()
+            if self.recording is not None:
+                self.recording.push(buffer)
+            else:
+                self.preroll.add(buffer)
+        return Gst.FlowReturn.OK
+
+    def on_motion_frame(self, appsink):
+        'Streaming thread. Compare the frame with the last one.'
+        buffer = appsink.emit("pull-sample").get_buffer()
+        ok, info = buffer.map(Gst.MapFlags.READ)
+        if not ok:
+            return Gst.FlowReturn.OK
+        try:
+            motion = self.detector.motion(info.data)
+        finally:
+            buffer.unmap(info)
+        if motion:
+            self.last_motion = time.time()
+            if self.recording is None:
+                GLib.idle_add(self.start_recording)
+            if self.on_motion is not None:
+                self.on_motion()
+        return Gst.FlowReturn.OK
+
+    def start_recording(self):
+        with self.lock:
+            if self.recording is not None or self.caps is None:
+                return False
+            location = os.path.join(self.directory, "motion-{:03d}-%05d.{}"
+                                    .format(self.files, self.extension))
+            self.files += 1
+            self.recording = Recording(self.caps, location, self.profile,
+                                       self.segment)
+            preroll = self.preroll.take()
+            for buffer in preroll:
+                self.recording.push(buffer)
+        print("Motion. Recording {} with {} buffers of pre-roll".format(
+                location, len(preroll)))
+        return False
+
+    def check_still(self):
+        'Stop the recording after still seconds without motion.'
+        with self.lock:
+            if (self.recording is not None
+                    and time.time() - self.last_motion > self.still):
+                self.recording.finish()
+                self.recording = None
+                print("Still. Recording stopped")
+        return True
+
+    def stop(self):
+        'Finish any recording, after the main loop has stopped.'
+        with self.lock:
+            recording, self.recording = self.recording, None
+        if recording is not None:
+            recording.finish()
+            recording.wait()
+
+
+class MotionTest(object):
+    """
+    Switch videotestsrc between black and a moving ball every period secs.
+    Collect the delay from each switch to the ball until motion is detected.
+    """
+
+    def __init__(self, pipeline, recorder, period=10):
+        self.source = pipeline.get_by_name("source")
+        Gst.util_set_object_arg(self.source, "pattern", "black")
+        self.moving = False
+        self.moving_since = None
+        self.delays = []
+        recorder.on_motion = self.on_motion
+        GLib.timeout_add_seconds(period, self.switch)
+
+    def switch(self):
+        self.moving = not self.moving
+        Gst.util_set_object_arg(self.source, "pattern",
+                                "ball" if self.moving else "black")
+        self.moving_since = time.time() if self.moving else None
+        return True
+
+    def on_motion(self):
+        since = self.moving_since
+        if since is not None:
+            self.delays.append(time.time() - since)
+            self.moving_since = None
+
+    def report(self):
+        if self.delays:
+            print("Motion detected {} times. Delay mean {:.0f} ms, "
+                  "max {:.0f} ms".format(
+                          len(self.delays),
+                          1000 * sum(self.delays) / len(self.delays),
+                          1000 * max(self.delays)))
+        else:
+            print("No motion detected")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Record the camera when something moves.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE,
+                        help="/dev/videoN, test, test:<pattern>, a file "
+                             "or a uri. Default {}".format(DEFAULT_SOURCE))
+    parser.add_argument("--profile", default="h264", choices=sorted(MUXERS))
+    parser.add_argument("--bitrate", type=int, default=1000,
+                        help="kbit/sec.")
+    parser.add_argument("--preroll", type=int, default=PREROLL_SECS,
+                        help="Seconds kept before the motion.")
+    parser.add_argument("--still", type=int, default=STILL_SECS,
+                        help="Seconds without motion to stop recording.")
+    parser.add_argument("--segment", type=int, default=SEGMENT_SECS,
+                        help="Maximum seconds in each file.")
+    parser.add_argument("--directory", default=".")
+    parser.add_argument("--test", action="store_true",
+                        help="Measure with a synthetic moving videotestsrc.")
+    parser.add_argument("--seconds", type=int, default=0,
+                        help="Stop after N seconds. 0 runs until Ctrl-C.")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    source = "test" if args.test else args.source
+    pipeline = Gst.parse_launch(motion_description(source, args.profile,
+                                                   args.bitrate))
+    recorder = MotionRecorder(pipeline, args.profile, args.preroll,
+                              args.still, args.segment, args.directory)
+    test = MotionTest(pipeline, recorder) if args.test else None
+
+    cpu = BranchCpu()
+    cpu.watch("capture", pipeline.get_by_name("split").get_static_pad("sink"))
+    cpu.watch("encoder", pipeline.get_by_name("encoder_queue")
+              .get_static_pad("src"))
+    cpu.watch("motion", pipeline.get_by_name("motion_queue")
+              .get_static_pad("src"))
+
+    loop = GLib.MainLoop()
+
+    def on_error(bus, message):
+        err, debug = message.parse_error()
+        print("Error: {}:\n{}".format(err, debug))
+        loop.quit()
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message::error", on_error)
+    bus.connect("message::eos", lambda bus, message: loop.quit())
+
+    if args.seconds > 0:
+        GLib.timeout_add_seconds(args.seconds, loop.quit)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    start = time.time()
+    process_start = time.process_time()
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print('\n Stopped via Ctrl-C')
+    finally:
+        elapsed = max(time.time() - start, 0.001)
+        usage = cpu.totals()
+        recorder.stop()
+        pipeline.set_state(Gst.State.NULL)
+
+    if test is not None:
+        test.report()
+    print("CPU % of one core: process {:.1f}  {}".format(
+            100 * (time.process_time() - process_start) / elapsed,
+            "  ".join("{} {:.1f}".format(name, 100 * seconds / elapsed)
+                      for name, seconds in sorted(usage.items()))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+#
+# camera_overlay.py
+#
+# Text overlays for the camera pipelines, rendered only when they change.
+#
+# clockoverlay lays out and renders its text with Pango for every frame,
+# though the time only changes once a second. In the "cached" mode each
+# text is a gdkpixbufoverlay. A pad probe checks the text of each frame,
+# which costs a strftime(), and only when it has changed is the text drawn
+# with Pango and cairo into a new GdkPixbuf. gdkpixbufoverlay keeps the
+# converted pixbuf and just blends it onto each frame.
+#
+#   pango    clockoverlay shaded-background=true font-desc="Sans 16"
+#   cached   gdkpixbufoverlay for the clock, and one more for each --text.
+#   none     No overlay.
+#
+# Use overlay_description() in the pipeline text, and attach_overlay() after
+# Gst.parse_launch(). Measure the CPU saved:
+# $ python3 camera_overlay.py --benchmark --width 1920 --height 1080
+#
+import sys, os
+import time
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+OVERLAY_MODES = ("pango", "cached", "none")
+DEFAULT_OVERLAY = "pango"
+FONT = "Sans 16"
+CLOCK_FORMAT = "%H:%M:%S"
+PADDING = 4
+
+
+def clock_text():
+    return time.strftime(CLOCK_FORMAT)
+
+
+def overlay_description(mode=DEFAULT_OVERLAY, texts=(), name="overlay"):
+    """
+    The gst-launch text of the overlay, ending in "! " ready for the next
+    element. Each of texts is a further, fixed, line of text.
+    """
+    if mode == "pango":
+        description = ('clockoverlay shaded-background=true font-desc="{}" ! '
+                       .format(FONT))
+        for text in texts:
+            description += ('textoverlay shaded-background=true '
+                            'valignment=bottom font-desc="{}" text="{}" ! '
+                            .format(FONT, text))
+        return description
+    if mode == "cached":
+        return "".join("gdkpixbufoverlay name={}{} ! ".format(name, index)
+                       for index in range(1 + len(texts)))
+    return ""
+
+
+def render_text(text, font=FONT):
+    'Draw the text, on a shaded background, into a new GdkPixbuf.'
+    gi.require_version('Gdk', '3.0')
+    gi.require_version('Pango', '1.0')
+    gi.require_version('PangoCairo', '1.0')
+    from gi.repository import Gdk, Pango, PangoCairo
+    import cairo
+
+    # Measure the text, then draw it on a surface of that size.
+    scratch = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+    layout = PangoCairo.create_layout(scratch)
+    layout.set_font_description(Pango.FontDescription.from_string(font))
+    layout.set_text(text, -1)
+    width, height = layout.get_pixel_size()
+    width += 2 * PADDING
+    height += 2 * PADDING
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    context = cairo.Context(surface)
+    context.set_source_rgba(0, 0, 0, 0.5)
+    context.paint()
+    context.set_source_rgb(1, 1, 1)
+    context.move_to(PADDING, PADDING)
+    layout = PangoCairo.create_layout(context)
+    layout.set_font_description(Pango.FontDescription.from_string(font))
+    layout.set_text(text, -1)
+    PangoCairo.show_layout(context, layout)
+    surface.flush()
+    return Gdk.pixbuf_get_from_surface(surface, 0, 0, width, height)
+
+
+class CachedOverlay(object):
+    """
+    Keep the gdkpixbufoverlay elements of overlay_description("cached")
+    up to date. Each item is (text or function returning the text, x, y).
+    The first is the clock.
+    """
+
+    def __init__(self, elements, items, font=FONT):
+        self.font = font
+        self.items = []
+        self.renders = 0
+        for element, (text, x, y) in zip(elements, items):
+            element.set_property("offset-x", x)
+            element.set_property("offset-y", y)
+            self.items.append({"element": element, "text": text,
+                               "shown": None})
+        # Check the texts as each frame reaches the first overlay.
+        elements[0].get_static_pad("sink").add_probe(
+                Gst.PadProbeType.BUFFER, self.on_frame)
+
+    def on_frame(self, pad, info):
+        for item in self.items:
+            text = item["text"]() if callable(item["text"]) else item["text"]
+            if text != item["shown"]:
+                item["element"].set_property("pixbuf",
+                                             render_text(text, self.font))
+                item["shown"] = text
+                self.renders += 1
+        return Gst.PadProbeReturn.OK
+
+
+def attach_overlay(pipeline, texts=(), name="overlay", font=FONT):
+    """
+    Start a CachedOverlay on the elements of overlay_description("cached").
+    The clock is at the top left and the texts below the clock.
+    Returns None if the pipeline has no cached overlay.
+    """
+    elements = []
+    while pipeline.get_by_name("{}{}".format(name, len(elements))):
+        elements.append(pipeline.get_by_name(
+                "{}{}".format(name, len(elements))))
+    if not elements:
+        return None
+    items = [(clock_text, PADDING, PADDING)]
+    for index, text in enumerate(texts):
+        items.append((text, PADDING, PADDING + (index + 1) * 40))
+    return CachedOverlay(elements, items, font)
+
+
+def benchmark(frames, width, height, texts):
+    'CPU seconds for frames with each overlay mode, at the given size.'
+    results = {}
+    for mode in OVERLAY_MODES:
+        pipeline = Gst.parse_launch("""
+            videotestsrc num-buffers={frames} pattern=ball
+            ! video/x-raw,format=I420,width={width},height={height},framerate=30/1
+            ! {overlay}fakesink sync=false
+            """.format(frames=frames, width=width, height=height,
+                       overlay=overlay_description(mode, texts)))
+        overlay = attach_overlay(pipeline, texts)
+        start_cpu = time.process_time()
+        start = time.time()
+        pipeline.set_state(Gst.State.PLAYING)
+        pipeline.get_bus().timed_pop_filtered(
+                Gst.CLOCK_TIME_NONE,
+                Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        pipeline.set_state(Gst.State.NULL)
+        results[mode] = {
+                "cpu": time.process_time() - start_cpu,
+                "seconds": time.time() - start,
+                "renders": overlay.renders if overlay else 0}
+
+    print("{} frames of {}x{}, {} overlays".format(frames, width, height,
+                                                   1 + len(texts)))
+    for mode in OVERLAY_MODES:
+        result = results[mode]
+        print("{:7} {:8.3f} ms CPU/frame  {:6.1f} frames/sec  renders {}"
+              .format(mode, 1000 * result["cpu"] / frames,
+                      frames / result["seconds"], result["renders"]))
+    # CPU of the overlay alone, less that of the source and sink.
+    pango = results["pango"]["cpu"] - results["none"]["cpu"]
+    cached = results["cached"]["cpu"] - results["none"]["cpu"]
+    print("Overlay CPU/frame: pango {:.3f} ms, cached {:.3f} ms. "
+          "At 30 frames/sec the cached overlay saves {:.1f}% of a core."
+          .format(1000 * pango / frames, 1000 * cached / frames,
+                  100 * 30 * (pango - cached) / frames))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Compare clockoverlay with a cached overlay.")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--text", action="append", default=[],
+                        help="Another line of text. May be repeated.")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    if args.benchmark:
+        benchmark(args.frames, args.width, args.height, args.text)
+    else:
+        parser.print_help()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+#
+# camera_profiles.py
+#
+# Encode profiles and transports for the camera programs.
+#
+# camera_browser.py was hardwired to Theora in Ogg. Theora is slow to
+# encode, adds latency, and few browsers still play it. A profile selects
+# the encoder and the container. Each one may be set for bitrate (kbit/sec),
+# GOP (frames between keyframes) and encoder threads where the encoder
+# supports them:
+#
+#   mjpeg   jpegenc ! multipartmux       Lowest latency. Every frame a JPEG.
+#   vp8     vp8enc deadline=1 ! webmmux  Low latency WebM for browsers.
+#   h264    x264enc tune=zerolatency     Best compression. Over RTP, or in
+#           ! matroskamux                Matroska over HTTP.
+#   theora  theoraenc ! oggmux           The original profile.
+#
+# The transport is either "http", to multisocketsink and fanout.py, or "rtp"
+# to a udpsink. receiver_description() returns the matching pipeline text to
+# receive and decode the stream, as used by camera_latency.py.
+#
+import sys, os
+
+DEFAULT_PROFILE = "theora"
+DEFAULT_BITRATE = 1000  # kbit/sec
+DEFAULT_GOP = 30  # frames
+DEFAULT_THREADS = 0  # 0 lets the encoder choose
+
+PROFILES = {
+        "mjpeg": {
+                "encoder": "jpegenc quality=85",
+                "mux": "multipartmux boundary=frame",
+                "content_type": "multipart/x-mixed-replace; boundary=frame",
+                "pay": "rtpjpegpay",
+                "depay": "rtpjpegdepay",
+                "rtp_caps": "encoding-name=JPEG,payload=26",
+                },
+        "vp8": {
+                "encoder": "vp8enc deadline=1 cpu-used=8 end-usage=cbr "
+                           "lag-in-frames=0 target-bitrate={bitrate_bps} "
+                           "keyframe-max-dist={gop} threads={threads}",
+                "mux": "webmmux streamable=true",
+                "content_type": "video/webm",
+                "pay": "rtpvp8pay",
+                "depay": "rtpvp8depay",
+                "rtp_caps": "encoding-name=VP8,payload=96",
+                },
+        "h264": {
+                "encoder": "x264enc tune=zerolatency speed-preset=ultrafast "
+                           "bitrate={bitrate} key-int-max={gop} "
+                           "threads={threads} "
+                           "! video/x-h264,profile=constrained-baseline "
+                           "! h264parse config-interval=-1",
+                "mux": "matroskamux streamable=true",
+                "content_type": "video/x-matroska",
+                "pay": "rtph264pay config-interval=-1",
+                "depay": "rtph264depay",
+                "rtp_caps": "encoding-name=H264,payload=96",
+                },
+        "theora": {
+                "encoder": "theoraenc bitrate={bitrate} keyframe-freq={gop}",
+                "mux": "oggmux",
+                "content_type": "video/ogg",
+                # Theora over RTP needs its configuration sent out of band.
+                "pay": None,
+                },
+        }
+
+
+def encoder_description(profile=DEFAULT_PROFILE, bitrate=DEFAULT_BITRATE,
+                        gop=DEFAULT_GOP, threads=DEFAULT_THREADS):
+    'Return the gst-launch text of the encoder of the profile.'
+    return PROFILES[profile]["encoder"].format(bitrate=bitrate,
+                                               bitrate_bps=bitrate * 1000,
+                                               gop=gop, threads=threads)
+
+
+def sender_description(profile=DEFAULT_PROFILE, transport="http",
+                       host="127.0.0.1", port=8080, sink_name="viewers",
+                       **encoder_options):
+    """
+    Return the gst-launch text from the encoder to the sink. For http the
+    sink is a multisocketsink called sink_name, to be given to fanout.py.
+    For rtp it is a udpsink, called sink_name, sending to host and port.
+    For null it is a fakesink that discards the stream, for benchmarks.
+    """
+    settings = PROFILES[profile]
+    encoder = encoder_description(profile, **encoder_options)
+    if transport == "http":
+        return "{} ! {} ! multisocketsink name={}".format(
+                encoder, settings["mux"], sink_name)
+    if transport == "null":
+        return "{} ! {} ! fakesink name={} sync=false".format(
+                encoder, settings["mux"], sink_name)
+    if transport == "rtp":
+        if settings["pay"] is None:
+            raise ValueError("The {} profile can not be sent over RTP"
+                             .format(profile))
+        return ("{} ! {} ! udpsink name={} host={} port={} sync=false "
+                "async=false".format(encoder, settings["pay"], sink_name,
+                                     host, port))
+    raise ValueError("Unknown transport {}".format(transport))
+
+
+def receiver_description(profile=DEFAULT_PROFILE, transport="http",
+                         host="127.0.0.1", port=8080, path="/"):
+    'Return the gst-launch text to receive the stream, up to decodebin.'
+    settings = PROFILES[profile]
+    if transport == "http":
+        return ("souphttpsrc location=http://{}:{}{} is-live=true "
+                "! decodebin".format(host, port, path))
+    return ("udpsrc port={} caps=\"application/x-rtp,media=video,"
+            "clock-rate=90000,{}\" ! {} ! decodebin".format(
+                    port, settings["rtp_caps"], settings["depay"]))
+
+
+def add_profile_arguments(parser):
+    'Add the --profile, --bitrate, --gop and --threads options to argparse.'
+    parser.add_argument("--profile", default=DEFAULT_PROFILE,
+                        choices=sorted(PROFILES),
+                        help="Encoder and container. Default {}"
+                             .format(DEFAULT_PROFILE))
+    add_encoder_arguments(parser)
+
+
+def add_encoder_arguments(parser):
+    'Add the --bitrate, --gop and --threads options to argparse.'
+    parser.add_argument("--bitrate", type=int, default=DEFAULT_BITRATE,
+                        help="kbit/sec. Not used by mjpeg.")
+    parser.add_argument("--gop", type=int, default=DEFAULT_GOP,
+                        help="Frames between keyframes.")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS,
+                        help="Encoder threads, vp8 and h264. 0 is auto.")
+
+
+def encoder_options(args):
+    'The encoder options from the parsed argparse arguments.'
+    return {"bitrate": args.bitrate, "gop": args.gop,
+            "threads": args.threads}
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+#
+# camera_renditions.py
+#
+# Capture the camera once and serve it at several sizes and frame rates.
+#
+# camera_local.py and camera_browser.py each open the camera and scale it
+# for themselves. Here one capture is converted, time stamped by
+# clockoverlay and teed into renditions. Each rendition has its own leaky
+# queue, so a slow encoder drops its own frames rather than holding up the
+# others. videorate drops frames before videoscale, so a 5 frames/sec
+# thumbnail only scales 5 frames a second.
+#
+#   http://127.0.0.1:8080/thumb  160x120 at 5 frames/sec
+#   http://127.0.0.1:8080/sd     640x360 at 15 frames/sec
+#   http://127.0.0.1:8080/hd     1280x720 at 30 frames/sec
+#   http://127.0.0.1:8080/auto   Starts at sd. Moves down when the viewer
+#                                falls behind and up when it keeps up.
+#   http://127.0.0.1:8080/cpu    CPU % of the capture and each rendition.
+#
+# /auto is only available with the mjpeg profile, where every part of the
+# multipart stream is a complete JPEG, so a viewer can be moved between
+# renditions at any frame. The containers of the other profiles can not be
+# joined part way through.
+#
+# $ python3 camera_renditions.py --source test --report 5
+#
+import sys, os
+import json
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from camera_source import source_description, DEFAULT_SOURCE
+from camera_profiles import PROFILES, encoder_description
+from fanout import FanoutServer
+from pipeline_stats import BranchCpu
+
+HOST = "127.0.0.1"
+PORT = 8080
+
+# name, width, height, frames/sec, kbit/sec. Smallest first.
+RENDITIONS = [
+        ("thumb", 160, 120, 5, 200),
+        ("sd", 640, 360, 15, 1000),
+        ("hd", 1280, 720, 30, 3000),
+        ]
+AUTO_START = "sd"
+# A viewer more than DOWN_LAG secs behind is moved down a rendition. One
+# less than UP_LAG secs behind for UP_CHECKS checks in a row is moved up.
+CHECK_SECS = 1
+DOWN_LAG = 0.5
+UP_LAG = 0.05
+UP_CHECKS = 5
+
+
+def renditions_description(source=DEFAULT_SOURCE, profile="mjpeg",
+                           threads=0):
+    'The gst-launch text of the capture and its teed renditions.'
+    # Capture at the size of the largest rendition.
+    width, height = RENDITIONS[-1][1:3]
+    description = """
+        {source}
+        ! videoconvert
+        ! videoscale
+        ! video/x-raw,format=I420,width={width},height={height}
+        ! clockoverlay shaded-background=true font-desc="Sans 16"
+        ! tee name=capture
+        """.format(source=source_description(source),
+                   width=width, height=height)
+
+    for name, width, height, rate, bitrate in RENDITIONS:
+        description += """
+            capture.
+            ! queue name={name}_queue max-size-buffers=2 leaky=downstream
+            ! videorate drop-only=true
+            ! video/x-raw,framerate={rate}/1
+            ! videoscale
+            ! video/x-raw,width={width},height={height}
+            ! {encoder}
+            ! {mux}
+            ! multisocketsink name={name}
+            """.format(name=name, rate=rate, width=width, height=height,
+                       encoder=encoder_description(profile, bitrate, rate,
+                                                   threads),
+                       mux=PROFILES[profile]["mux"])
+    return description
+
+
+class RenditionServer(object):
+    'Serve each rendition, and /auto for mjpeg, with fanout.py.'
+
+    def __init__(self, pipeline, profile="mjpeg", host=HOST, port=PORT):
+        self.server = FanoutServer(host, port)
+        self.names = [rendition[0] for rendition in RENDITIONS]
+        self.streams = {}
+        content_type = PROFILES[profile]["content_type"]
+        for name, width, height, rate, bitrate in RENDITIONS:
+            # Hold about 2 secs of each rendition for each viewer.
+            self.streams[name] = self.server.add_stream(
+                    "/" + name, pipeline.get_by_name(name), content_type,
+                    soft_max=bitrate * 1000 // 8,
+                    hard_max=bitrate * 1000 // 4,
+                    recover_policy="keyframe",
+                    sync_method="burst-keyframe")
+
+        self.cpu = BranchCpu()
+        # The capture, conversion and clockoverlay run in the source's thread.
+        self.cpu.watch("capture", pipeline.get_by_name("capture")
+                       .get_static_pad("sink"))
+        for name in self.names:
+            self.cpu.watch(name, pipeline.get_by_name(name + "_queue")
+                           .get_static_pad("src"))
+        self.cpu_percent = {}
+        self.server.add_handler("/cpu", self._cpu)
+
+        if profile == "mjpeg":
+            self.server.add_route("/auto", self._auto)
+            GLib.timeout_add_seconds(CHECK_SECS, self.check_auto)
+
+    def _auto(self):
+        return "/" + AUTO_START, {"auto": True, "steady": 0, "dropped": 0}
+
+    def _cpu(self):
+        return "application/json", json.dumps(self.cpu_percent).encode()
+
+    def check_auto(self):
+        'Move each /auto viewer down, or up, a rendition by its lag.'
+        for index, name in enumerate(self.names):
+            stream = self.streams[name]
+            for client in stream.metrics()["clients"]:
+                info = stream.clients.get(client["fd"])
+                if info is None or not info.get("auto"):
+                    continue
+                dropped = client["dropped_buffers"] > info["dropped"]
+                info["dropped"] = client["dropped_buffers"]
+                if (client["lag_secs"] > DOWN_LAG or dropped) and index > 0:
+                    self.move(stream, client, info, self.names[index - 1])
+                elif client["lag_secs"] < UP_LAG:
+                    info["steady"] += 1
+                    if (info["steady"] >= UP_CHECKS
+                            and index < len(self.names) - 1):
+                        self.move(stream, client, info, self.names[index + 1])
+                else:
+                    info["steady"] = 0
+        return True
+
+    def move(self, stream, client, info, name):
+        info["steady"] = 0
+        info["dropped"] = 0
+        if stream.move(client["fd"], self.streams[name]):
+            print("Viewer {} moved to {}".format(client["address"], name))
+
+    def sample_cpu(self):
+        'Update the CPU % of the capture and each rendition.'
+        self.cpu_percent = self.cpu.sample()
+        return True
+
+    def report(self):
+        'One line per rendition of its CPU % and viewers.'
+        return "\n".join("{:8} cpu {:5}%  {}".format(
+                name, self.cpu_percent.get(name, "-"),
+                self.streams[name].report() if name in self.streams else "")
+                for name in ["capture"] + self.names)
+
+
+def print_report(renditions):
+    print(renditions.report())
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+            description="Serve one camera capture at several sizes.")
+    parser.add_argument("--source", default=DEFAULT_SOURCE,
+                        help="/dev/videoN, test, test:<pattern>, a file "
+                             "or a uri. Default {}".format(DEFAULT_SOURCE))
+    parser.add_argument("--profile", default="mjpeg",
+                        choices=sorted(PROFILES),
+                        help="Encoder and container. Only mjpeg has /auto.")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Encoder threads, vp8 and h264. 0 is auto.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--report", type=int, default=0,
+                        help="Print CPU and viewers every N seconds.")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    pipeline = Gst.parse_launch(renditions_description(
+            args.source, args.profile, args.threads))
+    renditions = RenditionServer(pipeline, args.profile, args.host,
+                                 args.port)
+    renditions.server.start()
+
+    loop = GLib.MainLoop()
+
+    def on_error(bus, message):
+        err, debug = message.parse_error()
+        print("Error: {}:\n{}".format(err, debug))
+        loop.quit()
+
+    bus = pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message::error", on_error)
+    bus.connect("message::eos", lambda bus, message: loop.quit())
+
+    GLib.timeout_add_seconds(1, renditions.sample_cpu)
+    if args.report > 0:
+        GLib.timeout_add_seconds(args.report, print_report, renditions)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        print('\n Stopped via Ctrl-C')
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+        renditions.server.stop()
+
+
+if __name__ == "__main__":
+    main()
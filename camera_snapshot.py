@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+#
+# camera_snapshot.py
+#
+# Still JPEG or PNG images from a camera pipeline that is already running.
+#
+# The camera can only be opened once, so a snapshot must come from the
+# pipeline that is streaming it. snapshot_branch() is a branch from a tee
+# to an appsink with max-buffers=1 drop=true. It holds the newest raw frame
+# and nothing else: there is no conversion or encoding while nobody asks.
+# A leaky queue means the branch can never hold up the stream.
+#
+# On a request the newest frame is pushed into a small encode pipeline,
+# appsrc ! videoconvert ! jpegenc ! appsink, which waits in PLAYING for the
+# next request. Snapshot.serve() adds these to a fanout.py server:
+#
+#   /snapshot.jpg    The newest frame as JPEG.
+#   /snapshot.png    The newest frame as PNG.
+#   /snapshot.json   Age of the last frame sent, and the time to encode it.
+#
+# The frame is at most one frame interval old when it is taken, and the
+# encode of a 400x400 frame takes a few milliseconds.
+#
+import sys, os
+import time
+import json
+import threading
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+ENCODERS = {
+        "jpeg": ("jpegenc quality=90", "image/jpeg"),
+        "png": ("pngenc", "image/png"),
+        }
+
+
+def snapshot_branch(tee, name="snapshot"):
+    'The gst-launch text of a branch from the named tee to the snapshot.'
+    return """
+        {tee}.
+        ! queue leaky=downstream max-size-buffers=1
+        ! appsink name={name} max-buffers=1 drop=true sync=false
+        """.format(tee=tee, name=name)
+
+
+class Encoder(object):
+    'appsrc ! videoconvert ! encoder ! appsink, idle until encode().'
+
+    def __init__(self, encoder):
+        self.pipeline = Gst.parse_launch("""
+            appsrc name=raw format=time
+            ! videoconvert
+            ! {}
+            ! appsink name=encoded max-buffers=1 drop=true sync=false
+            """.format(encoder))
+        self.appsrc = self.pipeline.get_by_name("raw")
+        self.appsink = self.pipeline.get_by_name("encoded")
+        self.lock = threading.Lock()
+        self.caps = None
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def encode(self, sample, timeout=1):
+        'Encode the raw sample. Return the bytes, or None on a timeout.'
+        with self.lock:
+            caps = sample.get_caps()
+            if self.caps is None or not caps.is_equal(self.caps):
+                self.appsrc.set_property("caps", caps)
+                self.caps = caps
+            # Drop an image that came after an earlier request timed out.
+            while self.appsink.emit("try-pull-sample", 0) is not None:
+                pass
+            self.appsrc.emit("push-buffer", sample.get_buffer())
+            encoded = self.appsink.emit("try-pull-sample",
+                                        timeout * Gst.SECOND)
+            if encoded is None:
+                return None
+            buffer = encoded.get_buffer()
+            return buffer.extract_dup(0, buffer.get_size())
+
+    def close(self):
+        self.pipeline.set_state(Gst.State.NULL)
+
+
+class Snapshot(object):
+    'The newest frame of the camera pipeline, encoded when asked for.'
+
+    def __init__(self, pipeline, name="snapshot"):
+        self.pipeline = pipeline
+        self.appsink = pipeline.get_by_name(name)
+        self.sample = None
+        self.lock = threading.Lock()
+        self.encoders = {}
+        self.encoders_lock = threading.Lock()
+        self.stats = {}
+
+    def latest(self):
+        'The newest raw sample, or the last one if no new frame has come.'
+        with self.lock:
+            sample = self.appsink.emit("try-pull-sample", 0)
+            if sample is not None:
+                self.sample = sample
+            return self.sample
+
+    def age(self, sample):
+        'Seconds since the frame passed the pipeline clock time, or None.'
+        clock = self.pipeline.get_clock()
+        pts = sample.get_buffer().pts
+        if clock is None or pts == Gst.CLOCK_TIME_NONE:
+            return None
+        segment = sample.get_segment()
+        running = segment.to_running_time(Gst.Format.TIME, pts)
+        now = clock.get_time() - self.pipeline.get_base_time()
+        return max(0, now - running) / Gst.SECOND
+
+    def encode(self, format="jpeg"):
+        'Return (content type, bytes) of the newest frame.'
+        sample = self.latest()
+        if sample is None:
+            raise RuntimeError("No frame yet")
+        # Requests come on the server threads. Make one encoder per format.
+        with self.encoders_lock:
+            if format not in self.encoders:
+                self.encoders[format] = Encoder(ENCODERS[format][0])
+        start = time.perf_counter()
+        data = self.encoders[format].encode(sample)
+        if data is None:
+            raise RuntimeError("The {} encoder timed out".format(format))
+        age = self.age(sample)
+        self.stats = {"format": format,
+                      "bytes": len(data),
+                      "encode_ms": round(1000 * (time.perf_counter() - start),
+                                         2),
+                      "frame_age_ms": round(1000 * age, 2)
+                                      if age is not None else None}
+        return ENCODERS[format][1], data
+
+    def serve(self, server, path="/snapshot"):
+        'Add the snapshot handlers to a fanout.FanoutServer.'
+        server.add_handler(path + ".jpg", lambda: self.encode("jpeg"))
+        server.add_handler(path + ".png", lambda: self.encode("png"))
+        server.add_handler(path + ".json", lambda: (
+                "application/json", json.dumps(self.stats).encode()))
+
+    def close(self):
+        for encoder in self.encoders.values():
+            encoder.close()
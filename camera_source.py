@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+#
+# camera_source.py
+#
+# Pipeline text for the video source of the camera programs.
+#
+# The camera programs were written for the laptop webcam, /dev/video0. The
+# source may instead be another v4l2 device, a video file, an RTSP or HTTP
+# uri, or the GStreamer "videotestsrc" so the programs can be run on a
+# computer without a camera, such as a headless test server:
+#
+#   /dev/video0         v4l2src device=/dev/video0
+#   test                videotestsrc is-live=true
+#   test:ball           videotestsrc is-live=true pattern=ball
+#   rtsp://host/stream  uridecodebin uri=rtsp://host/stream
+#   movie.mp4           uridecodebin uri=file:///.../movie.mp4
+#
+import sys, os
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+DEFAULT_SOURCE = "/dev/video0"
+
+
+def source_description(source=DEFAULT_SOURCE, name=None):
+    """
+    Return the gst-launch text for the source. The optional name is given to
+    the source element, so it can be found with pipeline.get_by_name().
+    """
+    named = " name={}".format(name) if name else ""
+
+    if source == "test" or source.startswith("test:"):
+        pattern = source.partition(":")[2] or "smpte"
+        return "videotestsrc{} is-live=true pattern={}".format(named, pattern)
+
+    if source.startswith("/dev/"):
+        return "v4l2src{} device={}".format(named, source)
+
+    if "://" in source:
+        uri = source
+    else:
+        uri = Gst.filename_to_uri(os.path.abspath(source))
+    return "uridecodebin{} uri={} expose-all-streams=false caps=video/x-raw" \
+           .format(named, uri)
@@ -17,10 +17,9 @@
 import sys
 import os.path
 import time
-import gi
-gi.require_version('Gst', '1.0')
-gi.require_version('GObject', '2.0')
-from gi.repository import Gst, GObject
+
+# GStreamer is imported and initialized once, when first needed.
+from gst_boot import gst, glib, watch
 
 MESSAGE = "Hello world this is e speak talking to you."
 
@@ -35,8 +34,9 @@ def speak(message=MESSAGE):
     """
     start_time = time.time()
 
-    # Init
-    Gst.init(None)
+    # Init. Only the first call imports gi and calls Gst.init(None).
+    Gst = gst()
+    GLib = glib()
 
     # print(dir(Gst))
     # print(Gst._version)  # 1.0
@@ -81,9 +81,10 @@ def speak(message=MESSAGE):
                       )
 
     pipeline = Gst.parse_launch(pipeline_template)
+    watch(pipeline)
 
     # Instantiate and initialize the bus call-back 
-    loop = GObject.MainLoop()
+    loop = GLib.MainLoop()
 
     bus = pipeline.get_bus()
     bus.add_signal_watch()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# espeak_render.py
+#
+# Render espeak speech to files, as fast as the CPU allows.
+#
+# espeak.py speaks to autoaudiosink, which plays at the rate of the audio
+# clock, so making a prompt file takes as long as listening to it. Here the
+# espeak element goes to an encoder and a filesink, or an appsink, with
+# sync=false. Nothing waits for the clock:
+#
+#   espeak text="..." voice=en-gb rate=0 pitch=0
+#   ! audioconvert ! wavenc ! filesink location=prompt.wav sync=false
+#
+# A batch of jobs is spread across --processes processes, one pipeline at a
+# time in each. Each job reports the seconds of audio, the seconds taken to
+# render it, and the speed-up over realtime.
+#
+# One job:
+# $ python3 espeak_render.py "Please hold the line." --output hold.wav
+#
+# A batch, one JSON object per line with text, output and optionally voice,
+# rate and pitch:
+# $ python3 espeak_render.py --jobs prompts.jsonl --processes 4
+#
+# {"text": "Please hold the line.", "output": "hold.opus", "rate": -20}
+#
+import sys, os
+import time
+import json
+import argparse
+import multiprocessing
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+VOICE = "en-gb"
+# The encoder of each file extension, after the espeak element.
+ENCODERS = {
+        ".wav": "audioconvert ! wavenc",
+        ".opus": "audioconvert ! audioresample ! opusenc ! oggmux",
+        ".ogg": "audioconvert ! vorbisenc ! oggmux",
+        }
+
+
+def render_description(job, location=None):
+    """
+    The gst-launch text of one job. To a filesink at location, or an appsink
+    named "rendered" if location is None.
+    """
+    extension = os.path.splitext(location or job.get("output", ".wav"))[1]
+    if extension not in ENCODERS:
+        raise ValueError("{}: not one of {}".format(
+                extension, ", ".join(sorted(ENCODERS))))
+    if location is None:
+        sink = "appsink name=rendered sync=false"
+    else:
+        sink = 'filesink location="{}" sync=false'.format(location)
+    return """
+        espeak name=speech text="{text}" voice={voice} rate={rate}
+            pitch={pitch}
+        ! {encoder}
+        ! {sink}
+        """.format(text=job["text"].replace('"', "'"),
+                   voice=job.get("voice", VOICE),
+                   rate=job.get("rate", 0),
+                   pitch=job.get("pitch", 0),
+                   encoder=ENCODERS[extension],
+                   sink=sink)
+
+
+def render(job, location=None):
+    """
+    Render one job to location, or to memory if location is None. Return a
+    dictionary of the audio secs, render secs and speed-up, with the bytes
+    as "data" if rendered to memory.
+    """
+    pipeline = Gst.parse_launch(render_description(job, location))
+    # The end of the last buffer from espeak is the length of the audio.
+    end = [0]
+
+    def on_audio(pad, info):
+        buffer = info.get_buffer()
+        if buffer.pts != Gst.CLOCK_TIME_NONE and \
+                buffer.duration != Gst.CLOCK_TIME_NONE:
+            end[0] = max(end[0], buffer.pts + buffer.duration)
+        return Gst.PadProbeReturn.OK
+    pipeline.get_by_name("speech").get_static_pad("src").add_probe(
+            Gst.PadProbeType.BUFFER, on_audio)
+
+    def on_sample(appsink):
+        buffer = appsink.emit("pull-sample").get_buffer()
+        chunks.append(buffer.extract_dup(0, buffer.get_size()))
+        return Gst.FlowReturn.OK
+
+    appsink = pipeline.get_by_name("rendered")
+    if appsink is not None:
+        appsink.connect("new-sample", on_sample)
+        appsink.set_property("emit-signals", True)
+    chunks = []
+    start = time.perf_counter()
+    pipeline.set_state(Gst.State.PLAYING)
+    try:
+        message = pipeline.get_bus().timed_pop_filtered(
+                Gst.CLOCK_TIME_NONE,
+                Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+    elapsed = time.perf_counter() - start
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        raise RuntimeError("{}: {}".format(job["text"][:30], err))
+
+    audio = end[0] / Gst.SECOND
+    result = {"output": location,
+              "audio_secs": round(audio, 3),
+              "render_secs": round(elapsed, 3),
+              "speedup": round(audio / elapsed, 1) if elapsed else 0}
+    if location is None:
+        result["data"] = b"".join(chunks)
+    return result
+
+
+def render_job(job):
+    'Render a job to its output, in a worker process. Errors are returned.'
+    try:
+        return render(job, job["output"])
+    except (RuntimeError, ValueError, GLib.Error) as error:
+        # GLib.Error is from parse_launch(), e.g. if opusenc is missing.
+        return {"output": job["output"], "error": str(error)}
+
+
+def init_worker():
+    Gst.init(None)
+
+
+def render_batch(jobs, processes=None):
+    """
+    Render the jobs across processes, default one per core. Print each
+    result as it finishes, and return the results and the wall-clock secs.
+    """
+    start = time.perf_counter()
+    results = []
+    with multiprocessing.Pool(processes, initializer=init_worker) as pool:
+        for result in pool.imap_unordered(render_job, jobs):
+            print_result(result)
+            results.append(result)
+    return results, time.perf_counter() - start
+
+
+def print_result(result):
+    if "error" in result:
+        print("{output}: error: {error}".format(**result))
+    else:
+        print("{output}: {audio_secs:.2f} secs of audio in {render_secs:.3f} "
+              "secs, {speedup}x realtime".format(**result))
+
+
+def read_jobs(filename):
+    'The jobs of a JSON lines file, skipping blank lines.'
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Render espeak speech to files faster than realtime.")
+    parser.add_argument("text", nargs="?")
+    parser.add_argument("--output", default="espeak.wav",
+                        help="File of the text, ending in {}.".format(
+                                ", ".join(sorted(ENCODERS))))
+    parser.add_argument("--voice", default=VOICE)
+    parser.add_argument("--rate", type=int, default=0, help="-100 to 100.")
+    parser.add_argument("--pitch", type=int, default=0, help="-100 to 100.")
+    parser.add_argument("--jobs", help="JSON lines file of jobs.")
+    parser.add_argument("--processes", type=int,
+                        help="Jobs rendered at once. Default one per core.")
+    args = parser.parse_args()
+
+    if args.jobs:
+        jobs = read_jobs(args.jobs)
+    elif args.text:
+        jobs = [{"text": args.text, "output": args.output,
+                 "voice": args.voice, "rate": args.rate,
+                 "pitch": args.pitch}]
+    else:
+        parser.error("Give a text, or --jobs")
+
+    results, elapsed = render_batch(jobs, args.processes)
+    audio = sum(result.get("audio_secs", 0) for result in results)
+    print("{} jobs, {:.2f} secs of audio in {:.3f} secs, {:.1f}x realtime"
+          .format(len(jobs), audio, elapsed, audio / elapsed if elapsed else 0))
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+#
+# fanout.py
+#
+# A small HTTP front end for the GStreamer "multisocketsink" plugin.
+# Used by radio_server.py to serve one upstream stream to many clients.
+#
+# The HTTP request is read by Python. The response headers are sent, and
+# then the client's socket is handed to multisocketsink with its "add"
+# action signal. From then on GStreamer writes the stream to the client.
+#
+# multisocketsink keeps a separate queue of buffers for each client and
+# never blocks on one of them. A client that falls more than units-soft-max
+# behind is skipped forward by the recover-policy, and one that falls
+# units-max behind is dropped. Thus a slow client can not stall the others.
+#
+# GET /metrics returns JSON with the number of clients on each stream and,
+# for each client, the bytes sent, buffers dropped and how far it lags
+# behind the newest data.
+#
+# A route chooses the stream for a request when it is made, and a client
+# may later be moved to another stream with Stream.move(). This is only
+# sensible where every buffer stands alone, such as MJPEG in multipart.
+#
+import sys, os
+import time
+import json
+import threading
+import http.server
+
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('Gio', '2.0')
+from gi.repository import Gst, Gio
+
+# Per-client queue limits, in bytes, for multisocketsink.
+CLIENT_SOFT_MAX = 256 * 1024
+CLIENT_HARD_MAX = 1024 * 1024
+
+
+def configure_sink(sink, soft_max=CLIENT_SOFT_MAX, hard_max=CLIENT_HARD_MAX,
+                   recover_policy="latest", sync_method="burst"):
+    """
+    Set the per-client queue of a multisocketsink.
+    Lagging clients skip to the latest data, rather than stalling the sink.
+    New clients receive a burst so they can start playing at once.
+    For video use recover_policy="keyframe" and sync_method="burst-keyframe"
+    so clients skip, and start, at a keyframe.
+    """
+    sink.set_property("unit-format", Gst.Format.BYTES)
+    sink.set_property("units-soft-max", soft_max)
+    sink.set_property("units-max", hard_max)
+    # Enum properties set by their nick names.
+    Gst.util_set_object_arg(sink, "recover-policy", recover_policy)
+    Gst.util_set_object_arg(sink, "sync-method", sync_method)
+    sink.set_property("burst-format", Gst.Format.BYTES)
+    sink.set_property("burst-value", soft_max // 4)
+    # Don't hold up the pipeline waiting for a client. No clock sync either
+    # as the upstream source sets the pace.
+    sink.set_property("sync", False)
+    sink.set_property("async", False)
+
+
+class Stream(object):
+    'A multisocketsink, its content type and the clients attached to it.'
+
+    def __init__(self, sink, content_type):
+        self.sink = sink
+        self.content_type = content_type
+        self.clients = {}  # socket fd -> client info dictionary
+        self.lock = threading.Lock()
+        self.bytes_in = 0
+        self.start_time = time.time()
+
+        # Count the bytes arriving at the sink, to work out each client's lag.
+        sink.get_static_pad("sink").add_probe(
+                Gst.PadProbeType.BUFFER | Gst.PadProbeType.BUFFER_LIST,
+                self._count_bytes)
+        sink.connect("client-socket-removed", self._on_removed)
+
+    def _count_bytes(self, pad, info):
+        if info.type & Gst.PadProbeType.BUFFER_LIST:
+            buffer_list = info.get_buffer_list()
+            size = sum(buffer_list.get(i).get_size()
+                       for i in range(buffer_list.length()))
+        else:
+            size = info.get_buffer().get_size()
+        with self.lock:
+            self.bytes_in += size
+        return Gst.PadProbeReturn.OK
+
+    def add(self, fd, address, **info):
+        """
+        Hand a connected socket file descriptor to multisocketsink. Any info
+        is kept with the client, e.g. for a route to recognise it later.
+        """
+        gsocket = Gio.Socket.new_from_fd(fd)
+        gsocket.set_blocking(False)
+        info.update({"socket": gsocket,
+                     "address": "{}:{}".format(*address[:2]),
+                     "connected": time.time()})
+        self._attach(info)
+
+    def _attach(self, client):
+        with self.lock:
+            client["bytes_in_at_connect"] = self.bytes_in
+            self.clients[client["socket"].get_fd()] = client
+        self.sink.emit("add", client["socket"])
+
+    def move(self, fd, other):
+        """
+        Move a client to the other stream. Its queued data is sent first,
+        so it is moved between buffers.
+        """
+        with self.lock:
+            client = self.clients.get(fd)
+            if client is None or "move_to" in client:
+                return False
+            client["move_to"] = other
+        self.sink.emit("remove-flush", client["socket"])
+        return True
+
+    def _on_removed(self, sink, gsocket):
+        'multisocketsink has finished with a client. Close its socket.'
+        with self.lock:
+            client = self.clients.pop(gsocket.get_fd(), None)
+        if client is not None and "move_to" in client:
+            other = client.pop("move_to")
+            other._attach(client)
+        else:
+            gsocket.close()
+
+    def metrics(self):
+        'Return a dictionary of stream and per-client statistics.'
+        now = time.time()
+        with self.lock:
+            clients = list(self.clients.values())
+            bytes_in = self.bytes_in
+        # Average rate of the incoming stream, used to turn bytes into secs.
+        rate = bytes_in / max(now - self.start_time, 0.001)
+
+        report = []
+        for client in clients:
+            stats = self.sink.emit("get-stats", client["socket"])
+            if stats is None:
+                continue
+            bytes_sent = stats.get_uint64("bytes-sent")[1]
+            dropped = stats.get_uint64("dropped-buffers")[1]
+            # Bytes that arrived since the client connected, minus what it
+            # has been sent. A burst on connect can make this negative.
+            lag_bytes = max(0, bytes_in - client["bytes_in_at_connect"]
+                            - bytes_sent)
+            connected = max(now - client["connected"], 0.001)
+            report.append({
+                    "fd": client["socket"].get_fd(),
+                    "address": client["address"],
+                    "connected_secs": round(connected, 1),
+                    "bytes_sent": bytes_sent,
+                    "bytes_per_sec": int(bytes_sent / connected),
+                    "dropped_buffers": dropped,
+                    "lag_bytes": lag_bytes,
+                    "lag_secs": round(lag_bytes / rate, 3) if rate else 0,
+                    })
+
+        return {
+                "content_type": self.content_type,
+                "bytes_in": bytes_in,
+                "bytes_per_sec": int(rate),
+                "client_count": len(report),
+                "clients": report,
+                }
+
+    def report(self):
+        'One line summary of the clients, for printing on the console.'
+        metrics = self.metrics()
+        return "Clients: {}  {}".format(
+                metrics["client_count"],
+                ", ".join("{} {} kB/s lag {}s dropped {}".format(
+                        c["address"], c["bytes_per_sec"] // 1000,
+                        c["lag_secs"], c["dropped_buffers"])
+                        for c in metrics["clients"]))
+
+
+class FanoutServer(object):
+    """
+    HTTP server that hands each client to the multisocketsink of the
+    requested path. Paths are added with add_stream(). Other handlers, that
+    return (content_type, body) for a GET, are added with add_handler().
+    A handler may raise RuntimeError to send a 503 error instead.
+    Routes, that return (stream path, client info) for a GET, are added
+    with add_route(). Runs in its own thread so it does not block the GLib
+    main loop.
+    """
+
+    def __init__(self, host="127.0.0.1", port=8080):
+        self.host = host
+        self.port = port
+        self.streams = {}
+        self.handlers = {"/metrics": self._metrics}
+        self.routes = {}
+        self.httpd = None
+
+    def add_stream(self, path, sink, content_type, **options):
+        'Serve the multisocketsink at path. options go to configure_sink().'
+        configure_sink(sink, **options)
+        self.streams[path] = Stream(sink, content_type)
+        return self.streams[path]
+
+    def add_handler(self, path, handler):
+        self.handlers[path] = handler
+
+    def add_route(self, path, route):
+        self.routes[path] = route
+
+    def _metrics(self):
+        report = {path: stream.metrics()
+                  for path, stream in self.streams.items()}
+        return "application/json", json.dumps(report, indent=2).encode()
+
+    def start(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                info = {}
+                if path in server.routes:
+                    path, info = server.routes[path]()
+                if path in server.streams:
+                    stream = server.streams[path]
+                    self.send_response(200)
+                    self.send_header("Content-Type", stream.content_type)
+                    self.send_header("Cache-Control", "no-cache")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    self.wfile.flush()
+                    # Detach so the http.server doesn't close the socket.
+                    # multisocketsink owns it from now on.
+                    self.close_connection = True
+                    stream.add(self.connection.detach(), self.client_address,
+                               **info)
+
+                elif path in server.handlers:
+                    try:
+                        content_type, body = server.handlers[path]()
+                    except RuntimeError as error:
+                        self.send_error(503, str(error))
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                # Quieter than the default of logging every request.
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer((self.host, self.port),
+                                                     Handler)
+        self.httpd.daemon_threads = True
+        thread = threading.Thread(target=self.httpd.serve_forever,
+                                  daemon=True)
+        thread.start()
+        print("Serving on http://{}:{}/ paths: {}".format(
+                self.host, self.port,
+                ", ".join(sorted(list(self.streams) + list(self.handlers)
+                                 + list(self.routes)))))
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+#
+# frame_grabber.py
+#
+# Get video frames out of a GStreamer pipeline and into Python.
+#
+# Add grabber_branch() to the pipeline text after a tee, e.g. in
+# camera_local.py, and wrap its appsink with FrameGrabber:
+#
+#   pipeline = Gst.parse_launch("""
+#       v4l2src ! videoconvert ! tee name=split
+#       split. ! queue ! autovideosink
+#       """ + grabber_branch("split"))
+#   grabber = FrameGrabber(pipeline.get_by_name("grabber"))
+#
+# The branch has a leaky queue and an appsink with max-buffers=1 drop=true,
+# so a slow consumer only ever misses frames. It never holds up the display.
+# There are three ways to take the frames:
+#
+#   for frame in grabber.frames():      Generator. Blocks for each frame.
+#   FrameGrabber(appsink, callback=f)   f(frame) in the streaming thread.
+#   frame = grabber.latest()            The newest frame, or None. Never
+#                                       blocks. For a consumer on its own
+#                                       clock, e.g. a Gtk timeout.
+#
+# A Frame holds its buffer mapped for reading. frame.array is a NumPy view
+# of height x width x channels onto the mapped memory, without a copy, when
+# the gst-python overrides map the buffer as a memoryview. The view is only
+# valid until frame.release(), or the end of a "with frame:" block. Use
+# frame.array.copy() to keep it. NumPy is optional. Without it frame.data
+# and frame.stride give the raw rows.
+#
+# Benchmark the frames/sec and the cost of each frame with videotestsrc:
+# $ python3 frame_grabber.py --benchmark --mode latest --consumer-ms 50
+#
+import sys, os
+import time
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstVideo', '1.0')
+from gi.repository import Gst, GstVideo
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DEFAULT_FORMAT = "RGB"
+
+
+def grabber_branch(tee, format=DEFAULT_FORMAT, name="grabber"):
+    'The gst-launch text of an appsink branch from the named tee.'
+    return """
+        {tee}.
+        ! queue leaky=downstream max-size-buffers=1
+        ! videoconvert
+        ! video/x-raw,format={format}
+        ! appsink name={name} max-buffers=1 drop=true sync=false
+        """.format(tee=tee, format=format, name=name)
+
+
+def video_info(caps):
+    'GstVideo.VideoInfo of the caps, for the stride and plane offsets.'
+    if hasattr(GstVideo.VideoInfo, "new_from_caps"):
+        return GstVideo.VideoInfo.new_from_caps(caps)
+    info = GstVideo.VideoInfo()
+    info.from_caps(caps)
+    return info
+
+
+class Frame(object):
+    'A video frame, mapped for reading until release().'
+
+    def __init__(self, sample):
+        self.buffer = sample.get_buffer()
+        info = video_info(sample.get_caps())
+        self.width = info.width
+        self.height = info.height
+        self.format = info.finfo.name
+        # Bytes per pixel of the first plane. 4 for RGBx, 1 for GRAY8 and
+        # for the Y plane of I420.
+        self.channels = info.finfo.pixel_stride[0]
+        self.stride = info.stride[0]
+        self.pts = self.buffer.pts
+        ok, self.mapinfo = self.buffer.map(Gst.MapFlags.READ)
+        if not ok:
+            raise RuntimeError("Could not map the buffer")
+        self.data = self.mapinfo.data
+        self._array = None
+
+    @property
+    def zero_copy(self):
+        'True if data, and so array, are views onto the mapped buffer.'
+        return isinstance(self.data, memoryview)
+
+    @property
+    def array(self):
+        'NumPy height x width x channels uint8 view of the first plane.'
+        if numpy is None:
+            raise RuntimeError("NumPy is not installed")
+        if self._array is None:
+            self._array = numpy.ndarray(
+                    shape=(self.height, self.width, self.channels),
+                    dtype=numpy.uint8, buffer=self.data,
+                    strides=(self.stride, self.channels, 1))
+        return self._array
+
+    def release(self):
+        'Unmap the buffer. Any array view is no longer valid.'
+        if self.mapinfo is not None:
+            self._array = None
+            self.data = None
+            self.buffer.unmap(self.mapinfo)
+            self.mapinfo = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class FrameGrabber(object):
+    """
+    Take frames from the appsink of grabber_branch(). With a callback, it is
+    called with each Frame in the streaming thread, and the frame released
+    on return. Otherwise use frames() or latest(). count is the frames
+    taken and overhead the total seconds spent pulling and mapping them.
+    """
+
+    def __init__(self, appsink, callback=None):
+        self.appsink = appsink
+        self.callback = callback
+        self.count = 0
+        self.overhead = 0.0
+        if callback is not None:
+            appsink.set_property("emit-signals", True)
+            appsink.connect("new-sample", self._on_sample)
+
+    def _take(self, signal, *args):
+        start = time.perf_counter()
+        sample = self.appsink.emit(signal, *args)
+        if sample is None:
+            return None
+        frame = Frame(sample)
+        self.count += 1
+        self.overhead += time.perf_counter() - start
+        return frame
+
+    def _on_sample(self, appsink):
+        frame = self._take("pull-sample")
+        if frame is not None:
+            with frame:
+                self.callback(frame)
+        return Gst.FlowReturn.OK
+
+    def frames(self, timeout=Gst.SECOND):
+        """
+        Yield each frame until end of stream. A frame is released when the
+        next one is asked for.
+        """
+        while not self.appsink.get_property("eos"):
+            frame = self._take("try-pull-sample", timeout)
+            if frame is not None:
+                with frame:
+                    yield frame
+
+    def latest(self):
+        'The newest frame not yet taken, or None. Release it when done.'
+        return self._take("try-pull-sample", 0)
+
+
+def benchmark(mode, seconds, width, height, format, consumer_ms):
+    """
+    Grab frames from videotestsrc, with a fakesink standing in for the
+    display. consumer_ms is the time the consumer spends on each frame.
+    Print the frames/sec of both branches and the cost of taking a frame.
+    """
+    pipeline = Gst.parse_launch("""
+        videotestsrc is-live=true pattern=ball
+        ! video/x-raw,width={width},height={height},framerate=30/1
+        ! tee name=split
+        split. ! queue ! fakesink name=display sync=true signal-handoffs=true
+        """.format(width=width, height=height)
+        + grabber_branch("split", format))
+    displayed = [0]
+
+    def on_handoff(sink, buffer, pad):
+        displayed[0] += 1
+    pipeline.get_by_name("display").connect("handoff", on_handoff)
+
+    zero_copy = [None]
+
+    def consume(frame):
+        zero_copy[0] = frame.zero_copy
+        if numpy is not None:
+            frame.array
+        if consumer_ms:
+            time.sleep(consumer_ms / 1000)
+
+    appsink = pipeline.get_by_name("grabber")
+    if mode == "callback":
+        grabber = FrameGrabber(appsink, callback=consume)
+    else:
+        grabber = FrameGrabber(appsink)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    start = time.time()
+    if mode == "generator":
+        for frame in grabber.frames():
+            consume(frame)
+            if time.time() - start > seconds:
+                break
+    elif mode == "latest":
+        while time.time() - start < seconds:
+            frame = grabber.latest()
+            if frame is None:
+                time.sleep(0.001)
+                continue
+            with frame:
+                consume(frame)
+    else:
+        time.sleep(seconds)
+    elapsed = time.time() - start
+    pipeline.set_state(Gst.State.NULL)
+
+    print("Mode: {}  {}x{} {}  consumer {} ms/frame  NumPy: {}".format(
+            mode, width, height, format, consumer_ms,
+            "yes" if numpy is not None else "no"))
+    print("Display: {:.1f} frames/sec".format(displayed[0] / elapsed))
+    print("Grabbed: {:.1f} frames/sec".format(grabber.count / elapsed))
+    if grabber.count:
+        print("Pull and map: {:.1f} us/frame, zero copy: {}".format(
+                grabber.overhead / grabber.count * 1e6, zero_copy[0]))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Grab frames from a pipeline into Python.")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Benchmark with videotestsrc.")
+    parser.add_argument("--mode", default="latest",
+                        choices=("generator", "callback", "latest"))
+    parser.add_argument("--seconds", type=int, default=5)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--format", default=DEFAULT_FORMAT,
+                        help="Video format, e.g. RGB, BGRx, GRAY8.")
+    parser.add_argument("--consumer-ms", type=int, default=0,
+                        help="Simulated processing time of each frame.")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    if args.benchmark:
+        benchmark(args.mode, args.seconds, args.width, args.height,
+                  args.format, args.consumer_ms)
+    else:
+        parser.print_help()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+#
+# gst_boot.py
+#
+# Start GStreamer once, and only when a pipeline is needed, and time it.
+#
+# The programs import gi and call Gst.init(None) at the top, and some call
+# Gst.init(None) again each time speak() or convert() is called. For a short
+# job, such as "espeak.py hello", start-up is most of the run time, and it
+# is paid even for a usage error. Instead:
+#
+#   from gst_boot import gst
+#   ...
+#   Gst = gst()     # Imports gi and calls Gst.init(None) the first time.
+#
+# GST_REGISTRY_FORK is set to "no" unless it is already set. When the
+# registry cache is up to date nothing is scanned. When a plugin has
+# changed it is scanned in this process, rather than by forking
+# gst-plugin-scanner. The modification time of the registry cache is checked
+# before and after Gst.init(), so the report shows whether it was reused or
+# rebuilt.
+#
+# watch(pipeline) records when a pipeline first reaches PLAYING. With
+# GST_BOOT_REPORT=1 in the environment the times since gst_boot was
+# imported are printed when the program exits:
+# $ GST_BOOT_REPORT=1 python3 espeak.py "hello"
+# $ python3 gst_boot.py --runs 5
+#
+import sys, os
+import glob
+import time
+import json
+import atexit
+import threading
+
+START = time.perf_counter()
+_lock = threading.Lock()
+_Gst = None
+_times = {}
+
+
+def registry_files():
+    'The registry cache files that Gst.init() reads, or may write.'
+    if os.environ.get("GST_REGISTRY"):
+        return [os.environ["GST_REGISTRY"]]
+    cache = os.environ.get("XDG_CACHE_HOME",
+                           os.path.join(os.path.expanduser("~"), ".cache"))
+    return glob.glob(os.path.join(cache, "gstreamer-1.0", "registry.*.bin"))
+
+
+def _mtimes():
+    return {path: os.path.getmtime(path) for path in registry_files()}
+
+
+def gst():
+    'The Gst module, imported and initialized on the first call only.'
+    global _Gst
+    with _lock:
+        if _Gst is not None:
+            return _Gst
+        os.environ.setdefault("GST_REGISTRY_FORK", "no")
+
+        start = time.perf_counter()
+        import gi
+        gi.require_version('Gst', '1.0')
+        from gi.repository import Gst
+        imported = time.perf_counter()
+
+        before = _mtimes()
+        Gst.init(None)
+        initialized = time.perf_counter()
+        after = _mtimes()
+
+        _times.update({
+                "import_ms": round(1000 * (imported - start), 1),
+                "init_ms": round(1000 * (initialized - imported), 1),
+                "ready_ms": round(1000 * (initialized - START), 1),
+                "registry": {"files": sorted(after),
+                             "reused": bool(before) and before == after,
+                             "fork": os.environ["GST_REGISTRY_FORK"] != "no"}})
+        _Gst = Gst
+        return _Gst
+
+
+def glib():
+    'The GLib module, after gst().'
+    gst()
+    from gi.repository import GLib
+    return GLib
+
+
+def watch(pipeline):
+    'Record the time at which the pipeline first reaches PLAYING.'
+    Gst = gst()
+    bus = pipeline.get_bus()
+
+    def on_state_changed(bus, message):
+        if message.src is pipeline and "first_playing_ms" not in _times:
+            old, new, pending = message.parse_state_changed()
+            if new == Gst.State.PLAYING:
+                _times["first_playing_ms"] = round(
+                        1000 * (time.perf_counter() - START), 1)
+    # Sync messages are emitted whether or not there is a main loop.
+    bus.enable_sync_message_emission()
+    bus.connect("sync-message::state-changed", on_state_changed)
+
+
+def report():
+    'The start-up times, in milli-secs since gst_boot was imported.'
+    return dict(_times)
+
+
+def _print_report():
+    if _times:
+        print("gst_boot: {}".format(json.dumps(report())), file=sys.stderr)
+
+
+if os.environ.get("GST_BOOT_REPORT"):
+    atexit.register(_print_report)
+
+
+if __name__ == "__main__":
+    import argparse
+    import subprocess
+
+    parser = argparse.ArgumentParser(
+            description="Time the cold start of GStreamer in new processes.")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # Each run is a new interpreter, as a command line program would be.
+    code = ("import gst_boot\n"
+            "Gst = gst_boot.gst()\n"
+            "pipeline = Gst.parse_launch('fakesrc num-buffers=1 ! fakesink')\n"
+            "gst_boot.watch(pipeline)\n"
+            "pipeline.set_state(Gst.State.PLAYING)\n"
+            "pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE,\n"
+            "        Gst.MessageType.EOS | Gst.MessageType.ERROR)\n"
+            "pipeline.set_state(Gst.State.NULL)\n"
+            "print(__import__('json').dumps(gst_boot.report()))\n")
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for run in range(args.runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], cwd=directory,
+                                stdout=subprocess.PIPE, check=True,
+                                universal_newlines=True).stdout
+        result = json.loads(output)
+        result.setdefault("first_playing_ms", "-")
+        print("run {}: process {:.1f} ms, import {import_ms} ms, init "
+              "{init_ms} ms, first PLAYING {first_playing_ms} ms, registry "
+              "reused {reused}".format(
+                      run + 1, 1000 * (time.perf_counter() - start),
+                      reused=result["registry"]["reused"], **result))
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+#
+# loudness.py
+#
+# Loudness normalization and silence detection for radio_gui.py.
+#
+# Internet radio stations are mastered at very different loudness. This adds
+# an analysis branch to the audio that playbin has already decoded, so no
+# second connection to the station and no second decode is needed. The
+# branch is set as the playbin "audio-filter":
+#
+#   tee name=split
+#   split. ! queue ! volume name=normalize              <-- What is heard
+#   split. ! queue leaky=downstream ! audioconvert
+#          ! audio/x-raw,format=F64LE
+#          ! audioiirfilter name=kweight                <-- K-weighting
+#          ! level name=loudness interval=100000000     <-- 100 ms messages
+#          ! fakesink sync=false async=false
+#
+# The level messages are turned into an EBU R128 style integrated loudness.
+# Momentary loudness is the mean power of the last 400 ms. The integrated
+# loudness uses the absolute gate at -70 LUFS and the relative gate at -10 LU.
+# The 400 ms blocks are counted in a histogram of 0.1 LU steps so memory use
+# stays the same however long a station plays.
+#
+# The "normalize" volume element is then set to bring the station to the
+# target loudness. The gain is remembered for each station in loudness.json
+# so that it is applied straight away the next time the station is played.
+#
+# When the momentary loudness stays below the silence threshold for the set
+# number of seconds the on_silence call back is called. on_sound is called
+# when the audio returns.
+#
+# To measure the CPU cost of the analysis branch:
+# $ python3 loudness.py --benchmark
+#
+import sys, os
+import math
+import json
+import time
+import argparse
+import collections
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+TARGET_LUFS = -23.0
+MAX_GAIN_DB = 12.0
+SILENCE_LUFS = -60.0
+# Seconds of audio measured before the gain is first changed.
+SETTLE_SECS = 3.0
+GAINS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          "loudness.json")
+
+ANALYSIS_DESCRIPTION = """
+        tee name=split
+        split. ! queue ! volume name=normalize
+        split. ! queue leaky=downstream max-size-time=1000000000
+               ! audioconvert ! audio/x-raw,format=F64LE
+               ! audioiirfilter name=kweight
+               ! level name=loudness interval=100000000
+               ! fakesink sync=false async=false
+        """
+
+# Histogram of block loudness from -70 LUFS in 0.1 LU steps.
+HISTOGRAM_MIN = -70.0
+HISTOGRAM_STEP = 0.1
+HISTOGRAM_BINS = 800
+
+
+def kweighting_coefficients(rate):
+    """
+    Return (b, a) of the ITU-R BS.1770 K-weighting filter at the sample rate.
+    The high shelf and high pass stages are combined into one 4th order IIR.
+    """
+    # Stage 1. High shelf.
+    f0 = 1681.974450955533
+    gain = 3.999843853973347
+    q = 0.7071752369554196
+    k = math.tan(math.pi * f0 / rate)
+    vh = math.pow(10.0, gain / 20.0)
+    vb = math.pow(vh, 0.4996667741545416)
+    a0 = 1.0 + k / q + k * k
+    shelf_b = [(vh + vb * k / q + k * k) / a0,
+               2.0 * (k * k - vh) / a0,
+               (vh - vb * k / q + k * k) / a0]
+    shelf_a = [1.0,
+               2.0 * (k * k - 1.0) / a0,
+               (1.0 - k / q + k * k) / a0]
+
+    # Stage 2. High pass.
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+    k = math.tan(math.pi * f0 / rate)
+    a0 = 1.0 + k / q + k * k
+    pass_b = [1.0, -2.0, 1.0]
+    pass_a = [1.0,
+              2.0 * (k * k - 1.0) / a0,
+              (1.0 - k / q + k * k) / a0]
+
+    def convolve(x, y):
+        result = [0.0] * (len(x) + len(y) - 1)
+        for i, xi in enumerate(x):
+            for j, yj in enumerate(y):
+                result[i + j] += xi * yj
+        return result
+
+    return convolve(shelf_b, pass_b), convolve(shelf_a, pass_a)
+
+
+class LoudnessMeter(object):
+    'Integrated and momentary loudness from 100 ms channel power values.'
+
+    def __init__(self, silence_secs=0, on_silence=None, on_sound=None):
+        self.silence_secs = silence_secs
+        self.on_silence = on_silence
+        self.on_sound = on_sound
+        self.reset()
+
+    def reset(self):
+        self.histogram = [0] * HISTOGRAM_BINS
+        self.blocks = 0
+        self.recent = collections.deque(maxlen=4)  # Four 100 ms = 400 ms
+        self.momentary = None
+        self.quiet_since = None
+        self.silent = False
+        self.measured_secs = 0.0
+
+    def add(self, rms_db, interval=0.1, now=None):
+        """
+        Add one level message. rms_db is the list of RMS values, in dB, of
+        each channel of the K-weighted audio.
+        """
+        now = time.time() if now is None else now
+        power = sum(math.pow(10.0, value / 10.0) for value in rms_db
+                    if value > -200)
+        self.recent.append(power)
+        self.measured_secs += interval
+        if len(self.recent) < self.recent.maxlen:
+            return
+
+        mean_power = sum(self.recent) / len(self.recent)
+        self.momentary = (-0.691 + 10.0 * math.log10(mean_power)
+                          if mean_power > 0 else -200.0)
+
+        # Absolute gate. Blocks below -70 LUFS are not counted.
+        if self.momentary >= HISTOGRAM_MIN:
+            index = int((self.momentary - HISTOGRAM_MIN) / HISTOGRAM_STEP)
+            self.histogram[min(index, HISTOGRAM_BINS - 1)] += 1
+            self.blocks += 1
+
+        self._check_silence(now)
+
+    def _check_silence(self, now):
+        if self.momentary < SILENCE_LUFS:
+            if self.quiet_since is None:
+                self.quiet_since = now
+            if (self.silence_secs and not self.silent
+                    and now - self.quiet_since >= self.silence_secs):
+                self.silent = True
+                if self.on_silence is not None:
+                    self.on_silence(now - self.quiet_since)
+        else:
+            self.quiet_since = None
+            if self.silent:
+                self.silent = False
+                if self.on_sound is not None:
+                    self.on_sound()
+
+    def integrated(self):
+        'Gated integrated loudness in LUFS, or None before any audio.'
+        if self.blocks == 0:
+            return None
+
+        def bin_power(index):
+            loudness = HISTOGRAM_MIN + (index + 0.5) * HISTOGRAM_STEP
+            return math.pow(10.0, (loudness + 0.691) / 10.0)
+
+        total = sum(count * bin_power(index)
+                    for index, count in enumerate(self.histogram) if count)
+        ungated = -0.691 + 10.0 * math.log10(total / self.blocks)
+
+        # Relative gate. Ignore blocks more than 10 LU below the ungated mean.
+        first = max(0, int((ungated - 10.0 - HISTOGRAM_MIN) / HISTOGRAM_STEP))
+        count = sum(self.histogram[first:])
+        if count == 0:
+            return ungated
+        total = sum(self.histogram[index] * bin_power(index)
+                    for index in range(first, HISTOGRAM_BINS)
+                    if self.histogram[index])
+        return -0.691 + 10.0 * math.log10(total / count)
+
+
+class Normalizer(object):
+    """
+    The analysis bin for playbin's audio-filter, its LoudnessMeter and the
+    per-station gains. Call station_changed() when a new station is chosen
+    and on_message() for the element messages of the pipeline bus.
+    """
+
+    def __init__(self, target=TARGET_LUFS, silence_secs=0, on_silence=None,
+                 on_sound=None, gains_file=GAINS_FILE, apply_gain=True):
+        self.target = target
+        self.apply_gain = apply_gain
+        self.gains_file = gains_file
+        self.meter = LoudnessMeter(silence_secs, on_silence, on_sound)
+        self.station = None
+        self.gain_db = 0.0
+
+        self.gains = {}
+        if gains_file and os.path.isfile(gains_file):
+            with open(gains_file) as f:
+                self.gains = json.load(f)
+
+        self.bin = Gst.parse_bin_from_description(ANALYSIS_DESCRIPTION, True)
+        self.volume = self.bin.get_by_name("normalize")
+        self.kweight = self.bin.get_by_name("kweight")
+        # The filter coefficients depend on the sample rate of the station.
+        self.kweight.get_static_pad("sink").add_probe(
+                Gst.PadProbeType.EVENT_DOWNSTREAM, self.on_caps)
+
+    def on_caps(self, pad, info):
+        event = info.get_event()
+        if event.type == Gst.EventType.CAPS:
+            rate = event.parse_caps().get_structure(0).get_int("rate")[1]
+            b, a = kweighting_coefficients(rate)
+            self.kweight.set_property("b", b)
+            self.kweight.set_property("a", a)
+        return Gst.PadProbeReturn.OK
+
+    def station_changed(self, uri):
+        'Start measuring again. Use the remembered gain of the station.'
+        self.save()
+        self.station = uri
+        self.meter.reset()
+        self.set_gain(self.gains.get(uri, 0.0))
+
+    def set_gain(self, gain_db):
+        if not self.apply_gain:
+            return
+        self.gain_db = max(-MAX_GAIN_DB, min(MAX_GAIN_DB, gain_db))
+        self.volume.set_property("volume",
+                                 math.pow(10.0, self.gain_db / 20.0))
+
+    def on_message(self, bus, message):
+        'Element message call back. Only the level messages are used.'
+        structure = message.get_structure()
+        if structure is None or structure.get_name() != "level":
+            return
+        if message.src.get_name() != "loudness":
+            return
+        self.meter.add(list(structure.get_value("rms")))
+
+        # Once a second, after the first few seconds, move towards the gain.
+        if (self.meter.measured_secs >= SETTLE_SECS
+                and round(self.meter.measured_secs * 10) % 10 == 0):
+            integrated = self.meter.integrated()
+            if integrated is not None:
+                self.set_gain(self.target - integrated)
+                if self.apply_gain and self.station is not None:
+                    self.gains[self.station] = round(self.gain_db, 2)
+
+    def save(self):
+        'Remember the per-station gains for the next launch.'
+        if self.apply_gain and self.gains_file and self.gains:
+            with open(self.gains_file, "w") as f:
+                json.dump(self.gains, f, indent=2)
+
+
+def benchmark(seconds=600, rate=44100):
+    """
+    Process the given seconds of pink noise as fast as possible, with and
+    without the analysis branch. Report the extra CPU time it costs.
+    """
+    Gst.init(None)
+    buffers = seconds * rate // 1024
+    template = """
+            audiotestsrc wave=pink-noise num-buffers={} samplesperbuffer=1024
+            ! audio/x-raw,format=S16LE,rate={},channels=2
+            ! {}
+            ! fakesink sync=false
+            """
+    results = {}
+    for name in ("plain", "analysis"):
+        pipeline = Gst.parse_launch(template.format(buffers, rate,
+                                                    "identity name=in"))
+        normalizer = None
+        if name == "analysis":
+            # Insert the same bin as is used by playbin.
+            normalizer = Normalizer(gains_file=None)
+            pipeline.add(normalizer.bin)
+            identity = pipeline.get_by_name("in")
+            sink = identity.get_static_pad("src").get_peer().get_parent()
+            identity.unlink(sink)
+            identity.link(normalizer.bin)
+            normalizer.bin.link(sink)
+
+        cpu_start = time.process_time()
+        wall_start = time.time()
+        pipeline.set_state(Gst.State.PLAYING)
+        bus = pipeline.get_bus()
+        while True:
+            message = bus.timed_pop_filtered(
+                    Gst.CLOCK_TIME_NONE,
+                    Gst.MessageType.EOS | Gst.MessageType.ERROR
+                    | Gst.MessageType.ELEMENT)
+            if message.type == Gst.MessageType.ELEMENT:
+                if normalizer is not None:
+                    normalizer.on_message(bus, message)
+                continue
+            break
+        pipeline.set_state(Gst.State.NULL)
+        results[name] = (time.process_time() - cpu_start,
+                         time.time() - wall_start)
+        if normalizer is not None:
+            print("Measured loudness: {:.1f} LUFS".format(
+                    normalizer.meter.integrated()))
+
+    extra = results["analysis"][0] - results["plain"][0]
+    print("{} secs of audio at {} Hz".format(seconds, rate))
+    for name, (cpu, wall) in results.items():
+        print("{:>9}: CPU {:.3f} secs, wall {:.3f} secs".format(name, cpu,
+                                                               wall))
+    print("Analysis costs {:.3f} CPU secs. {:.2f}% of one core in real time."
+          .format(extra, 100.0 * extra / seconds))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Loudness analysis used by radio_gui.py")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Measure the CPU cost of the analysis branch.")
+    parser.add_argument("--seconds", type=int, default=600,
+                        help="Seconds of audio for the benchmark.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.seconds)
+    else:
+        parser.print_help()
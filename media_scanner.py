@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+#
+# media_scanner.py
+#
+# Index the duration and format of many media files without playing them.
+#
+# To learn the duration of a phrase mp3 or a converted wav, the other
+# programs play it or convert it. Here GstPbutils.Discoverer reads just
+# enough of each file to find its streams and duration. Discoverer works on
+# one uri at a time, so --workers discoverers are run, each in async mode
+# and given its next file when it has finished the last. That bounds the
+# number of files open at once, however many are scanned.
+#
+# The results go in an index, media_index.json by default, keyed by path.
+# A file whose size and modification time are unchanged since the last run
+# is not discovered again, and files that have gone are removed.
+#
+# $ python3 media_scanner.py hello.mp3 yakety_yak.mp3 phrase/
+# $ python3 media_scanner.py --workers 8 --index library.json ~/Music
+#
+import sys, os
+import json
+import time
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstPbutils', '1.0')
+from gi.repository import Gst, GstPbutils, GLib
+
+INDEX_FILE = "media_index.json"
+EXTENSIONS = (".mp3", ".wav", ".ogg", ".opus", ".flac", ".m4a", ".aac")
+WORKERS = 4
+TIMEOUT = 10
+
+
+def find_files(paths, extensions=EXTENSIONS):
+    'The media files of paths, which may be files or directories, once each.'
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, names in os.walk(path):
+                subdirectories.sort()
+                for name in sorted(names):
+                    if name.lower().endswith(extensions):
+                        files.append(os.path.join(directory, name))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print("Not found: {}".format(path))
+    # A file given directly and within a directory is discovered once.
+    seen = set()
+    unique = []
+    for path in files:
+        if os.path.abspath(path) not in seen:
+            seen.add(os.path.abspath(path))
+            unique.append(path)
+    return unique
+
+
+def media_info(info):
+    'Dictionary of the duration and first audio stream of a DiscovererInfo.'
+    result = {"duration_secs": round(info.get_duration() / Gst.SECOND, 3),
+              "seekable": info.get_seekable()}
+    container = info.get_stream_info()
+    if isinstance(container, GstPbutils.DiscovererContainerInfo):
+        result["container"] = GstPbutils.pb_utils_get_codec_description(
+                container.get_caps())
+    streams = info.get_audio_streams()
+    if streams:
+        audio = streams[0]
+        result.update({
+                "codec": GstPbutils.pb_utils_get_codec_description(
+                        audio.get_caps()),
+                "channels": audio.get_channels(),
+                "rate": audio.get_sample_rate(),
+                "bitrate": audio.get_bitrate() or audio.get_max_bitrate(),
+                "depth": audio.get_depth()})
+    if info.get_video_streams():
+        result["video"] = True
+    return result
+
+
+class Scanner(object):
+    'Discover files with a bounded number of async discoverers.'
+
+    def __init__(self, files, index, workers=WORKERS, timeout=TIMEOUT):
+        self.index = index
+        self.pending = list(reversed(files))
+        self.loop = GLib.MainLoop()
+        self.paths = {}  # uri -> path, as given.
+        self.busy = 0
+        self.discovered = 0
+        self.discoverers = []
+        for number in range(min(workers, len(files))):
+            discoverer = GstPbutils.Discoverer.new(timeout * Gst.SECOND)
+            discoverer.connect("discovered", self.on_discovered)
+            discoverer.start()
+            self.discoverers.append(discoverer)
+
+    def run(self):
+        for discoverer in self.discoverers:
+            self.next(discoverer)
+        if self.busy:
+            self.loop.run()
+        for discoverer in self.discoverers:
+            discoverer.stop()
+
+    def next(self, discoverer):
+        'Give the discoverer its next file, or quit when all are done.'
+        while self.pending:
+            path = self.pending.pop()
+            uri = Gst.filename_to_uri(os.path.abspath(path))
+            if discoverer.discover_uri_async(uri):
+                self.paths[uri] = path
+                self.busy += 1
+                return
+            self.index[path] = stat_entry(path, error="Could not queue")
+        if self.busy == 0:
+            self.loop.quit()
+
+    def on_discovered(self, discoverer, info, error):
+        self.busy -= 1
+        path = self.paths.pop(info.get_uri(), None)
+        if path is None:
+            self.next(discoverer)
+            return
+        self.discovered += 1
+        if info.get_result() == GstPbutils.DiscovererResult.OK:
+            entry = stat_entry(path)
+            entry.update(media_info(info))
+        else:
+            entry = stat_entry(path, error=error.message if error
+                               else info.get_result().value_nick)
+        self.index[path] = entry
+        self.next(discoverer)
+
+
+def stat_entry(path, **extra):
+    'The size and modification time of path, with any extra items.'
+    stat = os.stat(path)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime}
+    entry.update(extra)
+    return entry
+
+
+def unchanged(entry, path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return entry.get("size") == stat.st_size and \
+            entry.get("mtime") == stat.st_mtime and "error" not in entry
+
+
+def load_index(filename):
+    if not os.path.isfile(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def save_index(index, filename):
+    # Write a new file and rename it, so a failed run leaves the old index.
+    with open(filename + ".new", "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(filename + ".new", filename)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Index the duration and format of media files.")
+    parser.add_argument("paths", nargs="*",
+                        default=["hello.mp3", "yakety_yak.mp3", "phrase"],
+                        help="Files or directories.")
+    parser.add_argument("--index", default=INDEX_FILE)
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Discoveries in flight at once.")
+    parser.add_argument("--timeout", type=int, default=TIMEOUT,
+                        help="Seconds allowed for each file.")
+    parser.add_argument("--print", action="store_true",
+                        help="Print the entry of each file.")
+    args = parser.parse_args()
+
+    Gst.init(None)
+    start = time.perf_counter()
+    files = find_files(args.paths)
+    index = load_index(args.index)
+    # Forget the files that have gone. Skip those that have not changed.
+    for path in list(index):
+        if not os.path.isfile(path):
+            del index[path]
+    changed = [path for path in files
+               if path not in index or not unchanged(index[path], path)]
+
+    scanner = Scanner(changed, index, args.workers, args.timeout)
+    scanner.run()
+    save_index(index, args.index)
+
+    if args.print:
+        for path in files:
+            print("{}: {}".format(path, json.dumps(index.get(path))))
+    print("{} files, {} discovered, {} unchanged, in {:.2f} secs. Index: {}"
+          .format(len(files), scanner.discovered, len(files) - len(changed),
+                  time.perf_counter() - start, args.index))
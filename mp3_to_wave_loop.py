@@ -19,10 +19,9 @@
 import sys
 import os.path
 import time
-import gi
-gi.require_version('Gst', '1.0')
-gi.require_version('GObject', '2.0')
-from gi.repository import Gst, GObject
+
+# GStreamer is imported and initialized once, when first needed.
+from gst_boot import gst, glib, watch
 
 MP3_FILE = "hello.mp3"
 
@@ -53,9 +52,9 @@ def convert(mp3_file=MP3_FILE):
 
     start_time = time.time()
 
-    # Init
-    Gst.init(None)
-    loop = GObject.MainLoop()
+    # Init. Only the first call imports gi and calls Gst.init(None).
+    Gst = gst()
+    loop = glib().MainLoop()
 
     pipeline_template = """
             filesrc location={} 
@@ -68,6 +67,7 @@ def convert(mp3_file=MP3_FILE):
             """
 
     pipeline = Gst.parse_launch(pipeline_template.format(mp3_file, wav_file))
+    watch(pipeline)
 
     # Instantiate and initialize the bus call-back 
     bus = pipeline.get_bus()
@@ -19,9 +19,9 @@
 import sys
 import os.path
 import time
-import gi
-gi.require_version('Gst', '1.0')
-from gi.repository import Gst
+
+# GStreamer is imported and initialized once, when first needed.
+from gst_boot import gst, watch
 
 MP3_FILE = "hello.mp3"
 
@@ -50,8 +50,8 @@ def convert(mp3_file=MP3_FILE):
 
     start_time = time.time()
 
-    # Init
-    Gst.init(None)
+    # Init. Only the first call imports gi and calls Gst.init(None).
+    Gst = gst()
 
     # Pipeline template
     pipeline_template = """
@@ -66,6 +66,7 @@ def convert(mp3_file=MP3_FILE):
 
     # pipeline launch - pass mp3 and wav file path / names
     pipeline = Gst.parse_launch(pipeline_template.format(mp3_file, wav_file))
+    watch(pipeline)
 
     # Start converion
     pipeline.set_state(Gst.State.PLAYING)  
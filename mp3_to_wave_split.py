@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+#
+# mp3_to_wave_split.py
+#
+# Convert a long mp3 file to wav on several cores at once.
+#
+# mp3_to_wave_poll.py decodes the whole file in one streaming thread, so a
+# recording of several hours uses one core. Here the duration is found with
+# GstPbutils.Discoverer and the file is cut into --workers segments. Each is
+# decoded by its own pipeline, all at the same time:
+#
+#   filesrc ! decodebin ! audioconvert ! audioresample
+#   ! audio/x-raw,format=S24LE,rate=48000 ! appsink
+#
+# Each pipeline makes an accurate seek to at least MARGIN_SECS before its
+# segment, and stops as far after it. The margin lets the decoder refill
+# its bit reservoir, and the resampler its filter, before the first sample
+# that is kept. The samples of the segment are then cut out by their
+# timestamps. Segment boundaries, and the margin, are on mp3 frame
+# boundaries that are also whole samples at 48000 Hz, so each segment
+# starts in the same resampler phase as the serial decode would.
+#
+# A recording of hours is gigabytes of PCM, so each segment is written to a
+# temporary file beside the wav file. The segments are copied into the wav
+# file in order, each as soon as it and those before it have finished.
+#
+# --verify also decodes the file serially and compares the two, a chunk at
+# a time. --cores does this for each count of workers and reports the
+# speed-up:
+# $ python3 mp3_to_wave_split.py yakety_yak.mp3 --workers 4 --verify
+# $ python3 mp3_to_wave_split.py long_recording.mp3 --cores 1,2,4,8
+#
+import sys, os
+import math
+import time
+import wave
+import argparse
+import tempfile
+import concurrent.futures
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstPbutils', '1.0')
+from gi.repository import Gst, GstPbutils
+
+MP3_FILE = "yakety_yak.mp3"
+RATE = 48000
+SAMPLE_BYTES = 3  # S24LE, as mp3_to_wave_poll.py.
+CAPS = "audio/x-raw,format=S24LE,rate={}".format(RATE)
+MP3_FRAME_SAMPLES = 1152
+MARGIN_SECS = 0.5
+TIMEOUT = 600
+CHUNK_FRAMES = 1 << 18  # Samples of each channel copied or compared at once.
+
+
+def probe(mp3_file):
+    'The duration, in nanoseconds, sample rate and channels of the file.'
+    discoverer = GstPbutils.Discoverer.new(10 * Gst.SECOND)
+    info = discoverer.discover_uri(
+            Gst.filename_to_uri(os.path.abspath(mp3_file)))
+    audio = info.get_audio_streams()[0]
+    return info.get_duration(), audio.get_sample_rate(), audio.get_channels()
+
+
+def boundary_samples(source_rate):
+    """
+    The smallest count of output samples that is a whole number of mp3
+    frames, at the source rate, and of samples at RATE.
+    """
+    frame = MP3_FRAME_SAMPLES * RATE
+    frames = source_rate // math.gcd(frame, source_rate)
+    return frames * frame // source_rate
+
+
+def margin_samples(source_rate):
+    'MARGIN_SECS, rounded up to a whole number of boundary_samples().'
+    unit = boundary_samples(source_rate)
+    return unit * math.ceil(MARGIN_SECS * RATE / unit)
+
+
+def segments(duration, source_rate, workers):
+    'List of (start, end) output samples. The last end is None, the EOS.'
+    unit = boundary_samples(source_rate)
+    units = max(1, int(duration * RATE / Gst.SECOND) // unit)
+    workers = min(workers, units)
+    starts = [unit * (units * index // workers) for index in range(workers)]
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def decode_segment(mp3_file, start, end, output, margin=0):
+    """
+    Decode the output samples from start up to end, or to the end of the
+    file if end is None, and write their PCM to the output file. The seek
+    is margin samples early. Return the channels, or None if there were no
+    samples, and the count of samples of each channel written.
+    """
+    pipeline = Gst.parse_launch("""
+        filesrc location="{}"
+        ! decodebin
+        ! audioconvert
+        ! audioresample
+        ! {}
+        ! appsink name=pcm sync=false
+        """.format(mp3_file, CAPS))
+    appsink = pipeline.get_by_name("pcm")
+    bus = pipeline.get_bus()
+
+    try:
+        if start > 0 or end is not None:
+            pipeline.set_state(Gst.State.PAUSED)
+            pipeline.get_state(TIMEOUT * Gst.SECOND)
+            # Start and stop on the sample grid, so the resampler is in phase.
+            seek_start = max(0, start - margin)
+            pipeline.seek(
+                    1.0, Gst.Format.TIME,
+                    Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                    Gst.SeekType.SET,
+                    Gst.util_uint64_scale(seek_start, Gst.SECOND, RATE),
+                    Gst.SeekType.SET if end is not None else
+                    Gst.SeekType.NONE,
+                    Gst.util_uint64_scale(end + margin, Gst.SECOND, RATE)
+                    if end is not None else -1)
+        pipeline.set_state(Gst.State.PLAYING)
+
+        channels = None
+        written = 0
+        while not appsink.get_property("eos"):
+            sample = appsink.emit("try-pull-sample", Gst.SECOND // 10)
+            if sample is None:
+                message = bus.pop_filtered(Gst.MessageType.ERROR)
+                if message is not None:
+                    err, debug = message.parse_error()
+                    raise RuntimeError("{}: {}".format(mp3_file, err))
+                continue
+            if channels is None:
+                channels = sample.get_caps().get_structure(0).get_value(
+                        "channels")
+                frame_bytes = SAMPLE_BYTES * channels
+            # Keep only the samples from start up to end.
+            buffer = sample.get_buffer()
+            first = Gst.util_uint64_scale_round(buffer.pts, RATE,
+                                                Gst.SECOND)
+            count = buffer.get_size() // frame_bytes
+            keep_from = max(start, first)
+            keep_to = first + count if end is None else min(end, first + count)
+            if keep_to > keep_from:
+                output.write(buffer.extract_dup(
+                        (keep_from - first) * frame_bytes,
+                        (keep_to - keep_from) * frame_bytes))
+                written += keep_to - keep_from
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+    return channels, written
+
+
+def decode_split(mp3_file, workers, wav_file):
+    'Decode the segments at the same time, into the wav file.'
+    duration, source_rate, channels = probe(mp3_file)
+    parts = segments(duration, source_rate, workers)
+    margin = margin_samples(source_rate)
+    directory = os.path.dirname(os.path.abspath(wav_file))
+
+    def decode_part(part):
+        output = tempfile.TemporaryFile(dir=directory)
+        try:
+            decoded, written = decode_segment(mp3_file, *part, output,
+                                              margin=margin)
+        except Exception:
+            output.close()
+            raise
+        if decoded is not None and decoded != channels:
+            output.close()
+            raise RuntimeError("{}: {} channels, not {}".format(
+                    mp3_file, decoded, channels))
+        output.seek(0)
+        return output
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(parts)) as pool:
+        futures = [pool.submit(decode_part, part) for part in parts]
+        with wave.open(wav_file, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(SAMPLE_BYTES)
+            wav.setframerate(RATE)
+            for future in futures:
+                with future.result() as output:
+                    for chunk in iter(lambda: output.read(
+                            CHUNK_FRAMES * SAMPLE_BYTES * channels), b""):
+                        wav.writeframesraw(chunk)
+
+
+def to_int(data, numpy):
+    'The S24LE samples of data as int32.'
+    c = numpy.frombuffer(data, numpy.uint8).reshape(-1, 3)
+    value = c[:, 0].astype(numpy.int32) | (c[:, 1].astype(numpy.int32)
+            << 8) | (c[:, 2].astype(numpy.int32) << 16)
+    return numpy.where(value & 0x800000, value - 0x1000000, value)
+
+
+def compare(serial, wav_file):
+    """
+    A description of the difference between the serial PCM, a file, and the
+    PCM of the split wav file. The samples that differ need NumPy.
+    """
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    serial.seek(0, os.SEEK_END)
+    serial_samples = serial.tell() // SAMPLE_BYTES
+    serial.seek(0)
+    differ = largest = 0
+    with wave.open(wav_file, "rb") as split:
+        chunk_bytes = CHUNK_FRAMES * SAMPLE_BYTES * split.getnchannels()
+        split_samples = split.getnframes() * split.getnchannels()
+        exact = serial_samples == split_samples
+        while True:
+            a = serial.read(chunk_bytes)
+            b = split.readframes(CHUNK_FRAMES)
+            if not a or not b:
+                break
+            if a == b:
+                continue
+            exact = False
+            if numpy is None:
+                break
+            length = min(len(a), len(b)) // SAMPLE_BYTES * SAMPLE_BYTES
+            diff = numpy.abs(to_int(a[:length], numpy)
+                             - to_int(b[:length], numpy))
+            differ += int(numpy.count_nonzero(diff))
+            largest = max(largest, int(diff.max()))
+    if exact:
+        return "bit-exact"
+    difference = "{} samples longer".format(split_samples - serial_samples)
+    if numpy is None:
+        return difference
+    return "{}, {} samples differ, max difference {} of 2^23".format(
+            difference, differ, largest)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Convert a mp3 file to wav on several cores.")
+    parser.add_argument("mp3_file", nargs="?", default=MP3_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--verify", action="store_true",
+                        help="Compare with a serial decode.")
+    parser.add_argument("--cores",
+                        help="Comma separated worker counts to compare.")
+    args = parser.parse_args()
+
+    if not args.mp3_file.lower().endswith('.mp3') or \
+            not os.path.isfile(args.mp3_file):
+        sys.exit("Error: {} is not a mp3 file".format(args.mp3_file))
+    wav_file = os.path.splitext(args.mp3_file)[0] + ".wav"
+
+    Gst.init(None)
+    counts = [int(count) for count in args.cores.split(",")] \
+            if args.cores else [args.workers]
+    serial = None
+    if args.verify or args.cores:
+        serial = tempfile.TemporaryFile(
+                dir=os.path.dirname(os.path.abspath(wav_file)))
+        start = time.perf_counter()
+        decode_segment(args.mp3_file, 0, None, serial)
+        serial_secs = time.perf_counter() - start
+        print("serial: {:.3f} secs".format(serial_secs))
+
+    for count in counts:
+        start = time.perf_counter()
+        decode_split(args.mp3_file, count, wav_file)
+        secs = time.perf_counter() - start
+        line = "{} workers: {:.3f} secs".format(count, secs)
+        if serial is not None:
+            line += ", {:.2f}x the serial speed, {}".format(
+                    serial_secs / secs, compare(serial, wav_file))
+        print(line)
+
+    if serial is not None:
+        serial.close()
+    print("Wrote {}".format(wav_file))
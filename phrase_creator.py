@@ -12,6 +12,18 @@
 # This file can be played when returning the time, before google tts adds the
 # actual time.
 #
+# Google already returns mp3, so by default the compressed bytes are written
+# to the file as they are. mpegaudioparse checks that they are mp3 frames
+# and gives the duration. Decoding and encoding again costs CPU and a
+# generation of quality, so it is only done for another --format, or for
+# --transcode. To compare the two on a batch of phrases served by a local
+# stand-in for Google, which returns hello.mp3 for every request:
+# $ python3 phrase_creator.py --benchmark 20
+#
+# --file saves a list of phrases, --workers at a time, through the rate
+# limiter of tts_limiter.py, so that throttled requests are retried:
+# $ python3 phrase_creator.py --file phrases.txt --workers 4
+#
 # Ian Stewart - 2020-03-25
 
 # Importing...
@@ -19,94 +31,235 @@ import sys
 import os.path
 import time
 import string
+import argparse
+import concurrent.futures
 import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst
 
+import tts_limiter
+
 PHRASE = "The cat came back."
+GOOGLE_TTS = ('https://translate.google.com/translate_tts?'
+              'ie=UTF-8&client=tw-ob&tl={}&q={}')
+
+# Output format -> encoder after decodebin. mp3 is only decoded and
+# encoded again if transcode is asked for.
+FORMATS = {
+        "mp3": "audioconvert ! lamemp3enc",
+        "wav": "audioconvert ! wavenc",
+        "ogg": "audioconvert ! vorbisenc ! oggmux",
+        }
+
+
+def phrase_filename(phrase, extension="mp3", directory="phrase"):
+    'The file of the phrase, with underscores in place of spaces.'
+    # strip punctuation 
+    table = str.maketrans('', '', string.punctuation)
+    phrase_string = phrase.strip().translate(table)
+    # convert all of phrase to lower case
+    phrase_string = phrase_string.lower()
+    # Join phrase with underscores
+    return "{}/{}.{}".format(directory, "_".join(phrase_string.split(" ")),
+                             extension)
+
 
-def phrase_mp3(phrase=PHRASE):
+def phrase_mp3(phrase=PHRASE, format="mp3", transcode=False,
+               uri_string=GOOGLE_TTS, directory="phrase"):
     """
     Requires a phrase. Check phrase. 
     Create filename from phrase with underscores instead of spaces.   
     Initialize: Gst
-    Build the pipeline template
+    Build the pipeline template. mp3 is parsed and saved as it is, unless
+    transcode is True. Other formats are decoded and encoded.
     Gst.parse_launch() to establish the pipeline
     Start the convertion.
     bus.poll() for EOS or Error.
     End by changing state to null.
+    Return the file name, milli-secs, CPU milli-secs and audio secs.
     """
 
     phrase = phrase.strip()
     #print(phrase)
 
     # Create filename...
-    # strip punctuation 
-    table = str.maketrans('', '', string.punctuation)
-    phrase_string = phrase.translate(table)
-    # convert all of phrase to lower case
-    phrase_string = phrase_string.lower()
-    # Join phrase with underscores
-    filepath_name = "phrase/" + "_".join(phrase_string.split(" ")) + ".mp3"
+    filepath_name = phrase_filename(phrase, format, directory)
     print(filepath_name)
 
     # Create phrase/ folder if it doesnt exists. Stores the phrases as mp3 files
-    if not os.path.isdir("phrase"):
-        print("INFO: Creating the directory '{}'".format("phrase/"))
-        os.mkdir("phrase")        
+    if not os.path.isdir(directory):
+        print("INFO: Creating the directory '{}'".format(directory))
+        # prefetch() saves phrases on several threads at once.
+        os.makedirs(directory, exist_ok=True)
 
     # phrase - Replace spaces with plus signs for sending to google tts
     phrase = "+".join(phrase.split(" "))
     
     # Create the uri
-    uri_string =  'https://translate.google.com/translate_tts?'
-    uri_string += 'ie=UTF-8&client=tw-ob&tl={}&q={}'
     uri = uri_string.format("en-au", phrase)
 
     #print(uri)
 
     start_time = time.time()
+    start_cpu = time.process_time()
 
     # Init
     Gst.init(None)
 
     # Pipeline template
+    if format == "mp3" and not transcode:
+        # The mp3 from google, checked and written unchanged.
+        steps = "mpegaudioparse name=parse"
+    else:
+        steps = "decodebin ! identity name=parse ! " + FORMATS[format]
     pipeline = """
-            {}
-            ! decodebin 
-            ! audioconvert 
-            ! lamemp3enc 
-            ! filesink location=./{}
+            {uri}
+            ! {steps}
+            ! filesink location=./{location}
             """
 
     # pipeline launch - pass mp3 and wav file path / names
-    pipe = Gst.parse_launch(pipeline.format(uri, filepath_name))
+    pipe = Gst.parse_launch(pipeline.format(uri=uri, steps=steps,
+                                            location=filepath_name))
+
+    # Sum the durations of the audio buffers.
+    duration = [0]
+
+    def on_buffer(pad, info):
+        buffer = info.get_buffer()
+        if buffer.duration != Gst.CLOCK_TIME_NONE:
+            duration[0] += buffer.duration
+        return Gst.PadProbeReturn.OK
+    pipe.get_by_name("parse").get_static_pad("src").add_probe(
+            Gst.PadProbeType.BUFFER, on_buffer)
 
     # Start converion
     pipe.set_state(Gst.State.PLAYING)  
 
     # wait until things stop
-    pipe.get_bus().poll(Gst.MessageType.EOS | Gst.MessageType.ERROR, 
-                          Gst.CLOCK_TIME_NONE)
+    message = pipe.get_bus().poll(Gst.MessageType.EOS | Gst.MessageType.ERROR, 
+                                  Gst.CLOCK_TIME_NONE)
 
     # After EOS
     pipe.set_state(Gst.State.NULL)
 
-    print("Time taken: {} milli-secs."
-            .format(int((time.time()-start_time) * 1000)))
+    if message.type == Gst.MessageType.ERROR:
+        raise RuntimeError("{}: {}".format(
+                filepath_name, tts_limiter.error_text(message)))
+
+    result = {"file": filepath_name,
+              "ms": int((time.time()-start_time) * 1000),
+              "cpu_ms": int((time.process_time()-start_cpu) * 1000),
+              "audio_secs": round(duration[0] / Gst.SECOND, 3)}
+    print("Time taken: {} milli-secs. CPU {} milli-secs. Audio {} secs."
+            .format(result["ms"], result["cpu_ms"], result["audio_secs"]))
+    return result
+
+
+def prefetch(phrases, limiter=None, workers=4, uri_string=GOOGLE_TTS,
+             directory="phrase"):
+    """
+    Save many phrases, workers at a time. Requests go through the
+    tts_limiter.Limiter, if given, so they are queued rather than failed
+    when google throttles them. Return the results and the errors.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    def save(phrase):
+        if limiter is None:
+            return phrase_mp3(phrase, "mp3", False, uri_string, directory)
+        return limiter.call(phrase_mp3, phrase, "mp3", False, uri_string,
+                            directory)
+
+    saved = []
+    errors = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(save, phrase) for phrase in phrases]
+        for future in futures:
+            try:
+                saved.append(future.result())
+            except RuntimeError as error:
+                errors.append(str(error))
+    return saved, errors
+
+
+def benchmark(count, port=8091, mp3_file="hello.mp3"):
+    """
+    Save count phrases from a local stand-in for google, which returns
+    mp3_file for every request. Once as they are, once decoded and encoded.
+    """
+    from fanout import FanoutServer
+
+    with open(mp3_file, "rb") as f:
+        mp3 = f.read()
+    server = FanoutServer(port=port)
+    server.add_handler("/translate_tts", lambda: ("audio/mpeg", mp3))
+    server.start()
+    uri_string = ("http://127.0.0.1:{}/translate_tts?"
+                  "ie=UTF-8&client=tw-ob&tl={{}}&q={{}}".format(port))
+    phrases = ["Benchmark phrase number {}".format(number + 1)
+               for number in range(count)]
+
+    totals = {}
+    try:
+        # Load the plugins before timing.
+        phrase_mp3("Warm up", "mp3", True, uri_string,
+                   directory="phrase_benchmark")
+        for transcode in (True, False):
+            ms = cpu_ms = 0
+            for phrase in phrases:
+                result = phrase_mp3(phrase, "mp3", transcode, uri_string,
+                                    directory="phrase_benchmark")
+                ms += result["ms"]
+                cpu_ms += result["cpu_ms"]
+            totals[transcode] = (ms, cpu_ms)
+    finally:
+        server.stop()
+
+    print()
+    for transcode, name in ((True, "decode and encode"), (False, "as is")):
+        ms, cpu_ms = totals[transcode]
+        print("{:18} {:8.1f} ms/phrase {:8.1f} CPU ms/phrase".format(
+                name, ms / count, cpu_ms / count))
 
 
 if __name__=="__main__":
 
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(
+            description="Save a phrase spoken by google tts to a file.")
+    parser.add_argument("phrase", nargs="?",
+                        help="A quoted phrase. E.g. \"The time is\"")
+    parser.add_argument("--format", default="mp3", choices=sorted(FORMATS))
+    parser.add_argument("--transcode", action="store_true",
+                        help="Decode and encode mp3, rather than save as is.")
+    parser.add_argument("--file",
+                        help="Save each phrase of this file, one per line, "
+                             "through the rate limiter of tts_limiter.py.")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="Phrases of --file fetched at once.")
+    parser.add_argument("--benchmark", type=int, metavar="COUNT",
+                        help="Compare saving as is with decode and encode, "
+                             "from a local stand-in for google.")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+
+    elif args.file:
+        with open(args.file) as f:
+            phrases = [line.strip() for line in f if line.strip()]
+        limiter = tts_limiter.Limiter()
+        saved, errors = prefetch(phrases, limiter, args.workers)
+        for error in errors:
+            print("Error: {}".format(error))
+        print("{} saved, {} failed. {}".format(len(saved), len(errors),
+                                               limiter.stats()))
+
+    elif args.phrase is None:
         print("Error: Please provide a quoted phrase.")
         print("Continuing. For testing purposes...")
         phrase_mp3()
 
     else:
-        phrase = sys.argv[1]
-        print(phrase)
-        phrase_mp3(phrase)
-
-
-
+        print(args.phrase)
+        phrase_mp3(args.phrase, args.format, args.transcode)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+#
+# pipeline_stats.py
+#
+# CPU time used by the branches of a GStreamer pipeline.
+#
+# Each queue in a pipeline starts a streaming thread, and everything
+# downstream of the queue, up to the next queue, runs in that thread. A pad
+# probe on the queue's src pad records the id of its thread. The CPU time
+# of the thread is then read from /proc/self/task/<tid>/stat, so the CPU
+# used by each branch can be reported without any profiler.
+#
+# Encoders that start their own worker threads, e.g. x264enc threads=4,
+# use CPU that is not counted. On systems without /proc, nothing is
+# reported.
+#
+import sys, os
+import time
+import threading
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def thread_cpu_seconds(tid):
+    'User plus system CPU seconds of a thread of this process, or None.'
+    try:
+        with open("/proc/self/task/{}/stat".format(tid)) as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name, in brackets, may contain spaces. Skip past it.
+    fields = stat[stat.rindex(")") + 2:].split()
+    # utime and stime are fields 14 and 15 of the stat file.
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+class BranchCpu(object):
+    """
+    Track the CPU of named branches. watch() a branch by a pad in its
+    thread, usually the src pad of the queue at its start. sample()
+    returns the CPU % of each branch since the last sample, where 100 is
+    one core.
+    """
+
+    def __init__(self):
+        self.tids = {}  # branch name -> thread id
+        self.last = {}  # branch name -> (wall time, cpu seconds)
+
+    def watch(self, name, pad):
+        'Record the thread that pushes buffers through pad.'
+        def on_buffer(pad, info):
+            self.tids[name] = threading.get_native_id()
+            return Gst.PadProbeReturn.REMOVE
+        pad.add_probe(Gst.PadProbeType.BUFFER, on_buffer)
+
+    def totals(self):
+        'Dictionary of branch name to CPU seconds since its thread started.'
+        result = {}
+        for name, tid in list(self.tids.items()):
+            cpu = thread_cpu_seconds(tid)
+            if cpu is not None:
+                result[name] = cpu
+        return result
+
+    def sample(self):
+        'Dictionary of branch name to CPU % since the previous sample.'
+        now = time.time()
+        result = {}
+        for name, tid in list(self.tids.items()):
+            cpu = thread_cpu_seconds(tid)
+            if cpu is None:
+                continue
+            if name in self.last:
+                then, previous = self.last[name]
+                result[name] = round(100 * (cpu - previous)
+                                     / max(now - then, 0.001), 1)
+            self.last[name] = (now, cpu)
+        return result
@@ -45,45 +45,17 @@ import gi
 gi.require_version('Gst', '1.0')
 from gi.repository import Gst, GLib
 
+from station_catalogue import StationCatalogue
+
 # For BBC Station info: 
 # https://www.astra2sat.com/radio/bbc-radio/bbc-aac-radio-streams/
 
-# Edit this staton list if you wish to add or remove radio stations.
-# Each tuple is the name of the radio station and the url
-station_list = [
-        ( 
-        "Radio New Zealand Concert Program",
-        "http://radionz-ice.streamguys.com/concert",
-        ),
-        ( 
-        "Radio New Zealand Nation Program",
-        "http://radionz-ice.streamguys.com/national",
-        ),
-        ( 
-        "ABC Sydney 702AM",
-        "http://live-radio01.mediahubaustralia.com/2LRW/mp3/",
-        ),
-        (
-        "BBC Radio One",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_one.m3u8",
-        ),
-        (
-        "BBC Radio Two",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_two.m3u8",
-        ),
-        (
-        "BBC Radio Three",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_three.m3u8",
-        ),
-        (
-        "BBC Radio Four",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_fourfm.m3u8",
-        ),
-        (
-        "Coast",
-        "http://ais-nzme.streamguys1.com/nz_011_aac",
-        ),
-        ]
+# The stations are in stations.json. Edit that file if you wish to add or 
+# remove radio stations. The catalogue is only opened when the menu is shown.
+catalogue = StationCatalogue()
+
+# Number of stations shown on each page of the menu.
+PAGE_SIZE = 20
 
 
 # Edit these headings and lists to tailor menus to requirements.
@@ -95,7 +67,7 @@ menu_1_list = []  # List is generated by sub_menu_1() function
 exit_message_1 = "Exit" # Not Used - Random exit overides
 
 
-def create_menu(heading, menu_list, exit_message = default_menu_exit_message):
+def create_menu(heading, menu_list, exit_message = default_menu_exit_message, allow_text=False):
     "Create a menu. Accept keyboard input and validate. Return keyboard string"  
     while True:
         # Display a heading
@@ -123,6 +95,9 @@ def create_menu(heading, menu_list, exit_message = default_menu_exit_message):
                         .format(response, len(menu_list)))
                 continue
         except ValueError as e:
+            if allow_text:
+                # Not a number. Let the caller use it as a command or search.
+                return response
             # A string that cannot be convertded to an integer
             print("\nInvalid entry: {}. Enter a number between 0 and {}\n"
                     .format(response, len(menu_list)))
@@ -131,29 +106,58 @@ def create_menu(heading, menu_list, exit_message = default_menu_exit_message):
 
 def create_menu_1():
     "Launch Menu to select radio station to play."
-
+    # Text entered at the prompt is a prefix search of the station names.
+    # Only the page of stations being displayed is read from the catalogue.
+    prefix = ""
+    offset = 0
     while True:
+        total = catalogue.count(prefix)
+        page = catalogue.search(prefix, limit=PAGE_SIZE, offset=offset)
+
         # Pass: heading, list of items, exit message. Returns numeral string
-        menu_1_list = []
-        for index, item in enumerate(station_list):
-            menu_1_list.append(item[0])
-       
-        response = create_menu(menu_1_heading, menu_1_list, exit_message_1)
+        menu_1_list = [station.name for station in page]
+        heading = "{} ({}-{} of {})".format(
+                menu_1_heading if not prefix
+                else '{} matching "{}"'.format(menu_1_heading, prefix),
+                offset + 1 if total else 0, offset + len(page), total)
+        heading += ("\n   Type text to search, > next page, < previous page,"
+                    " / clear search")
+
+        response = create_menu(heading, menu_1_list, exit_message_1,
+                               allow_text=True)
 
         if response == "0":
             # Return to main menu
             return response # "0"
 
-        if response != "0":
-            # The response string is used to selected the radio station.
-            # Select the station
-            station_index = int(response) - 1
+        if response == ">":
+            if offset + PAGE_SIZE < total:
+                offset += PAGE_SIZE
+            continue
+
+        if response == "<":
+            offset = max(0, offset - PAGE_SIZE)
+            continue
+
+        if response == "/":
+            prefix = ""
+            offset = 0
+            continue
+
+        if not response.strip().isdigit():
+            # Search for stations starting with the text entered.
+            prefix = response.strip()
+            offset = 0
+            continue
+
+        # The response string is used to selected the radio station.
+        # Select the station
+        station = page[int(response) - 1]
 
-            print("\n Station selected: {}"
-                    .format(station_list[station_index][0]))
+        print("\n Station selected: {}".format(station.name))
 
-            # Return the uri
-            return station_list[station_index][1]
+        # Return the uri
+        return station.url
 
 def main():
     'Main program code. Launch menus. Call radio() station player.'
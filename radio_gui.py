@@ -3,7 +3,7 @@
 # radio_gui.py
 #
 # Uses the Gstreamer plugin "playbin".
-# Create a Gtk window and display a list of internet radio stations
+# Create a Gtk window and display a searchable list of internet radio stations
 # Includes mute and volume control
 # Command line setting of initial station, mute and volume
 #
@@ -14,69 +14,53 @@ import argparse
 import gi
 gi.require_version('Gst', '1.0')
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gst, Gtk
+from gi.repository import Gst, GLib, Gtk
+
+from station_catalogue import StationCatalogue
+from loudness import Normalizer
 
 # Station to play on launch. Enter the integer. Starts at 1
 # Enter 0 for no station to be selected on launch.
 START_STATION_NUMBER = 1
 START_MUTED = False  # <-- Boolean True or False
 START_VOLUME = 50  # <--- Range from 0 to 100
+START_NORMALIZE = False  # <-- Even out the loudness of the stations
+START_SILENCE = 0  # <-- Seconds of dead air before warning. 0 is off.
 
-# Edit this list to add and remove stations. 
+# The stations are in stations.json. Edit that file to add and remove stations.
 # Place your preferred station at the start of the list and it will play on launch.
-# Tuples require a name and the url of the internet station
-radio_station_list = [
-        ( 
-        "RNZ Concert Program",
-        "http://radionz-ice.streamguys.com/concert",
-        ),
-        ( 
-        "RNZ Nation Program",
-        "http://radionz-ice.streamguys.com/national",
-        ),
-        ( 
-        "ABC Sydney 702AM",
-        "http://live-radio01.mediahubaustralia.com/2LRW/mp3/",
-        ),
-        (
-        "BBC Radio One",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_one.m3u8",
-        ),
-        (
-        "BBC Radio Two",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_two.m3u8",
-        ),
-        (
-        "BBC Radio Three",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_three.m3u8",
-        ),
-        (
-        "BBC Radio Four",
-        "http://a.files.bbci.co.uk/media/live/manifesto/audio/simulcast/hls/nonuk/sbr_low/ak/bbc_radio_fourfm.m3u8",
-        ),
-        (
-        "Coast",
-        "http://ais-nzme.streamguys1.com/nz_011_aac",
-        ),
-        (
-        "Radio Hauraki",
-        "http://ais-nzme.streamguys1.com/nz_009_aac",
-        ),
-        (
-        "NewTalk ZB",
-        "http://ais-nzme.streamguys1.com/nz_002_aac",
-        ),
-        ]
-
-
-def create_gui(radio_station_list):
+catalogue = StationCatalogue()
+
+# Number of stations added to the list each time Gtk is idle.
+LOAD_CHUNK = 500
+
+
+def create_gui(catalogue):
         'Initialize and instantiate pipeline'
         pipeline = radio_start()
 
+        # Optional loudness analysis of the audio playbin has decoded.
+        normalizer = None
+        if args.normalize or args.silence > 0:
+            def cb_silence(seconds):
+                'Dead air. The station has been silent for a while.'
+                print("Station silent for {:.0f} secs".format(seconds))
+                window.set_title("{} (silent)".format(state["name"]))
+
+            def cb_sound():
+                print("Station audio has returned")
+                window.set_title(state["name"])
+
+            normalizer = Normalizer(silence_secs=args.silence, 
+                                    on_silence=cb_silence, on_sound=cb_sound,
+                                    apply_gain=args.normalize)
+            pipeline.set_property('audio-filter', normalizer.bin)
+            pipeline.bus.connect("message::element", normalizer.on_message)
+
         # Create the window
         window = Gtk.Window(Gtk.WindowType.TOPLEVEL)
         window.set_title("Internet Radio")
-        window.set_default_size(100, 100)
+        window.set_default_size(360, 480)
         window.connect("destroy", Gtk.main_quit, "WM destroy")
         window.set_position(Gtk.WindowPosition.CENTER_ALWAYS)
         # 'CENTER', 'CENTER_ALWAYS', 'CENTER_ON_PARENT', 'MOUSE', 'NONE',
@@ -91,52 +75,115 @@ def create_gui(radio_station_list):
         box.set_margin_left(20)
         box.set_margin_right(20)
 
-
-        def cb_radio_button(radiobutton, index):
+        # The stations are held in a ListStore model of (name, url, number).
+        # The TreeView only renders the rows that are visible, and with
+        # fixed height mode it does not measure every row. The store is
+        # filled in chunks when Gtk is idle, so the window appears at once
+        # however large the catalogue is.
+        store = Gtk.ListStore(str, str, int)
+        treeview = Gtk.TreeView(model=store)
+        treeview.set_headers_visible(False)
+        treeview.set_enable_search(False)
+        column = Gtk.TreeViewColumn("Station", Gtk.CellRendererText(), 
+                                    text=0)
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        treeview.append_column(column)
+        treeview.set_fixed_height_mode(True)
+
+        scrolledwindow = Gtk.ScrolledWindow()
+        scrolledwindow.set_min_content_height(240)
+        scrolledwindow.set_vexpand(True)
+        scrolledwindow.add(treeview)
+
+        # Holds the url now playing, the station number to highlight and 
+        # the id of the idle function filling the store.
+        state = {"uri": None, "name": "", "number": 0, "loader": None}
+
+        def play(uri, name):
+            'Stop the previous station and start playing the new one.'
+            if uri == state["uri"]:
+                return
+            state["uri"] = uri
+            state["name"] = name
+            window.set_title(name)
+            if normalizer is not None:
+                normalizer.station_changed(uri)
+
+            # Stop previous radio station
+            pipeline.set_state(Gst.State.NULL)
+
+            # Select and start playing new station.
+            pipeline.set_property('uri', uri)
+            pipeline.set_state(Gst.State.PLAYING)
+
+
+        def cb_selection_changed(selection):
             'Call back to change radio stations'
-            if radiobutton.get_active():
-                # Change title to newly selected station
-                #window.set_title("{}".format(radiobutton.get_label()))
-
-                # Stop previous radio station
-                pipeline.set_state(Gst.State.NULL)
-
-                # Select and start playing new station.
-                uri = radio_station_list[index][1]
-                pipeline.set_property('uri', uri)
-                pipeline.set_state(Gst.State.PLAYING)
-
-
-        # Create the radio buttons based on radio_station_list
-        # Radio buttons as a group so they are referenced by their index.
-        rb = []
-
-        # Create first radio button
-        rb.append(Gtk.RadioButton.new_with_label_from_widget(
-                None, radio_station_list[0][0]))        
-        rb[0].connect("toggled", cb_radio_button, 0)
-        box.pack_start(rb[0], False , False ,0)
-
-        # Create remaining radio buttons
-        for index, option in enumerate(radio_station_list[1:]):
-            rb.append(Gtk.RadioButton.new_with_label_from_widget(
-                    rb[0], radio_station_list[index + 1][0]))
-            box.pack_start(rb[index + 1], False, False, 0)
-            rb[index+1].connect(
-                    "toggled", cb_radio_button, index + 1)
-        
-        # Add dummy - which is hidden
-        rb.append(Gtk.RadioButton.new_with_label_from_widget(rb[0], "dummy")) 
-        box.pack_start(rb[len(radio_station_list)], False, False, 0)  
-
-        # Set initial station or the dummy station
-        if args.station < 1 or args.station > len(radio_station_list):
-            # Select dummy
-            rb[len(radio_station_list)].set_active(True)
-        else:
-            # Station 0 needs a wiggle go to dummy first then the station.
-            rb[len(radio_station_list)].set_active(True)        
-            rb[args.station - 1].set_active(True)
+            model, treeiter = selection.get_selected()
+            if treeiter is None:
+                return
+            state["number"] = model[treeiter][2]
+            play(model[treeiter][1], model[treeiter][0])
+
+
+        selection = treeview.get_selection()
+        selection.set_mode(Gtk.SelectionMode.SINGLE)
+        selection_handler = selection.connect("changed", cb_selection_changed)
+
+        def load_stations(prefix):
+            'Generator that adds the matching stations to the store in chunks.'
+            offset = 0
+            while True:
+                stations = catalogue.search(prefix, limit=LOAD_CHUNK, 
+                                            offset=offset)
+                for station in stations:
+                    treeiter = store.append(
+                            (station.name, station.url, station.number))
+                    if station.number == state["number"]:
+                        # Highlight the station playing without restarting it.
+                        selection.handler_block(selection_handler)
+                        selection.select_iter(treeiter)
+                        selection.handler_unblock(selection_handler)
+                if len(stations) < LOAD_CHUNK:
+                    break
+                offset += LOAD_CHUNK
+                yield True
+            state["loader"] = None
+            yield False
+
+
+        def fill_store(prefix):
+            'Start filling the store with the stations starting with prefix.'
+            if state["loader"] is not None:
+                GLib.source_remove(state["loader"])
+            selection.handler_block(selection_handler)
+            store.clear()
+            selection.handler_unblock(selection_handler)
+            loader = load_stations(prefix)
+            # The first chunk straight away. The remainder when Gtk is idle.
+            if next(loader):
+                state["loader"] = GLib.idle_add(next, loader)
+
+
+        def cb_search_changed(entry):
+            'Incremental prefix search of the station names.'
+            fill_store(entry.get_text().strip())
+
+
+        # Filter entry above the list of stations.
+        search_entry = Gtk.SearchEntry()
+        search_entry.set_placeholder_text("Search stations")
+        search_entry.connect("search-changed", cb_search_changed)
+        box.pack_start(search_entry, False, False, 0)
+        box.pack_start(scrolledwindow, True, True, 0)
+
+        # Set initial station. 0 or out of range is no station.
+        station = catalogue.get(args.station) if args.station > 0 else None
+        if station is not None:
+            state["number"] = station.number
+            play(station.url, station.name)
+
+        fill_store("")
             
 
         # Add a horizontal seperator line
@@ -156,7 +203,7 @@ def create_gui(radio_station_list):
         checkbox = Gtk.CheckButton(label = "Mute")
         checkbox.connect('toggled', cb_checkbox)
         checkbox.set_active(args.muting)
-        box.pack_start(checkbox, True, True, 0)
+        box.pack_start(checkbox, False, False, 0)
 
         # Volume control using Scale widget
         def cb_scale_moved(scale):
@@ -170,21 +217,18 @@ def create_gui(radio_station_list):
         scale.connect("value-changed", cb_scale_moved)
         # Set initial volume based on args.volume or default of START_VOLUME
         scale.set_value(args.volume)
-        box.pack_start(scale, True, True, 0)
+        box.pack_start(scale, False, False, 0)
 
         vbox.add(box)
 
         # Get the show on the road.
         window.show_all()
-
-
-        # Hide the dummy entry at the end of the list
-        # This hide() needs to go after window.show_all()
-        rb[len(radio_station_list)].hide()
-
+        search_entry.grab_focus()
 
         Gtk.main()
         pipeline.set_state(Gst.State.NULL)
+        if normalizer is not None:
+            normalizer.save()
         window.destroy()
 
 
@@ -249,9 +293,21 @@ if __name__ == "__main__":
     parser.add_argument('--no-muting', dest='muting', action='store_false')
     parser.set_defaults(muting=START_MUTED)
 
+    parser.add_argument('--normalize', dest='normalize', action='store_true',
+                        help="Even out the loudness of the stations.")
+    parser.add_argument('--no-normalize', dest='normalize', 
+                        action='store_false')
+    parser.set_defaults(normalize=START_NORMALIZE)
+
+    parser.add_argument("--silence", 
+                        type=int, 
+                        default=START_SILENCE,
+                        help="Warn after this many seconds of dead air. "
+                             "0 is off.")
+
     args = parser.parse_args()
 
-    create_gui(radio_station_list)
+    create_gui(catalogue)
 
 
 
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+#
+# radio_server.py
+#
+# Headless internet radio fan-out server.
+#
+# When several computers in the office listen to the same station, each one
+# pulls its own copy of the stream from the internet. This program fetches
+# the station once and re-serves the compressed stream, without decoding or
+# re-encoding it, to any number of local clients over HTTP.
+#
+# Like radio_efficient.py it initializes and instantiates once, and then
+# changes stations by changing the uri property of the source.
+#
+# The pipeline is:
+#
+#   urisourcebin uri=<station>
+#   ! tee name=split
+#   split. ! queue ! multisocketsink      <-- HTTP clients, see fanout.py
+#   split. ! queue leaky=downstream ! decodebin ! audioconvert
+#          ! autoaudiosink                <-- Only with --listen
+#
+# Each client has its own queue inside multisocketsink, so a slow client can
+# not stall the others. http://<host>:<port>/metrics returns the number of
+# clients and the lag of each one as JSON.
+#
+# Examples:
+# $ python3 radio_server.py --station 3
+# $ python3 radio_server.py --port 8000 --host 0.0.0.0
+# $ mpv http://127.0.0.1:8000/radio
+# $ curl http://127.0.0.1:8000/metrics
+#
+# Without --station the station menu of radio_efficient.py is displayed.
+#
+import sys, os
+import argparse
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from station_catalogue import StationCatalogue
+from fanout import FanoutServer
+from radio_efficient import create_menu_1, on_eos, on_error
+
+catalogue = StationCatalogue()
+
+# Content type sent to HTTP clients for each codec in stations.json
+CONTENT_TYPES = {
+        "mp3": "audio/mpeg",
+        "aac": "audio/aac",
+        }
+
+
+def radio_server_start(server, listen=False):
+    'Initialize and instantiate. Attach the multisocketsink to the server.'
+    # Init
+    Gst.init(None)
+
+    pipeline_template = """
+            urisourcebin name=source
+            tee name=split
+            split. ! queue ! multisocketsink name=clients
+            """
+    if listen:
+        pipeline_template += """
+            split. ! queue leaky=downstream ! decodebin ! audioconvert
+                   ! autoaudiosink
+            """
+    pipeline = Gst.parse_launch(pipeline_template)
+
+    source = pipeline.get_by_name("source")
+    source.connect("pad-added", on_pad_added,
+                   pipeline.get_by_name("split"))
+
+    stream = server.add_stream("/radio", pipeline.get_by_name("clients"),
+                               "audio/mpeg")
+
+    # Instantiate and initialize the bus call-back
+    loop = GLib.MainLoop()
+
+    # Binding End-of-Stream-Signal on source pipe
+    pipeline.bus.add_signal_watch()
+    pipeline.bus.connect("message::eos", on_eos, loop)
+    pipeline.bus.connect("message::error", on_error)
+
+    return pipeline, loop, stream
+
+
+def on_pad_added(source, pad, split):
+    'Link the compressed stream from urisourcebin to the tee.'
+    sinkpad = split.get_static_pad("sink")
+    if sinkpad.is_linked():
+        # Only the first stream is served.
+        return
+    pad.link(sinkpad)
+
+
+def radio_server(pipeline, loop, stream, uri, codec="mp3"):
+    'Fetch the station once and serve it until Control-C.'
+    stream.content_type = CONTENT_TYPES.get(codec, "application/octet-stream")
+    pipeline.get_by_name("source").set_property('uri', uri)
+
+    print("\n Serving... Type control-C to stop")
+    pipeline.set_state(Gst.State.PLAYING)
+
+    try:
+        loop.run()
+
+    except KeyboardInterrupt:
+        print('\n Station stopped via Ctrl-C')
+
+    finally:
+        # Setting the state to NULL disconnects all the clients.
+        pipeline.set_state(Gst.State.NULL)
+
+
+def print_metrics(stream):
+    'Periodic console report of the clients.'
+    print(" " + stream.report())
+    return True
+
+
+def main():
+    'Start the HTTP server and the pipeline. Serve the chosen station(s).'
+    parser = argparse.ArgumentParser(
+            description="Serve one radio station to many local clients.")
+    parser.add_argument("-s", "--station", type=int, default=0,
+                        help="Number of the station to serve. "
+                             "0 displays the station menu.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--listen", action="store_true",
+                        help="Also play the station on this computer.")
+    parser.add_argument("--report", type=int, default=0,
+                        help="Print the client metrics every N seconds.")
+    args = parser.parse_args()
+
+    server = FanoutServer(args.host, args.port)
+    pipeline, loop, stream = radio_server_start(server, args.listen)
+    server.start()
+
+    if args.report > 0:
+        GLib.timeout_add_seconds(args.report, print_metrics, stream)
+
+    if args.station > 0:
+        station = catalogue.get(args.station)
+        if station is None:
+            sys.exit("Error: There is no station number {}"
+                     .format(args.station))
+        print("\n Station: {}".format(station.name))
+        radio_server(pipeline, loop, stream, station.url, station.codec)
+
+    else:
+        while True:
+            uri = create_menu_1()
+            if uri == "0":
+                break
+            # Look up the codec for the content type sent to the clients.
+            station = catalogue.get_by_url(uri)
+            radio_server(pipeline, loop, stream, uri, station.codec)
+
+    server.stop()
+    sys.exit("\n bye...")
+
+
+if __name__ == "__main__":
+
+    main()
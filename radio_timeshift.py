@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+#
+# radio_timeshift.py
+#
+# Console internet radio with a time-shift buffer.
+# Pause, rewind and catch up to live without reconnecting to the station.
+#
+# The station is decoded by a capture pipeline and the audio is written to a
+# ring buffer holding the last N minutes. The ring buffer is a memory-mapped
+# temporary file, so memory use stays the same however long the station
+# plays. A second pipeline plays from the ring buffer:
+#
+#   Capture:  uridecodebin uri=<station> ! audioconvert ! audioresample
+#             ! audio/x-raw,format=S16LE,rate=44100,channels=2 ! appsink
+#
+#   Playback: appsrc format=bytes stream-type=seekable
+#             ! rawaudioparse ! scaletempo ! audioconvert ! autoaudiosink
+#
+# rawaudioparse turns time seeks into byte offsets, which appsrc passes to
+# the "seek-data" call back. Thus seeking back is an ordinary Gst seek.
+# Catching up to live uses a seek with a rate of 1.05, and scaletempo keeps
+# the pitch the same while it plays faster.
+#
+# Commands, typed while a station is playing:
+#   p      Pause or resume
+#   b [s]  Back s seconds. Default 30
+#   f [s]  Forward s seconds. Default 30
+#   l      Catch up to live
+#   s      Status
+#   q      Quit to the station menu. Control-C also does this.
+#
+# The time from each seek to the first buffer reaching the audio sink is
+# measured and reported when the station is stopped.
+#
+# $ python3 radio_timeshift.py --minutes 10
+#
+import sys, os
+import time
+import mmap
+import argparse
+import tempfile
+import threading
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst, GLib
+
+from radio_efficient import create_menu_1
+
+# Format of the audio held in the ring buffer.
+RATE = 44100
+CHANNELS = 2
+BYTES_PER_SAMPLE = 2
+FRAME_BYTES = CHANNELS * BYTES_PER_SAMPLE
+BYTES_PER_SEC = RATE * FRAME_BYTES
+
+DEFAULT_MINUTES = 30
+CATCH_UP_RATE = 1.05
+SKIP_SECS = 30
+# Bytes pushed to appsrc at a time. About 23 milli-secs of audio.
+CHUNK = 1024 * FRAME_BYTES
+
+
+class RingBuffer(object):
+    """
+    Fixed size ring buffer of bytes held in a memory-mapped file.
+    Offsets are absolute, counted from the first byte ever written.
+    The bytes from start to written are available to read.
+    """
+
+    def __init__(self, size, filename=None):
+        self.size = size - size % FRAME_BYTES
+        if filename is None:
+            self.file = tempfile.TemporaryFile(prefix="timeshift")
+        else:
+            self.file = open(filename, "w+b")
+        self.file.truncate(self.size)
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+        self.written = 0
+        self.lock = threading.Lock()
+
+    @property
+    def start(self):
+        'Oldest offset still held in the buffer.'
+        return max(0, self.written - self.size)
+
+    def reset(self):
+        with self.lock:
+            self.written = 0
+
+    def write(self, data):
+        with self.lock:
+            if len(data) > self.size:
+                # Only the end of the data fits.
+                self.written += len(data) - self.size
+                data = data[-self.size:]
+            length = len(data)
+            position = self.written % self.size
+            first = min(length, self.size - position)
+            self.map[position:position + first] = data[:first]
+            if first < length:
+                self.map[0:length - first] = data[first:]
+            self.written += length
+
+    def read(self, offset, length):
+        """
+        Return (offset, data) of up to length bytes at offset. The offset is
+        moved forward if it has already been overwritten.
+        """
+        with self.lock:
+            offset = max(offset, self.start)
+            length = max(0, min(length, self.written - offset))
+            position = offset % self.size
+            first = min(length, self.size - position)
+            data = self.map[position:position + first]
+            if first < length:
+                data += self.map[0:length - first]
+            return offset, data
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+
+class TimeShiftRadio(object):
+    'Capture a station into a RingBuffer and play it back with seeking.'
+
+    def __init__(self, minutes=DEFAULT_MINUTES):
+        Gst.init(None)
+        self.ring = RingBuffer(int(minutes * 60 * BYTES_PER_SEC))
+        self.read_offset = 0
+        self.feed_lock = threading.Lock()
+        self.wanted = False
+        self.catching_up = False
+        self.seek_time = None
+        self.latencies = []
+        self.loop = GLib.MainLoop()
+
+        capture_template = """
+                uridecodebin name=source
+                ! audioconvert ! audioresample
+                ! audio/x-raw,format=S16LE,rate={},channels={},layout=interleaved
+                ! appsink name=capture emit-signals=true sync=false
+                """.format(RATE, CHANNELS)
+        self.capture = Gst.parse_launch(capture_template)
+        self.capture.get_by_name("capture").connect("new-sample",
+                                                    self.on_new_sample)
+
+        playback_template = """
+                appsrc name=playback format=bytes stream-type=seekable
+                       max-bytes={}
+                ! rawaudioparse format=pcm pcm-format=s16le
+                                sample-rate={} num-channels={}
+                ! scaletempo ! audioconvert ! audioresample
+                ! autoaudiosink name=output
+                """.format(BYTES_PER_SEC // 4, RATE, CHANNELS)
+        self.playback = Gst.parse_launch(playback_template)
+        self.appsrc = self.playback.get_by_name("playback")
+        self.appsrc.set_property("size", -1)
+        self.appsrc.connect("need-data", self.on_need_data)
+        self.appsrc.connect("enough-data", self.on_enough_data)
+        self.appsrc.connect("seek-data", self.on_seek_data)
+
+        # Measure the time from a seek to audio arriving at the sink.
+        self.playback.get_by_name("output").get_static_pad("sink").add_probe(
+                Gst.PadProbeType.BUFFER, self.on_output_buffer)
+
+        for pipeline in (self.capture, self.playback):
+            pipeline.bus.add_signal_watch()
+            pipeline.bus.connect("message::error", self.on_error)
+            pipeline.bus.connect("message::eos", self.on_eos)
+
+    # Capture side
+
+    def on_new_sample(self, appsink):
+        'Write the decoded audio into the ring buffer.'
+        buffer = appsink.emit("pull-sample").get_buffer()
+        self.ring.write(buffer.extract_dup(0, buffer.get_size()))
+        if self.wanted:
+            self.feed()
+        return Gst.FlowReturn.OK
+
+    # Playback side
+
+    def feed(self):
+        'Push the audio after read_offset to appsrc until it has enough.'
+        # Called from both the capture and the playback streaming threads.
+        with self.feed_lock:
+            self._feed()
+
+    def _feed(self):
+        while self.wanted:
+            offset, data = self.ring.read(self.read_offset, CHUNK)
+            if not data:
+                # At the live edge. Wait for the next capture.
+                if self.catching_up:
+                    GLib.idle_add(self.end_catch_up)
+                return
+            self.read_offset = offset + len(data)
+            self.appsrc.emit("push-buffer", Gst.Buffer.new_wrapped(data))
+
+    def on_need_data(self, appsrc, length):
+        self.wanted = True
+        self.feed()
+
+    def on_enough_data(self, appsrc):
+        self.wanted = False
+
+    def on_seek_data(self, appsrc, offset):
+        'rawaudioparse converted a time seek to this byte offset.'
+        offset -= offset % FRAME_BYTES
+        with self.feed_lock:
+            self.read_offset = min(max(offset, self.ring.start),
+                                   self.ring.written)
+        return True
+
+    def on_output_buffer(self, pad, info):
+        if self.seek_time is not None:
+            self.latencies.append(time.time() - self.seek_time)
+            self.seek_time = None
+        return Gst.PadProbeReturn.OK
+
+    # Controls
+
+    def position(self):
+        'Seconds from the start of the station that is being heard.'
+        ok, position = self.playback.query_position(Gst.Format.TIME)
+        if not ok:
+            return self.read_offset / BYTES_PER_SEC
+        return position / Gst.SECOND
+
+    def behind_live(self):
+        return max(0.0, self.ring.written / BYTES_PER_SEC - self.position())
+
+    def seek(self, seconds, rate=1.0):
+        'Seek within the buffered window. Clamped to the window.'
+        start = self.ring.start / BYTES_PER_SEC
+        live = self.ring.written / BYTES_PER_SEC
+        seconds = min(max(seconds, start), live)
+        self.seek_time = time.time()
+        self.playback.seek(rate, Gst.Format.TIME,
+                           Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                           Gst.SeekType.SET, int(seconds * Gst.SECOND),
+                           Gst.SeekType.NONE, -1)
+
+    def skip(self, seconds):
+        self.catching_up = False
+        self.seek(self.position() + seconds)
+
+    def toggle_pause(self):
+        'The capture continues while paused. The playback waits.'
+        state = self.playback.get_state(0)[1]
+        if state == Gst.State.PLAYING:
+            self.playback.set_state(Gst.State.PAUSED)
+            print(" Paused")
+        else:
+            if self.ring.start / BYTES_PER_SEC > self.position():
+                # Paused for longer than the buffer. Resume at the oldest.
+                self.seek(self.ring.start / BYTES_PER_SEC)
+            self.playback.set_state(Gst.State.PLAYING)
+            print(" Resumed {:.1f} secs behind live".format(
+                    self.behind_live()))
+
+    def catch_up(self):
+        'Play faster, with the same pitch, until the live edge is reached.'
+        if self.behind_live() < 1.0:
+            print(" Already live")
+            return
+        self.catching_up = True
+        self.playback.set_state(Gst.State.PLAYING)
+        self.seek(self.position(), CATCH_UP_RATE)
+        print(" Catching up at x{}. {:.1f} secs behind live".format(
+                CATCH_UP_RATE, self.behind_live()))
+
+    def end_catch_up(self):
+        if self.catching_up:
+            self.catching_up = False
+            self.seek(self.position())
+            print(" Live")
+        return False
+
+    def status(self):
+        print(" {:.1f} secs behind live. {:.0f} secs buffered.".format(
+                self.behind_live(),
+                (self.ring.written - self.ring.start) / BYTES_PER_SEC))
+
+    # Running
+
+    def on_command(self, source, condition):
+        'Handle a command typed on the console.'
+        words = sys.stdin.readline().split()
+        if not words:
+            return True
+        command = words[0].lower()
+        try:
+            amount = float(words[1]) if len(words) > 1 else SKIP_SECS
+        except ValueError:
+            command = None
+        if command == "p":
+            self.toggle_pause()
+        elif command == "b":
+            self.skip(-amount)
+        elif command == "f":
+            self.skip(amount)
+        elif command == "l":
+            self.catch_up()
+        elif command == "s":
+            self.status()
+        elif command == "q":
+            self.loop.quit()
+        else:
+            print(" Commands: p, b [secs], f [secs], l, s, q")
+        return True
+
+    def play(self, uri):
+        'Play the station until q or Control-C.'
+        self.ring.reset()
+        self.read_offset = 0
+        self.latencies = []
+        self.capture.get_by_name("source").set_property("uri", uri)
+        self.capture.set_state(Gst.State.PLAYING)
+        self.playback.set_state(Gst.State.PLAYING)
+
+        print("\n Streaming... Commands: p pause, b back, f forward, "
+              "l live, s status, q quit")
+        watch = GLib.io_add_watch(sys.stdin, GLib.IO_IN, self.on_command)
+
+        try:
+            self.loop.run()
+        except KeyboardInterrupt:
+            print('\n Station deselected via Ctrl-C')
+        finally:
+            GLib.source_remove(watch)
+            self.playback.set_state(Gst.State.NULL)
+            self.capture.set_state(Gst.State.NULL)
+            self.wanted = False
+            self.catching_up = False
+
+        if self.latencies:
+            print(" Seek to audio latency: mean {:.0f} ms, max {:.0f} ms "
+                  "over {} seeks".format(
+                    1000 * sum(self.latencies) / len(self.latencies),
+                    1000 * max(self.latencies), len(self.latencies)))
+
+    def on_eos(self, bus, message):
+        print('Received End-of-Stream')
+        self.loop.quit()
+
+    def on_error(self, bus, message):
+        'Exit is error. E.g. Internet connection failed.'
+        print("Bus name:", bus.get_name())
+        error, debug = message.parse_error()
+        print("Error: {}:\n{}".format(error.code, debug))
+        self.loop.quit()
+
+    def close(self):
+        self.ring.close()
+
+
+def main():
+    'Create the time-shift radio once. Call menu creation. Play stations.'
+    parser = argparse.ArgumentParser(
+            description="Internet radio with pause, rewind and catch up.")
+    parser.add_argument("-m", "--minutes", type=float,
+                        default=DEFAULT_MINUTES,
+                        help="Minutes of audio held in the time-shift "
+                             "buffer. {} MB per minute.".format(
+                                 BYTES_PER_SEC * 60 // 1000000))
+    args = parser.parse_args()
+
+    radio = TimeShiftRadio(args.minutes)
+
+    while True:
+        uri = create_menu_1()
+        if uri == "0":
+            radio.close()
+            sys.exit("\n bye...")
+        else:
+            radio.play(uri)
+
+
+if __name__ == "__main__":
+
+    main()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+#
+# spoken_clock.py
+#
+# Speak the time or the date from pre-rendered clips, with no network.
+#
+# time_google_tts.py plays phrase/the_time_is.mp3 and then asks Google to
+# speak "3 45 PM", every time. That takes a round trip and fails without a
+# network. Here a small vocabulary is rendered once: the numbers 0 to 59,
+# "oh", "o'clock", AM and PM, the days, the months, the ordinals 1st to
+# 31st and a few phrases. Each clip is synthesized into raw PCM, as in
+# tts_stream.py, with espeak, or with Google if --engine google is given.
+#
+# Before it is saved the silence at each end of a clip is trimmed to
+# PAD_MS, and its gain is set so that its RMS level is TARGET_DBFS. The
+# trim and gain of each clip are kept in clips/<engine>-<voice>/index.json.
+# So the words join evenly, with GAP_MS between them.
+#
+# On start the clips are read into memory. A time or a date is a list of
+# clip names, joined into one buffer and pushed into one appsrc playback
+# pipeline. Composing takes well under a millisecond.
+#
+# $ python3 spoken_clock.py time
+# $ python3 spoken_clock.py date --at "2026-12-25 09:05"
+# $ python3 spoken_clock.py --render --engine google time
+#
+import sys, os
+import math
+import json
+import time
+import array
+import argparse
+import datetime
+import concurrent.futures
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+import tts_stream
+
+CLIPS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clips")
+RATE = tts_stream.RATE
+PAD_MS = 15       # Silence kept at each end of a clip.
+GAP_MS = 60       # Silence between clips.
+SILENCE = 300     # Sample level below which the ends are trimmed.
+TARGET_DBFS = -18.0
+MAX_GAIN_DB = 12.0
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday",
+        "Sunday"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July",
+          "August", "September", "October", "November", "December"]
+
+
+def ordinal(number):
+    if 10 <= number % 100 <= 20:
+        return "{}th".format(number)
+    return "{}{}".format(number, {1: "st", 2: "nd", 3: "rd"}.get(
+            number % 10, "th"))
+
+
+def vocabulary():
+    'Dictionary of clip name to the text spoken.'
+    clips = {"the_time_is": "The time is", "today_is": "Today is",
+             "the": "the", "of": "of", "oh": "oh", "oclock": "o'clock",
+             "am": "A M", "pm": "P M", "two_thousand": "two thousand"}
+    for number in range(60):
+        clips[str(number)] = str(number)
+    for number in range(1, 32):
+        clips[ordinal(number)] = ordinal(number)
+    for name in DAYS + MONTHS:
+        clips[name.lower()] = name
+    return clips
+
+
+def time_words(when):
+    'Clip names of the time, e.g. the time is 3 oh 5 P M.'
+    hour = when.hour % 12 or 12
+    words = ["the_time_is", str(hour)]
+    if when.minute == 0:
+        words.append("oclock")
+    elif when.minute < 10:
+        words += ["oh", str(when.minute)]
+    else:
+        words.append(str(when.minute))
+    words.append("am" if when.hour < 12 else "pm")
+    return words
+
+
+def year_words(year):
+    'Clip names of a year from 2000 to 2099.'
+    century, rest = divmod(year, 100)
+    if rest < 10:
+        return ["two_thousand"] + ([str(rest)] if rest else [])
+    return [str(century), str(rest)]
+
+
+def date_words(when):
+    'Clip names of the date, e.g. today is Monday the 19th of October 2026.'
+    return (["today_is", DAYS[when.weekday()].lower(), "the",
+             ordinal(when.day), "of", MONTHS[when.month - 1].lower()]
+            + year_words(when.year))
+
+
+def trim_and_level(pcm):
+    'Trim the ends of 16 bit PCM, and scale it to TARGET_DBFS RMS.'
+    samples = array.array("h", pcm)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    loud = [index for index, sample in enumerate(samples)
+            if abs(sample) > SILENCE]
+    pad = RATE * PAD_MS // 1000
+    if loud:
+        start = max(0, loud[0] - pad)
+        end = min(len(samples), loud[-1] + pad)
+    else:
+        start, end = 0, len(samples)
+    samples = samples[start:end]
+
+    rms = math.sqrt(sum(sample * sample for sample in samples)
+                    / max(1, len(samples)))
+    rms_dbfs = 20 * math.log10(max(rms, 1) / 32768)
+    gain_db = min(TARGET_DBFS - rms_dbfs, MAX_GAIN_DB)
+    gain = 10 ** (gain_db / 20)
+    samples = array.array("h", (max(-32768, min(32767, int(sample * gain)))
+                                for sample in samples))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes(), {"trim_start": start, "trim_end": end,
+                               "rms_dbfs": round(rms_dbfs, 1),
+                               "gain_db": round(gain_db, 1)}
+
+
+def render_clips(directory, engine="espeak", voice=tts_stream.VOICE,
+                 language=tts_stream.LANGUAGE, workers=4):
+    'Synthesize, trim and level every clip into directory, with an index.'
+    os.makedirs(directory, exist_ok=True)
+    clips = vocabulary()
+    index = {"engine": engine, "voice": voice, "language": language,
+             "rate": RATE, "clips": {}}
+
+    def render(name):
+        pcm = tts_stream.synthesize(clips[name], engine, voice, language)
+        pcm, info = trim_and_level(pcm)
+        with open(os.path.join(directory, name + ".pcm"), "wb") as f:
+            f.write(pcm)
+        info.update({"text": clips[name], "bytes": len(pcm)})
+        return name, info
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        for name, info in pool.map(render, sorted(clips)):
+            index["clips"][name] = info
+    with open(os.path.join(directory, "index.json"), "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    return index
+
+
+class SpokenClock(object):
+    'The clips in memory, joined into times and dates.'
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, "index.json")) as f:
+            self.index = json.load(f)
+        self.clips = {}
+        for name in self.index["clips"]:
+            with open(os.path.join(directory, name + ".pcm"), "rb") as f:
+                self.clips[name] = f.read()
+        self.gap = bytes(2 * (RATE * GAP_MS // 1000))
+
+    def compose(self, words):
+        'The PCM of the clips, with a gap between each.'
+        return self.gap.join(self.clips[word] for word in words)
+
+    def speak(self, words, player=None):
+        'Play the words. Return the milli-secs taken to compose them.'
+        start = time.perf_counter()
+        pcm = self.compose(words)
+        compose_ms = 1000 * (time.perf_counter() - start)
+        own_player = player is None
+        if own_player:
+            player = tts_stream.Player()
+        player.play(pcm)
+        if own_player:
+            player.finish()
+        return compose_ms
+
+
+def clip_directory(engine, voice, language):
+    return os.path.join(CLIPS_DIR, "{}-{}".format(
+            engine, voice if engine == "espeak" else language))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Speak the time or date from pre-rendered clips.")
+    parser.add_argument("what", nargs="*",
+                        help='"time" or "date". The default is time.')
+    parser.add_argument("--at", help='Speak this time, "YYYY-MM-DD HH:MM".')
+    parser.add_argument("--engine", default="espeak",
+                        choices=("espeak", "google"))
+    parser.add_argument("--voice", default=tts_stream.VOICE)
+    parser.add_argument("--language", default=tts_stream.LANGUAGE)
+    parser.add_argument("--render", action="store_true",
+                        help="Render the clips again.")
+    args = parser.parse_args()
+    for what in args.what:
+        if what not in ("time", "date"):
+            parser.error('invalid choice: {} (choose "time" or "date")'
+                         .format(what))
+    if not args.what:
+        args.what = ["time"]
+
+    when = datetime.datetime.now()
+    if args.at:
+        when = datetime.datetime.strptime(args.at, "%Y-%m-%d %H:%M")
+        # The clips only speak the years 2000 to 2099.
+        if not 2000 <= when.year <= 2099:
+            parser.error("--at: the year must be from 2000 to 2099")
+
+    Gst.init(None)
+    directory = clip_directory(args.engine, args.voice, args.language)
+    if args.render or not os.path.isfile(
+            os.path.join(directory, "index.json")):
+        start = time.perf_counter()
+        index = render_clips(directory, args.engine, args.voice,
+                             args.language)
+        print("Rendered {} clips in {:.1f} secs".format(
+                len(index["clips"]), time.perf_counter() - start))
+
+    clock = SpokenClock(directory)
+    player = tts_stream.Player()
+    for what in args.what:
+        words = time_words(when) if what == "time" else date_words(when)
+        compose_ms = clock.speak(words, player)
+        print("{}: {} ({:.3f} ms to compose)".format(
+                what, " ".join(words), compose_ms))
+    player.finish()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+#
+# station_catalogue.py
+#
+# The internet radio station catalogue used by radio.py, radio_efficient.py
+# and radio_gui.py.
+#
+# Stations are kept in one external file, stations.json. Each entry has a
+# name, url, codec and country. Edit this file to add or remove stations.
+#
+# The JSON file is only read when it changes. It is then compiled into a
+# SQLite database, stations.db, with indexes on name, codec and country.
+# After that the programs open the database and only fetch the rows that
+# they display, so start-up time does not grow with the size of the
+# catalogue. Nothing is opened until the first query is made.
+#
+# Station numbers are the position in stations.json, starting at 1. Thus
+# "radio_gui.py --station 3" keeps selecting the same station.
+#
+# Prefix search of station names can be tried from the command line. E.g.
+# $ python3 station_catalogue.py bbc
+# $ python3 station_catalogue.py --codec aac --country NZ
+#
+import sys, os
+import json
+import sqlite3
+import argparse
+import collections
+
+CATALOGUE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "stations.json")
+
+# Tuple returned for each station. name and url are first so that the
+# station[0] and station[1] indexing of the old station_list still works.
+Station = collections.namedtuple("Station",
+                                 "name url codec country number")
+
+
+class StationCatalogue(object):
+    'Lazily loaded station catalogue with indexed prefix search.'
+
+    def __init__(self, json_file=CATALOGUE_FILE, db_file=None):
+        self.json_file = json_file
+        if db_file is None:
+            db_file = os.path.splitext(json_file)[0] + ".db"
+        self.db_file = db_file
+        self._db = None
+
+    def _connect(self):
+        'Open the database on first use. Rebuild it if the JSON is newer.'
+        if self._db is not None:
+            return self._db
+
+        if (not os.path.isfile(self.db_file) or
+                os.path.getmtime(self.db_file)
+                < os.path.getmtime(self.json_file)):
+            self._build()
+
+        self._db = sqlite3.connect(self.db_file)
+        # Let LIKE 'abc%' use the NOCASE index on name.
+        self._db.execute("PRAGMA case_sensitive_like = OFF")
+        return self._db
+
+    def _build(self):
+        'Compile stations.json into the indexed SQLite database.'
+        with open(self.json_file, encoding="utf-8") as f:
+            stations = json.load(f)
+
+        # Build into a temporary file and then rename, so a program that is
+        # starting at the same time never sees a half written database.
+        tmp_file = self.db_file + ".tmp"
+        if os.path.isfile(tmp_file):
+            os.remove(tmp_file)
+
+        db = sqlite3.connect(tmp_file)
+        db.execute("""
+            CREATE TABLE stations (
+                number INTEGER PRIMARY KEY,
+                name TEXT NOT NULL COLLATE NOCASE,
+                url TEXT NOT NULL,
+                codec TEXT COLLATE NOCASE,
+                country TEXT COLLATE NOCASE
+            )""")
+        db.executemany(
+                "INSERT INTO stations VALUES (?, ?, ?, ?, ?)",
+                ((index + 1, item["name"], item["url"],
+                  item.get("codec", ""), item.get("country", ""))
+                 for index, item in enumerate(stations)))
+        db.execute("CREATE INDEX stations_name ON stations (name)")
+        db.execute("CREATE INDEX stations_codec ON stations (codec, name)")
+        db.execute("CREATE INDEX stations_country ON stations (country, name)")
+        db.commit()
+        db.close()
+
+        os.replace(tmp_file, self.db_file)
+
+    def _where(self, prefix, codec, country):
+        'Build the WHERE clause and its parameters.'
+        clauses = []
+        params = []
+        if prefix:
+            # Escape the LIKE wildcards so they match literally.
+            escaped = (prefix.replace("\\", "\\\\")
+                       .replace("%", "\\%").replace("_", "\\_"))
+            clauses.append("name LIKE ? ESCAPE '\\'")
+            params.append(escaped + "%")
+        if codec:
+            clauses.append("codec = ?")
+            params.append(codec)
+        if country:
+            clauses.append("country = ?")
+            params.append(country)
+        if not clauses:
+            return "", params
+        return " WHERE " + " AND ".join(clauses), params
+
+    def search(self, prefix="", codec=None, country=None, limit=None,
+               offset=0):
+        """
+        Return a list of Station tuples whose name starts with prefix.
+        Optionally restrict by codec and/or country.
+        With no prefix the stations are in catalogue order, otherwise they
+        are in name order.
+        Use limit and offset to fetch one page at a time.
+        """
+        where, params = self._where(prefix, codec, country)
+        order = " ORDER BY name" if prefix else " ORDER BY number"
+        sql = ("SELECT name, url, codec, country, number FROM stations"
+               + where + order)
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        cursor = self._connect().execute(sql, params)
+        return [Station(*row) for row in cursor]
+
+    def count(self, prefix="", codec=None, country=None):
+        'Return the number of stations that search() would return.'
+        where, params = self._where(prefix, codec, country)
+        cursor = self._connect().execute(
+                "SELECT COUNT(*) FROM stations" + where, params)
+        return cursor.fetchone()[0]
+
+    def get(self, number):
+        'Return the Station with the given number, or None.'
+        cursor = self._connect().execute(
+                "SELECT name, url, codec, country, number FROM stations "
+                "WHERE number = ?", (number,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return Station(*row)
+
+    def get_by_url(self, url):
+        'Return the first Station with the given url, or None.'
+        cursor = self._connect().execute(
+                "SELECT name, url, codec, country, number FROM stations "
+                "WHERE url = ? ORDER BY number LIMIT 1", (url,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return Station(*row)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Search the radio station catalogue.")
+    parser.add_argument("prefix", nargs="?", default="",
+                        help="Start of the station name.")
+    parser.add_argument("--codec", help="E.g. mp3 or aac")
+    parser.add_argument("--country", help="E.g. NZ, AU or GB")
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    catalogue = StationCatalogue()
+    for station in catalogue.search(args.prefix, args.codec, args.country,
+                                    args.limit):
+        print("{:>5}. {} [{} {}]\n       {}".format(
+                station.number, station.name, station.codec,
+                station.country, station.url))
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+#
+# tts_limiter.py
+#
+# A client side rate limiter for the Google translate_tts endpoint.
+#
+# Prefetching many phrases at once gets throttled. souphttpsrc then posts an
+# error, and the programs give up. The text of the error only has the
+# GstResourceError code, so error_text() adds the HTTP status, such as 429
+# or 503, from the "http-status-code" detail of the message. The programs
+# raise a RuntimeError of that text. Limiter.call() runs each request
+# through:
+#
+#   A token bucket, which spaces the requests at the current rate.
+#   An AIMD limit on the requests in flight at once.
+#
+# A 429 or 5xx, or a response slower than SLOW_SECS, halves both the rate
+# and the limit, at most once per COOLDOWN_SECS. Each success raises the
+# rate by RATE_STEP and the limit by 1/limit, so about one per limit of
+# requests. A throttled request is not failed. It waits, with exponential
+# back-off, and is queued again, up to RETRIES times.
+#
+# stats() gives the successful requests/sec over the last WINDOW_SECS, the
+# rejection rate, and the current rate, limit, requests in flight and
+# requests waiting. It is used by phrase_creator.py --file and by
+# tts_stream.py with --engine google.
+#
+# --test prefetches phrases from a local stand-in for Google that allows
+# only --capacity requests/sec and returns 503 for the rest:
+# $ python3 tts_limiter.py --test --phrases 60 --capacity 5
+# $ python3 tts_limiter.py --test --no-limit
+#
+import sys, os
+import re
+import time
+import json
+import random
+import argparse
+import functools
+import threading
+import collections
+
+RATE = 5.0           # Requests/sec to start at.
+MIN_RATE = 0.5
+MAX_RATE = 20.0
+RATE_STEP = 0.2      # Requests/sec added by each success.
+CONCURRENCY = 2      # Requests in flight to start at.
+MAX_CONCURRENCY = 8
+SLOW_SECS = 3.0
+COOLDOWN_SECS = 1.0
+BACKOFF_SECS = 0.5
+MAX_BACKOFF_SECS = 30.0
+RETRIES = 10
+WINDOW_SECS = 10.0
+
+# The HTTP status that error_text() adds, e.g. "(HTTP 429)".
+THROTTLED = re.compile(r"\(HTTP (429|5\d\d)\)")
+
+
+def http_status(message):
+    'The HTTP status of a souphttpsrc ERROR message, or None.'
+    details = message.parse_error_details()
+    if details is None or not details.has_field("http-status-code"):
+        return None
+    return details.get_value("http-status-code")
+
+
+def error_text(message):
+    'The text of an ERROR message, with the HTTP status if there is one.'
+    err, debug = message.parse_error()
+    status = http_status(message)
+    if status is None:
+        return str(err)
+    return "{} (HTTP {})".format(err, status)
+
+
+def throttled(error):
+    'True if the error is the endpoint asking us to slow down.'
+    return THROTTLED.search(str(error)) is not None
+
+
+class TokenBucket(object):
+    'Tokens added at rate per second, up to burst. Not thread safe.'
+
+    def __init__(self, rate, burst=1.0):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        'Take a token and return True, or return False if there is none.'
+        self.refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_secs(self):
+        'Seconds until the next token.'
+        self.refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class Limiter(object):
+    'Token bucket and AIMD concurrency limit in front of a request.'
+
+    def __init__(self, rate=RATE, concurrency=CONCURRENCY, max_rate=MAX_RATE,
+                 max_concurrency=MAX_CONCURRENCY, slow_secs=SLOW_SECS,
+                 retries=RETRIES):
+        self.condition = threading.Condition()
+        self.bucket = TokenBucket(rate)
+        self.limit = float(concurrency)
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.slow_secs = slow_secs
+        self.retries = retries
+        self.in_flight = 0
+        self.waiting = 0
+        self.decreased = 0
+        self.started = time.monotonic()
+        self.successes = collections.deque()  # Times, for requests/sec.
+        self.counts = collections.Counter()
+
+    def acquire(self):
+        'Wait for a token, and for room under the limit.'
+        with self.condition:
+            self.waiting += 1
+            while self.in_flight >= int(self.limit) or \
+                    not self.bucket.take():
+                if self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    self.condition.wait(self.bucket.wait_secs())
+            self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self, outcome, secs):
+        'outcome is "ok", "throttled" or "failed". Adjust the rate and limit.'
+        with self.condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            self.counts[outcome] += 1
+            if outcome == "ok" and secs <= self.slow_secs:
+                self.successes.append(now)
+                self.limit = min(self.max_concurrency,
+                                 self.limit + 1 / self.limit)
+                self.bucket.rate = min(self.max_rate,
+                                       self.bucket.rate + RATE_STEP)
+            elif outcome != "failed":
+                if outcome == "ok":
+                    self.successes.append(now)
+                    self.counts["slow"] += 1
+                if now - self.decreased > COOLDOWN_SECS:
+                    self.decreased = now
+                    self.limit = max(1.0, self.limit / 2)
+                    self.bucket.rate = max(MIN_RATE, self.bucket.rate / 2)
+            self.condition.notify_all()
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call function when the limiter allows. If it raises a throttling
+        RuntimeError, back off and queue it again. Other errors are raised.
+        """
+        backoff = BACKOFF_SECS
+        for attempt in range(self.retries + 1):
+            self.acquire()
+            start = time.monotonic()
+            try:
+                result = function(*args, **kwargs)
+            except RuntimeError as error:
+                if not throttled(error):
+                    self.release("failed", time.monotonic() - start)
+                    raise
+                self.release("throttled", time.monotonic() - start)
+                time.sleep(backoff * random.uniform(0.5, 1.5))
+                backoff = min(MAX_BACKOFF_SECS, 2 * backoff)
+                continue
+            self.release("ok", time.monotonic() - start)
+            return result
+        raise RuntimeError("Still throttled after {} retries".format(
+                self.retries))
+
+    def wrap(self, function):
+        'function, called through the limiter.'
+        return functools.partial(self.call, function)
+
+    def stats(self):
+        with self.condition:
+            now = time.monotonic()
+            while self.successes and now - self.successes[0] > WINDOW_SECS:
+                self.successes.popleft()
+            window = min(WINDOW_SECS, now - self.started) or 1
+            attempts = self.counts["ok"] + self.counts["throttled"]
+            return {"requests_per_sec": round(len(self.successes) / window,
+                                              2),
+                    "rejection_rate": round(self.counts["throttled"]
+                                            / attempts, 3) if attempts else 0,
+                    "rate": round(self.bucket.rate, 2),
+                    "limit": round(self.limit, 2),
+                    "in_flight": self.in_flight,
+                    "waiting": self.waiting,
+                    "counts": dict(self.counts)}
+
+
+def throttling_server(port, capacity, mp3_file="hello.mp3"):
+    """
+    A stand-in for Google on port that returns mp3_file, but only for
+    capacity requests/sec. The rest get a 503.
+    """
+    from fanout import FanoutServer
+
+    with open(mp3_file, "rb") as f:
+        mp3 = f.read()
+    bucket = TokenBucket(capacity, burst=capacity)
+    lock = threading.Lock()
+
+    def handler():
+        with lock:
+            allowed = bucket.take()
+        if not allowed:
+            raise RuntimeError("Throttled")
+        return "audio/mpeg", mp3
+
+    server = FanoutServer(port=port)
+    server.add_handler("/translate_tts", handler)
+    server.start()
+    return server
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Test the limiter against a throttling stand-in.")
+    parser.add_argument("--test", action="store_true")
+    parser.add_argument("--phrases", type=int, default=60)
+    parser.add_argument("--capacity", type=float, default=5,
+                        help="Requests/sec the stand-in allows.")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--port", type=int, default=8092)
+    parser.add_argument("--no-limit", dest="limit", action="store_false",
+                        help="Send the requests without the limiter.")
+    args = parser.parse_args()
+
+    if not args.test:
+        parser.print_help()
+        sys.exit()
+
+    import phrase_creator
+
+    server = throttling_server(args.port, args.capacity)
+    uri_string = ("http://127.0.0.1:{}/translate_tts?"
+                  "ie=UTF-8&client=tw-ob&tl={{}}&q={{}}".format(args.port))
+    phrases = ["Prefetched phrase number {}".format(number + 1)
+               for number in range(args.phrases)]
+    limiter = Limiter() if args.limit else None
+    start = time.monotonic()
+    try:
+        saved, errors = phrase_creator.prefetch(
+                phrases, limiter, args.workers, uri_string,
+                directory="phrase_benchmark")
+    finally:
+        server.stop()
+    elapsed = time.monotonic() - start
+
+    print("{} saved, {} failed, in {:.1f} secs, {:.2f} phrases/sec".format(
+            len(saved), len(errors), elapsed, len(saved) / elapsed))
+    if limiter is not None:
+        print(json.dumps(limiter.stats(), indent=2))
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+#
+# tts_stream.py
+#
+# Speak a long text a sentence at a time, starting as soon as the first
+# sentence is ready.
+#
+# speak() in espeak.py and speak_google() in espeak_google.py synthesize the
+# whole message as one. A long paragraph does not start until Google has
+# returned all of it, and Google rejects a q= of more than about 200
+# characters. Here the text is split into sentences, and long sentences at
+# clauses or words, each under SEGMENT_LIMIT characters. Up to --workers
+# segments are synthesized at once, each into raw PCM by a pipeline ending
+# in an appsink with sync=false, so faster than realtime. The segments are
+# pushed, in order, into one playback pipeline as each becomes ready:
+#
+#   appsrc ! rawaudioparse ! audioconvert ! autoaudiosink sync=false
+#
+# The time to the first audio and the total time are printed. --compare
+# also speaks the text the single-shot way, for comparison. Google requests
+# go through the rate limiter of tts_limiter.py.
+#
+# $ python3 tts_stream.py --engine espeak --compare "A long text. ..."
+# $ python3 tts_stream.py --engine google --file article.txt
+#
+import sys, os
+import re
+import time
+import argparse
+import urllib.parse
+import concurrent.futures
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import Gst
+
+import tts_limiter
+
+SEGMENT_LIMIT = 200  # characters, the limit of the Google endpoint.
+WORKERS = 3
+VOICE = "en-gb"
+LANGUAGE = "en-au"
+RATE = 22050
+# Raw audio of each segment, and of the playback pipeline.
+PCM_CAPS = "audio/x-raw,format=S16LE,rate={},channels=1,layout=interleaved" \
+           .format(RATE)
+GOOGLE_TTS = ("https://translate.google.com/translate_tts?"
+              "ie=UTF-8&client=tw-ob&tl={}&q={}")
+
+MESSAGE = ("This is a long message, spoken a sentence at a time. The first "
+           "sentence starts playing while the later sentences are still "
+           "being synthesized. Each one is played in order as soon as it is "
+           "ready. So a long paragraph starts almost straight away, rather "
+           "than after all of it has been synthesized or downloaded.")
+
+
+def segment_text(text, limit=SEGMENT_LIMIT):
+    """
+    Split text into sentences. Split any longer than limit at clauses, and
+    then at words.
+    """
+    segments = []
+    for sentence in re.split(r"(?<=[.!?])\s+", " ".join(text.split())):
+        if not sentence:
+            continue
+        if len(sentence) <= limit:
+            segments.append(sentence)
+            continue
+        current = ""
+        for part in re.split(r"(?<=[,;:])\s+|\s+", sentence):
+            if current and len(current) + 1 + len(part) > limit:
+                segments.append(current)
+                current = part
+            else:
+                current = "{} {}".format(current, part) if current else part
+        if current:
+            segments.append(current)
+    return segments
+
+
+def source_description(segment, engine="espeak", voice=VOICE,
+                       language=LANGUAGE):
+    'The gst-launch text of the source of one segment, up to decoded audio.'
+    if engine == "google":
+        uri = GOOGLE_TTS.format(language, urllib.parse.quote(segment))
+        return 'souphttpsrc location="{}" ! decodebin'.format(uri)
+    return 'espeak text="{}" voice={}'.format(segment.replace('"', "'"),
+                                                voice)
+
+
+def synthesize(segment, engine="espeak", voice=VOICE, language=LANGUAGE):
+    'Synthesize one segment. Return its raw PCM bytes, as fast as possible.'
+    pipeline = Gst.parse_launch("""
+        {source}
+        ! audioconvert
+        ! audioresample
+        ! {caps}
+        ! appsink name=pcm sync=false
+        """.format(source=source_description(segment, engine, voice,
+                                             language),
+                   caps=PCM_CAPS))
+    appsink = pipeline.get_by_name("pcm")
+    bus = pipeline.get_bus()
+    pipeline.set_state(Gst.State.PLAYING)
+    chunks = []
+    try:
+        while not appsink.get_property("eos"):
+            sample = appsink.emit("try-pull-sample", Gst.SECOND // 10)
+            if sample is not None:
+                buffer = sample.get_buffer()
+                chunks.append(buffer.extract_dup(0, buffer.get_size()))
+                continue
+            # Nothing yet. Stop if the pipeline has failed.
+            message = bus.pop_filtered(Gst.MessageType.ERROR)
+            if message is not None:
+                raise RuntimeError("{}: {}".format(
+                        segment[:30], tts_limiter.error_text(message)))
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+    return b"".join(chunks)
+
+
+class Player(object):
+    'One playback pipeline, fed raw PCM in order. Times the first audio.'
+
+    def __init__(self):
+        self.pipeline = Gst.parse_launch("""
+            appsrc name=pcm format=bytes
+            ! rawaudioparse use-sink-caps=false format=pcm pcm-format=s16le
+                sample-rate={rate} num-channels=1
+            ! audioconvert
+            ! autoaudiosink name=output sync=false
+            """.format(rate=RATE))
+        self.appsrc = self.pipeline.get_by_name("pcm")
+        self.first_audio = None
+        self.start = time.perf_counter()
+        self.pipeline.get_by_name("output").get_static_pad("sink").add_probe(
+                Gst.PadProbeType.BUFFER, self.on_first_audio)
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def on_first_audio(self, pad, info):
+        self.first_audio = time.perf_counter() - self.start
+        return Gst.PadProbeReturn.REMOVE
+
+    def play(self, pcm):
+        self.appsrc.emit("push-buffer", Gst.Buffer.new_wrapped(pcm))
+
+    def finish(self):
+        'Wait for the audio to finish playing.'
+        self.appsrc.emit("end-of-stream")
+        self.pipeline.get_bus().timed_pop_filtered(
+                Gst.CLOCK_TIME_NONE,
+                Gst.MessageType.EOS | Gst.MessageType.ERROR)
+        self.pipeline.set_state(Gst.State.NULL)
+
+
+def speak_long(text, engine="espeak", workers=WORKERS, voice=VOICE,
+               language=LANGUAGE, limit=SEGMENT_LIMIT, synthesizer=synthesize):
+    """
+    Speak text a segment at a time, with up to workers segments synthesized
+    at once by synthesizer(segment, engine, voice, language). Return the
+    segment count, time to first audio and total secs.
+    """
+    segments = segment_text(text, limit)
+    player = Player()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(synthesizer, segment, engine, voice, language)
+                   for segment in segments]
+        for future in futures:
+            player.play(future.result())
+    player.finish()
+    return {"segments": len(segments),
+            "first_audio_secs": round(player.first_audio or 0, 3),
+            "total_secs": round(time.perf_counter() - player.start, 3)}
+
+
+def speak_single_shot(text, engine="espeak", voice=VOICE, language=LANGUAGE):
+    """
+    Speak text as one, as espeak.py and espeak_google.py do. Return the time
+    to first audio and total secs.
+    """
+    start = time.perf_counter()
+    pipeline = Gst.parse_launch("""
+        {source}
+        ! audioconvert
+        ! autoaudiosink name=output
+        """.format(source=source_description(text, engine, voice, language)))
+    first_audio = [None]
+
+    def on_first_audio(pad, info):
+        first_audio[0] = time.perf_counter() - start
+        return Gst.PadProbeReturn.REMOVE
+    pipeline.get_by_name("output").get_static_pad("sink").add_probe(
+            Gst.PadProbeType.BUFFER, on_first_audio)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    message = pipeline.get_bus().timed_pop_filtered(
+            Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS | Gst.MessageType.ERROR)
+    pipeline.set_state(Gst.State.NULL)
+    if message.type == Gst.MessageType.ERROR:
+        err, debug = message.parse_error()
+        raise RuntimeError(str(err))
+    return {"segments": 1,
+            "first_audio_secs": round(first_audio[0] or 0, 3),
+            "total_secs": round(time.perf_counter() - start, 3)}
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+            description="Speak a long text a sentence at a time.")
+    parser.add_argument("text", nargs="?", default=MESSAGE)
+    parser.add_argument("--file", help="Read the text from this file.")
+    parser.add_argument("--engine", default="espeak",
+                        choices=("espeak", "google"))
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="Segments synthesized at once.")
+    parser.add_argument("--voice", default=VOICE, help="espeak voice.")
+    parser.add_argument("--language", default=LANGUAGE,
+                        help="Google language.")
+    parser.add_argument("--requests-per-sec", type=float,
+                        default=tts_limiter.RATE,
+                        help="Starting rate of Google requests. Adapts to "
+                             "throttling.")
+    parser.add_argument("--compare", action="store_true",
+                        help="Also speak the text in one, and compare.")
+    args = parser.parse_args()
+
+    text = args.text
+    if args.file:
+        with open(args.file) as f:
+            text = f.read()
+
+    Gst.init(None)
+    synthesizer = synthesize
+    if args.engine == "google":
+        # Queue throttled segments and slow down, rather than fail.
+        limiter = tts_limiter.Limiter(args.requests_per_sec, args.workers)
+        synthesizer = limiter.wrap(synthesize)
+    result = speak_long(text, args.engine, args.workers, args.voice,
+                        args.language, synthesizer=synthesizer)
+    print("Streaming:   {segments} segments, first audio {first_audio_secs}"
+          " secs, total {total_secs} secs".format(**result))
+    if args.compare:
+        try:
+            result = speak_single_shot(text, args.engine, args.voice,
+                                       args.language)
+            print("Single shot: first audio {first_audio_secs} secs, "
+                  "total {total_secs} secs".format(**result))
+        except RuntimeError as error:
+            print("Single shot failed: {}".format(error))